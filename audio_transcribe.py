@@ -1,11 +1,16 @@
 import os
 import logging
-import tempfile
+import mimetypes
 from pathlib import Path
-from groq import Groq
 from dotenv import load_dotenv
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, ContextTypes, filters
+import llm_gateway
+import deadline
+from rate_limiter import RateLimitExceeded
+from circuit_breaker import CircuitOpenError
+from media_admission import MediaRejected, check_audio
+from media_buffer import MediaBuffer, download_media
 
 # Load environment variables
 load_dotenv()
@@ -17,10 +22,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Create temp directory for audio files
-TEMP_DIR = Path(tempfile.gettempdir()) / "audio_transcribe"
-TEMP_DIR.mkdir(exist_ok=True)
-
 # Supported audio formats
 SUPPORTED_FORMATS = {'.mp3', '.wav', '.m4a', '.ogg', '.oga', '.opus', '.mp4', '.mpeg', '.mpga', '.webm'}
 
@@ -32,22 +33,25 @@ def is_supported_format(file_name: str) -> bool:
     """Check if the file format is supported."""
     return get_file_extension(file_name) in SUPPORTED_FORMATS
 
-def transcribe_audio(filename, prompt=None):
-    # Initialize the Groq client
-    client = Groq()  # Make sure GROQ_API_KEY is set in your environment variables
-    
+async def transcribe_audio(audio, prompt=None, file_name=None):
+    """Translate an audio file or downloaded MediaBuffer to English text via the shared Groq gateway."""
     try:
-        # Open the audio file
-        with open(filename, "rb") as file:
-            # Create a translation of the audio file
-            translation = client.audio.translations.create(
-                file=(filename, file.read()),  # Required audio file
-                model="whisper-large-v3",  # Required model to use for translation
-                prompt=prompt or "Specify context or spelling",  # Optional
-                response_format="json",  # Optional
-                temperature=0.0  # Optional
+        if isinstance(audio, MediaBuffer):
+            # Read straight from the buffer; the name tells Whisper the format
+            audio_file = audio.open()
+        else:
+            file_name = file_name or audio
+            audio_file = open(audio, "rb")
+
+        # Create a translation of the audio file (uses GROQ_API_KEY from the environment)
+        with audio_file:
+            return await llm_gateway.translate_audio(
+                file=(file_name, audio_file),
+                model="whisper-large-v3",
+                prompt=prompt
             )
-            return translation.text
+    except (RateLimitExceeded, CircuitOpenError):
+        raise
     except Exception as e:
         logger.error(f"Error during transcription: {str(e)}")
         return None
@@ -117,34 +121,30 @@ async def handle_audio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             parse_mode='Markdown'
         )
 
-        # Get the audio file
+        # Check the file's metadata before downloading any of it
         if update.message.voice:
-            file = await update.message.voice.get_file()
-            file_name = f"voice_{update.message.from_user.id}.ogg"
+            media = update.message.voice
+            file_name = "voice.ogg"
         elif update.message.audio:
-            file = await update.message.audio.get_file()
-            file_name = update.message.audio.file_name
-            if not is_supported_format(file_name):
-                await processing_msg.edit_text(
-                    f"❌ Sorry, the format {get_file_extension(file_name)} is not supported.\n"
-                    "Use /formats to see supported formats."
-                )
-                return
+            media = update.message.audio
+            file_name = media.file_name or f"audio{mimetypes.guess_extension(media.mime_type or '') or '.mp3'}"
         else:
             await processing_msg.edit_text("❌ Please send a voice message or audio file.")
             return
+        try:
+            check_audio(media, media.file_name if update.message.audio else None, SUPPORTED_FORMATS)
+        except MediaRejected as e:
+            await processing_msg.edit_text(str(e))
+            return
 
-        # Create unique file path
-        file_path = TEMP_DIR / f"{update.message.from_user.id}_{file_name}"
-        
-        # Download the file
-        await file.download_to_drive(str(file_path))
-        
-        # Update processing message
-        await processing_msg.edit_text("🔄 Processing your audio... Please wait.")
+        # Download into memory; only large files spill to a uniquely named temp file
+        file = await deadline.bounded(media.get_file())
+        with await deadline.bounded(download_media(file, media.file_size, get_file_extension(file_name))) as buffer:
+            # Update processing message
+            await processing_msg.edit_text("🔄 Processing your audio... Please wait.")
 
-        # Transcribe the audio
-        transcription = transcribe_audio(str(file_path))
+            # Transcribe the audio
+            transcription = await transcribe_audio(buffer, file_name=file_name)
 
         if transcription:
             # Split long messages if needed (Telegram has a 4096 character limit)
@@ -164,10 +164,8 @@ async def handle_audio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
                 "❌ Sorry, I couldn't transcribe the audio. Please try again."
             )
 
-        # Clean up the temporary file
-        if file_path.exists():
-            file_path.unlink()
-
+    except (RateLimitExceeded, CircuitOpenError) as e:
+        await update.message.reply_text(str(e))
     except Exception as e:
         logger.error(f"Error handling audio: {str(e)}")
         await update.message.reply_text(
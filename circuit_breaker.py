@@ -0,0 +1,211 @@
+"""Circuit breakers per upstream provider and model.
+
+During an outage every call would otherwise wait out a full failing request,
+holding a connection-pool slot and the user's patience. A breaker watches the
+failure rate over a rolling window; once it trips, calls fail fast with a
+friendly message, and after a cool-off a few probe calls are let through to
+see whether the provider has recovered.
+
+    closed --(failure rate over threshold)--> open
+    open --(cool-off elapsed)--> half-open
+    half-open --(probes succeed)--> closed
+    half-open --(a probe fails)--> open (with a longer cool-off)
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from rate_limiter import RateLimitExceeded
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+# Breaker settings (overridable from .env)
+BREAKER_WINDOW = float(os.getenv('BREAKER_WINDOW', '60'))  # seconds of history considered
+BREAKER_MIN_CALLS = int(os.getenv('BREAKER_MIN_CALLS', '5'))  # calls needed before tripping
+BREAKER_FAILURE_RATE = float(os.getenv('BREAKER_FAILURE_RATE', '0.5'))
+BREAKER_OPEN_SECONDS = float(os.getenv('BREAKER_OPEN_SECONDS', '30'))
+BREAKER_MAX_OPEN_SECONDS = 300.0
+HALF_OPEN_PROBES = 2  # successful probes needed to close again
+
+PROVIDER_NAMES = {
+    "groq": "Groq",
+    "together": "Together AI",
+    "gemini": "Gemini",
+}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose breaker is open."""
+
+    def __init__(self, provider: str, model: str, retry_after: float):
+        self.provider = provider
+        self.model = model
+        self.retry_after = retry_after
+        super().__init__(
+            f"🔌 {PROVIDER_NAMES.get(provider, provider)} is having problems right now. "
+            f"Please try again in {max(1, int(retry_after + 0.999))}s."
+        )
+
+
+def is_provider_failure(error: BaseException) -> bool:
+    """
+    Decide whether an error raised during an upstream call says something about the provider's health.
+
+    Running out of deadline *during* the call counts: the provider was too slow.
+    """
+    if isinstance(error, (RateLimitExceeded, CircuitOpenError, asyncio.CancelledError, GeneratorExit)):
+        return False
+    # 4xx responses other than timeouts are our fault, not an outage
+    status = getattr(error, 'status_code', None)
+    if isinstance(status, int) and 400 <= status < 500 and status != 408:
+        return False
+    return True
+
+
+class CircuitBreaker:
+    """Three-state breaker over a rolling window of call outcomes."""
+
+    def __init__(self, provider: str, model: str, on_change: Optional[Callable] = None):
+        self.provider = provider
+        self.model = model
+        self.state = CLOSED
+        self._on_change = on_change
+        self._outcomes: deque = deque()  # (timestamp, ok)
+        self._opened_at = 0.0
+        self._open_seconds = BREAKER_OPEN_SECONDS
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+    def _set_state(self, state: str):
+        old, self.state = self.state, state
+        if old != state:
+            logger.warning(f"Circuit {self.provider}/{self.model}: {old} -> {state}")
+            if self._on_change:
+                try:
+                    self._on_change(self, old, state)
+                except Exception as e:
+                    logger.error(f"Circuit state listener failed: {str(e)}")
+
+    def _retry_after(self) -> float:
+        return max(0.0, self._opened_at + self._open_seconds - time.monotonic())
+
+    def allows(self) -> bool:
+        """Check whether a call would currently be let through."""
+        if self.state == OPEN and self._retry_after() <= 0:
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+            self._set_state(HALF_OPEN)
+        if self.state == OPEN:
+            return False
+        if self.state == HALF_OPEN:
+            return self._probes_in_flight < HALF_OPEN_PROBES - self._probe_successes
+        return True
+
+    def check(self):
+        """
+        Fail fast if the breaker won't let calls through.
+
+        Raises:
+            CircuitOpenError: While the breaker is open or its probes are in flight
+        """
+        if not self.allows():
+            raise CircuitOpenError(self.provider, self.model, self._retry_after() or 1.0)
+
+    @contextmanager
+    def guard(self):
+        """
+        Wrap one upstream call and record its outcome.
+
+        Raises:
+            CircuitOpenError: Instead of running the call while the breaker is open
+        """
+        self.check()
+        probe = self.state == HALF_OPEN
+        if probe:
+            self._probes_in_flight += 1
+        try:
+            yield
+        except BaseException as e:
+            self._record(probe, None if not is_provider_failure(e) else False)
+            raise
+        self._record(probe, True)
+
+    def record_failure(self):
+        """Count a failure observed outside ``guard``, e.g. a caller's timeout cancelling the call."""
+        self._record(False, False)
+
+    def _record(self, probe: bool, ok: Optional[bool]):
+        """Update the state with one outcome; ``ok=None`` means it says nothing about health."""
+        if probe:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+        if ok is None:
+            return
+
+        if self.state == HALF_OPEN:
+            if not ok:
+                # Still broken: back off harder before the next probe
+                self._open_seconds = min(self._open_seconds * 2, BREAKER_MAX_OPEN_SECONDS)
+                self._trip()
+            elif probe:
+                self._probe_successes += 1
+                if self._probe_successes >= HALF_OPEN_PROBES:
+                    self._outcomes.clear()
+                    self._open_seconds = BREAKER_OPEN_SECONDS
+                    self._set_state(CLOSED)
+            return
+        if self.state == OPEN:
+            return  # a straggler from before the breaker tripped
+
+        now = time.monotonic()
+        self._outcomes.append((now, ok))
+        while self._outcomes and self._outcomes[0][0] < now - BREAKER_WINDOW:
+            self._outcomes.popleft()
+
+        if len(self._outcomes) >= BREAKER_MIN_CALLS:
+            failures = sum(1 for _, success in self._outcomes if not success)
+            if failures / len(self._outcomes) >= BREAKER_FAILURE_RATE:
+                self._trip()
+
+    def _trip(self):
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self._set_state(OPEN)
+
+
+class CircuitBreakerRegistry:
+    """One breaker per (provider, model), with state-change listeners."""
+
+    def __init__(self):
+        self._breakers: dict = {}
+        self._listeners: list = []
+
+    def get(self, provider: str, model: str) -> CircuitBreaker:
+        breaker = self._breakers.get((provider, model))
+        if breaker is None:
+            breaker = CircuitBreaker(provider, model, on_change=self._notify)
+            self._breakers[(provider, model)] = breaker
+        return breaker
+
+    def add_listener(self, listener: Callable[[CircuitBreaker, str, str], None]):
+        """Call ``listener(breaker, old_state, new_state)`` on every transition."""
+        self._listeners.append(listener)
+
+    def _notify(self, breaker: CircuitBreaker, old: str, new: str):
+        for listener in self._listeners:
+            listener(breaker, old, new)
+
+    def stats(self) -> dict:
+        """State of every breaker that has seen traffic."""
+        return {f"{provider}/{model}": breaker.state for (provider, model), breaker in self._breakers.items()}
+
+
+# Shared breakers for all upstream calls
+circuit_breakers = CircuitBreakerRegistry()
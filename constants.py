@@ -3,6 +3,10 @@
 # File and Directory Settings
 MEDIA_FOLDER = 'medias'
 MAX_VIDEO_SIZE = 50 * 1024 * 1024  # 50MB
+MAX_VIDEO_DURATION = 30 * 60  # seconds
+MAX_AUDIO_SIZE = 20 * 1024 * 1024  # 20MB
+MAX_AUDIO_DURATION = 2 * 60 * 60  # seconds
+MAX_PHOTO_SIZE = 10 * 1024 * 1024  # 10MB
 
 # Command Categories 📱
 COMMAND_CATEGORIES = {
@@ -50,7 +54,7 @@ For more information about each command, just try using it!
 ERROR_MESSAGES = {
     "video_too_large": (
         "❌ Video file is too large!\n\n"
-        "Due to Telegram's limitations, I can only process videos up to 50MB.\n"
+        "Due to Telegram's limitations, I can only process videos up to {max_mb}MB.\n"
         "Please try:\n"
         "• Compressing the video\n"
         "• Trimming it to a shorter length\n"
@@ -60,10 +64,32 @@ ERROR_MESSAGES = {
     "invalid_video": (
         "Please send a valid video file (MP4, MOV, AVI, etc.)\n\n"
         "📝 Requirements:\n"
-        "• Maximum file size: 50MB\n"
+        "• Maximum file size: {max_mb}MB\n"
         "• Supported formats: MP4, MOV, AVI\n"
         "• Recommended length: 1-3 minutes"
     ),
+    "video_too_long": (
+        "❌ Video is too long!\n\n"
+        "I can analyze videos up to {max_minutes} minutes. Please send a shorter clip."
+    ),
+    "video_resolution_too_high": (
+        "❌ Video resolution is too high!\n\n"
+        "I can analyze videos up to {max_side} pixels on the longest side. "
+        "Please send a lower-resolution version."
+    ),
+    "audio_too_large": (
+        "❌ Audio file is too large!\n\n"
+        "I can transcribe audio up to {max_mb}MB and {max_minutes} minutes.\n"
+        "Please send a shorter or more compressed recording."
+    ),
+    "unsupported_audio": (
+        "❌ Sorry, the format {format} is not supported.\n"
+        "Use /formats to see supported formats."
+    ),
+    "photo_too_large": (
+        "❌ Image is too large!\n\n"
+        "I can analyze images up to {max_mb}MB. Please send it as a compressed photo."
+    ),
     "processing_error": (
         "❌ Error processing video content. This could be because:\n"
         "• The video is too long\n"
@@ -0,0 +1,182 @@
+"""Token-budgeted conversation window for chat sessions.
+
+Builds the prompt sent to the model from a user's conversation history:
+the last few turns are kept verbatim and everything older is folded into a
+rolling summary computed in the background, so prompt size stays flat no
+matter how long a user chats.
+"""
+import os
+import re
+import asyncio
+import logging
+from typing import Optional
+
+import llm_gateway
+from deadline import deadline_scope
+from model_router import model_router, CONVERSATION_SUMMARY
+
+logger = logging.getLogger(__name__)
+
+# Prompt token budget per model (the reply budget is on top of this)
+MODEL_PROMPT_BUDGETS = {
+    "llama3-70b-8192": 3000,
+    "llama3-8b-8192": 3000,
+    "mixtral-8x7b-32768": 4000,
+}
+DEFAULT_PROMPT_BUDGET = 2500
+
+# Number of recent user/assistant turns always kept verbatim
+KEEP_RECENT_TURNS = int(os.getenv('CHAT_KEEP_RECENT_TURNS', '4'))
+
+# Fold older turns once this many messages sit outside the verbatim window
+SUMMARIZE_AFTER_MESSAGES = 6
+
+# Hard cap on stored messages in case summarization keeps failing
+MAX_HISTORY_MESSAGES = 200
+
+SUMMARY_MAX_TOKENS = 300
+SUMMARY_DEADLINE = 60.0  # seconds; summaries run detached from the user's request
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful AI assistant."
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an AI assistant. "
+    "Merge the existing summary with the new messages into one concise summary that keeps "
+    "names, facts, preferences, decisions and open questions. Respond with the summary only."
+)
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def estimate_tokens(content) -> int:
+    """
+    Estimate the token count of a message content without a tokenizer.
+
+    Uses the larger of a characters/4 and a words*4/3 heuristic, which stays
+    close to BPE tokenizers for English text and errs on the safe side for code.
+
+    Args:
+        content: A string or a list of multimodal content parts
+
+    Returns:
+        int: Estimated number of tokens
+    """
+    if isinstance(content, list):
+        return sum(
+            estimate_tokens(part.get('text', '')) if isinstance(part, dict) else estimate_tokens(str(part))
+            for part in content
+        )
+    if not content:
+        return 0
+    text = str(content)
+    return max(len(text) // 4, len(_WORD_RE.findall(text)) * 4 // 3) + 1
+
+
+def message_tokens(message: dict) -> int:
+    """Estimate the tokens of one chat message including role overhead."""
+    return estimate_tokens(message.get('content', '')) + 4
+
+
+class ConversationContext:
+    """Per-session prompt window with a rolling summary of older turns."""
+
+    def __init__(self):
+        self.summary = ""
+        self._summary_task: Optional[asyncio.Task] = None
+
+    def build_messages(self, history: list, model: str, system_prompt: str = DEFAULT_SYSTEM_PROMPT) -> list:
+        """
+        Assemble the messages for a completion within the model's token budget.
+
+        Args:
+            history (list): Conversation history ending with the current user message
+            model (str): Model the prompt is built for
+            system_prompt (str): System instructions
+
+        Returns:
+            list: Messages in OpenAI format, oldest first
+        """
+        budget = MODEL_PROMPT_BUDGETS.get(model, DEFAULT_PROMPT_BUDGET)
+
+        system_content = system_prompt
+        if self.summary:
+            system_content += f"\n\nSummary of the earlier conversation:\n{self.summary}"
+        system_message = {"role": "system", "content": system_content}
+        used = message_tokens(system_message)
+
+        # Walk backwards from the newest message until the budget is spent
+        selected = []
+        for message in reversed(history):
+            cost = message_tokens(message)
+            if selected and used + cost > budget:
+                break
+            selected.append({"role": message['role'], "content": message['content']})
+            used += cost
+
+        selected.reverse()
+        return [system_message] + selected
+
+    def maybe_summarize(self, session, api_key: str):
+        """
+        Fold turns older than the verbatim window into the summary in the background.
+
+        The folded messages are dropped from ``session.conversation_history`` once
+        the summary is updated, which keeps per-session memory bounded.
+        """
+        history = session.conversation_history
+        if len(history) > MAX_HISTORY_MESSAGES:
+            del history[:len(history) - MAX_HISTORY_MESSAGES]
+
+        if self._summary_task and not self._summary_task.done():
+            return
+
+        keep = KEEP_RECENT_TURNS * 2
+        foldable = len(history) - keep
+        if foldable < SUMMARIZE_AFTER_MESSAGES or not api_key:
+            return
+
+        to_fold = history[:foldable]
+        # The task copies our context; don't let it inherit the chat request's deadline
+        with deadline_scope(None):
+            self._summary_task = asyncio.create_task(self._fold(session, history, to_fold, api_key))
+
+    async def _fold(self, session, history: list, to_fold: list, api_key: str):
+        """Merge ``to_fold`` into the summary and drop those messages from history."""
+        transcript = "\n".join(
+            f"{'User' if m.get('role') == 'user' else 'Assistant'}: {m.get('content', '')}"
+            for m in to_fold
+        )
+        prompt = f"Existing summary:\n{self.summary or '(none)'}\n\nNew messages:\n{transcript}"
+        try:
+            with deadline_scope(SUMMARY_DEADLINE):
+                summary = await model_router.call(
+                    CONVERSATION_SUMMARY,
+                    lambda model: llm_gateway.chat_completion(
+                        messages=[
+                            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                            {"role": "user", "content": prompt}
+                        ],
+                        model=model,
+                        api_key=api_key,
+                        temperature=0.2,
+                        max_tokens=SUMMARY_MAX_TOKENS
+                    )
+                )
+        except Exception as e:
+            logger.warning(f"Conversation summarization failed: {str(e)}")
+            return
+
+        # The history may have been cleared or replaced while we were waiting
+        if session.conversation_history is not history or history[:len(to_fold)] != to_fold:
+            return
+
+        self.summary = summary.strip()
+        del history[:len(to_fold)]
+        logger.info(f"Folded {len(to_fold)} messages into the conversation summary")
+
+    def reset(self):
+        """Forget the summary and cancel any pending summarization."""
+        if self._summary_task and not self._summary_task.done():
+            self._summary_task.cancel()
+        self._summary_task = None
+        self.summary = ""
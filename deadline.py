@@ -0,0 +1,102 @@
+"""Per-update deadlines for upstream calls and downloads.
+
+A deadline starts when a Telegram update arrives and lives in a context
+variable, so every coroutine handling that update (and any task it spawns)
+sees the same absolute expiry. Upstream calls and downloads bound themselves
+by the time that is left instead of waiting indefinitely.
+"""
+import time
+import asyncio
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Absolute time.monotonic() expiry of the current request, if any
+_deadline: ContextVar[Optional[float]] = ContextVar('deadline', default=None)
+
+# Budget used by bounded operations outside any request scope
+DEFAULT_BUDGET = 60.0
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request runs out of time."""
+
+    def __init__(self, message: str = "⌛ This request took too long and was cancelled. Please try again."):
+        super().__init__(message)
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]):
+    """
+    Run the enclosed code with a deadline ``seconds`` from now.
+
+    An inner scope can only shorten an outer deadline; ``None`` clears it
+    (for background work that must not inherit a user request's deadline).
+    """
+    if seconds is None:
+        expiry = None
+    else:
+        expiry = time.monotonic() + seconds
+        outer = _deadline.get()
+        if outer is not None:
+            expiry = min(expiry, outer)
+    token = _deadline.set(expiry)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or None without one."""
+    expiry = _deadline.get()
+    if expiry is None:
+        return None
+    return expiry - time.monotonic()
+
+
+def budget(cap: Optional[float] = None) -> float:
+    """
+    Seconds an operation may take: the time left, capped at ``cap``.
+
+    Raises:
+        DeadlineExceeded: If the deadline has already passed
+    """
+    left = remaining()
+    if left is None:
+        return cap if cap is not None else DEFAULT_BUDGET
+    if left <= 0:
+        raise DeadlineExceeded()
+    return left if cap is None else min(cap, left)
+
+
+async def bounded(awaitable: Awaitable, cap: Optional[float] = None) -> Any:
+    """
+    Await ``awaitable`` for at most the remaining deadline (and ``cap``).
+
+    Raises:
+        DeadlineExceeded: If it doesn't finish in time
+    """
+    try:
+        timeout = budget(cap)
+    except DeadlineExceeded:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded() from None
+
+
+async def to_thread(fn: Callable, *args, cap: Optional[float] = None, **kwargs) -> Any:
+    """
+    Run a blocking call in a worker thread, bounded by the deadline.
+
+    The thread itself can't be interrupted; on timeout the caller stops
+    waiting for it and the result is discarded.
+    """
+    return await bounded(asyncio.to_thread(fn, *args, **kwargs), cap)
@@ -1,8 +1,14 @@
 import base64
 import requests
-from groq import Groq
 import os
 from dotenv import load_dotenv
+import llm_gateway
+from singleflight import upstream_flight, prompt_hash
+from model_router import model_router, VISION
+from response_cache import vision_result_cache, vision_cache_key
+from perceptual_index import perceptual_index
+
+DEFAULT_CAPTION_PROMPT = "Please give me a caption for this image in not more than 20 words. Focus on the main elements and mood."
 
 class ImageCaptioner:
     def __init__(self):
@@ -10,23 +16,59 @@ class ImageCaptioner:
         self.groq_api_key = os.getenv('GROQ_API_KEY')
         if not self.groq_api_key:
             raise ValueError("GROQ_API_KEY not found in environment variables")
-        self.groq_client = Groq(api_key=self.groq_api_key)
         
-    async def generate_caption(self, image_url, prompt=None):
+    async def generate_caption(self, image_url, prompt=None, image_key=None, phash=None):
         """
         Generate a caption for an image using Groq
         
         Args:
             image_url (str): URL of the image or base64 encoded image data
             prompt (str, optional): Custom prompt for the caption. Defaults to a general description request.
+            image_key (str, optional): Stable image identity (e.g. Telegram file_unique_id); concurrent
+                requests for the same image and prompt then share one upstream call, and the
+                result is cached
+            phash (int, optional): Perceptual hash of the image; captions of near-duplicate images are reused
         
         Returns:
             tuple: (success, caption or error message)
         """
+        prompt = prompt or DEFAULT_CAPTION_PROMPT
+
+        if phash is not None:
+            caption = perceptual_index.lookup(phash, "caption", prompt)
+            if caption is not None:
+                if image_key:
+                    vision_result_cache.set(vision_cache_key(image_key, "caption", prompt), caption)
+                return True, caption
+
+        if image_key:
+            success, caption = await upstream_flight.do(
+                ("caption", image_key, prompt_hash(prompt)), self._generate_caption, image_url, prompt
+            )
+            if success:
+                vision_result_cache.set(vision_cache_key(image_key, "caption", prompt), caption)
+        else:
+            success, caption = await self._generate_caption(image_url, prompt)
+        if success and phash is not None:
+            perceptual_index.add(phash, "caption", prompt, caption)
+        return success, caption
+
+    def cached_caption(self, image_key, prompt=None):
+        """
+        Look up a caption generated earlier for the same image and prompt.
+
+        Args:
+            image_key (str): Stable image identity (e.g. Telegram file_unique_id)
+            prompt (str, optional): Custom prompt the caption was requested with
+
+        Returns:
+            str or None: The cached caption
+        """
+        return vision_result_cache.get(vision_cache_key(image_key, "caption", prompt or DEFAULT_CAPTION_PROMPT))
+
+    async def _generate_caption(self, image_url, prompt):
+        """Call the vision model for a caption."""
         try:
-            if not prompt:
-                prompt = "Please give me a caption for this image in not more than 20 words. Focus on the main elements and mood."
-            
             # Create messages for the API call
             messages = [
                 {
@@ -46,15 +88,19 @@ class ImageCaptioner:
                 }
             ]
             
-            # Make the API call
-            chat_completion = self.groq_client.chat.completions.create(
-                messages=messages,
-                model="llama-3.2-11b-vision-preview",
-                temperature=0.3,
-                max_tokens=100
+            # Make the API call through the shared async gateway on the best vision model
+            caption = await model_router.call(
+                VISION,
+                lambda model: llm_gateway.chat_completion(
+                    messages=messages,
+                    model=model,
+                    api_key=self.groq_api_key,
+                    temperature=0.3,
+                    max_tokens=100
+                ),
+                hedge=True
             )
-            
-            caption = chat_completion.choices[0].message.content.strip()
+            caption = caption.strip()
             return True, caption
             
         except Exception as e:
@@ -1,5 +1,5 @@
 import base64
-from groq import Groq
+import asyncio
 from together import Together
 from PIL import Image
 import io
@@ -7,12 +7,28 @@ import os
 import logging
 import requests
 from dotenv import load_dotenv
+import llm_gateway
+import deadline
+from rate_limiter import rate_limiter, RateLimitExceeded
+from circuit_breaker import circuit_breakers, CircuitOpenError
+from model_router import model_router, PROMPT_ENHANCE
+from response_cache import TTLCache, normalize_prompt
+from image_store import image_store, image_key
 
 # Configure logging
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+# Enhanced prompt cache settings (overridable from .env)
+PROMPT_CACHE_SIZE = int(os.getenv('PROMPT_CACHE_SIZE', '1024'))
+PROMPT_CACHE_TTL = int(os.getenv('PROMPT_CACHE_TTL', '86400'))  # seconds
+
 class AIImageGenerator:
+    IMAGE_MODEL = "black-forest-labs/FLUX.1-schnell-Free"
+    IMAGE_WIDTH = 1024
+    IMAGE_HEIGHT = 768
+    IMAGE_STEPS = 1
+
     def __init__(self):
         load_dotenv(override=True)  # Force reload environment variables
         together_api_key = os.getenv('TOGETHER_API_KEY')
@@ -26,27 +42,42 @@ class AIImageGenerator:
         # Set the API key for Together
         Together().api_key = together_api_key
         self.together_client = Together()
-        self.groq_client = Groq(api_key=groq_api_key)
+        self.together_api_key = together_api_key
+        self.groq_api_key = groq_api_key
         self.last_enhanced_prompt = None
+        # Normalized user prompt -> enhanced prompt
+        self.prompt_cache = TTLCache(max_entries=PROMPT_CACHE_SIZE, ttl=PROMPT_CACHE_TTL)
+
+    async def enhance_prompt(self, user_prompt, use_cache=True):
+        """Enhance the user's prompt using Groq LLM, reusing earlier enhancements of the same prompt."""
+        cache_key = normalize_prompt(user_prompt)
+        if use_cache:
+            cached = self.prompt_cache.get(cache_key)
+            if cached is not None:
+                self.last_enhanced_prompt = cached
+                return cached
 
-    def enhance_prompt(self, user_prompt):
-        """Enhance the user's prompt using Groq LLM."""
         try:
-            chat_completion = self.groq_client.chat.completions.create(
-                messages=[{
+            messages = [{
                     "role": "system",
                     "content": "You are an advanced AI creative assistant (v2.0) specialized in enhancing image generation prompts. Transform user prompts into highly detailed, visually rich descriptions that leverage cutting-edge AI image generation capabilities. Focus on artistic elements including lighting, composition, style, mood, and technical aspects. Maintain conciseness while maximizing visual impact. IMPORTANT: Return only the enhanced prompt without any prefixes or explanatory text."
                 },
                 {
                     "role": "user",
                     "content": f"Enhance this image prompt: {user_prompt}"
-                }],
-                model="llama3-8b-8192",  
-                temperature=0.7,
-                max_tokens=256
+                }]
+            enhanced_prompt = await model_router.call(
+                PROMPT_ENHANCE,
+                lambda model: llm_gateway.chat_completion(
+                    messages=messages,
+                    model=model,
+                    api_key=self.groq_api_key,
+                    temperature=0.7,
+                    max_tokens=256
+                )
             )
 
-            enhanced_prompt = chat_completion.choices[0].message.content.strip()
+            enhanced_prompt = enhanced_prompt.strip()
             prefixes_to_remove = [
                 "Here's an enhanced version of the prompt:",
                 "Enhanced prompt:",
@@ -59,36 +90,76 @@ class AIImageGenerator:
 
             logger.info(f"Enhanced prompt: {enhanced_prompt}")
             self.last_enhanced_prompt = enhanced_prompt
+            if enhanced_prompt:
+                self.prompt_cache.set(cache_key, enhanced_prompt)
             return enhanced_prompt
         except Exception as e:
             logger.error(f"Error enhancing prompt: {str(e)}")
             return None
 
+    def _generate_image(self, prompt):
+        """Call the Together AI API and return the base64 image data."""
+        logger.info("Attempting to generate image with Together AI...")
+        logger.info(f"Using prompt: {prompt}")
+
+        response = self.together_client.images.generate(
+            prompt=prompt,
+            model=self.IMAGE_MODEL,
+            width=self.IMAGE_WIDTH,
+            height=self.IMAGE_HEIGHT,
+            steps=self.IMAGE_STEPS,
+            n=1,
+            response_format="b64_json"
+        )
+
+        if response and hasattr(response, 'data') and len(response.data) > 0:
+            logger.info("Successfully generated image")
+            return response.data[0].b64_json
+        raise ValueError("No image data received from API")
+
     def generate_image(self, prompt):
         """Generate images using the Together AI API."""
         try:
-            logger.info("Attempting to generate image with Together AI...")
-            logger.info(f"Using prompt: {prompt}")
-
-            response = self.together_client.images.generate(
-                prompt=prompt,
-                model="black-forest-labs/FLUX.1-schnell-Free",
-                width=1024,
-                height=768,
-                steps=1,
-                n=1,
-                response_format="b64_json"
-            )
+            return True, self._generate_image(prompt), ""
+        except Exception as e:
+            error_msg = f"Error generating image: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            return False, None, error_msg
+
+    def image_cache_key(self, prompt):
+        """Content address of the image this generator would produce for a prompt."""
+        return image_key(prompt, self.IMAGE_MODEL, self.IMAGE_WIDTH, self.IMAGE_HEIGHT, self.IMAGE_STEPS)
+
+    async def get_cached_image(self, prompt):
+        """
+        Look up a previously generated image for an (enhanced) prompt.
 
-            if response and hasattr(response, 'data') and len(response.data) > 0:
-                image_data = response.data[0].b64_json
-                logger.info("Successfully generated image")
-                return True, image_data, ""
-            else:
-                error_msg = "No image data received from API"
-                logger.error(error_msg)
-                return False, None, error_msg
+        Returns:
+            str or None: Base64 image data, like generate_image returns
+        """
+        try:
+            data = await asyncio.to_thread(image_store.get, self.image_cache_key(prompt))
+        except Exception as e:
+            logger.warning(f"Image store read failed: {str(e)}")
+            return None
+        return base64.b64encode(data).decode('ascii') if data else None
 
+    async def generate_image_async(self, prompt, max_wait=None):
+        """Generate an image in a worker thread once Together rate-limit capacity is available, and store it."""
+        try:
+            # Fail fast during a Together outage instead of waiting out a doomed call
+            breaker = circuit_breakers.get("together", self.IMAGE_MODEL)
+            breaker.check()
+            await rate_limiter.acquire("together", self.IMAGE_MODEL, self.together_api_key, max_wait=max_wait)
+            with breaker.guard():
+                image_data = await deadline.to_thread(self._generate_image, prompt)
+            try:
+                await asyncio.to_thread(image_store.put, self.image_cache_key(prompt), base64.b64decode(image_data))
+            except Exception as e:
+                logger.warning(f"Image store write failed: {str(e)}")
+            return True, image_data, ""
+        except (RateLimitExceeded, CircuitOpenError, deadline.DeadlineExceeded) as e:
+            return False, None, str(e)
         except Exception as e:
             error_msg = f"Error generating image: {str(e)}"
             logger.error(error_msg, exc_info=True)
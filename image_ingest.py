@@ -0,0 +1,124 @@
+"""Image ingestion for vision model calls.
+
+Telegram offers every photo in several sizes. Instead of handing a vision
+provider the bot-token-bearing ``file_path`` URL of the largest one, we pick
+the smallest size that is big enough for the task, download it once into
+a pooled memory buffer, downscale and re-encode it in a worker thread
+straight from that buffer, and send a compact base64 data URL. The
+perceptual hash used to find near-duplicate photos is computed in the same
+pass.
+"""
+import io
+import base64
+import asyncio
+import logging
+from typing import BinaryIO, NamedTuple, Optional, Sequence, Tuple, Union
+
+from PIL import Image
+
+import deadline
+from media_admission import check_photo
+from media_buffer import download_media
+from perceptual_index import dhash
+from response_cache import TTLCache
+from singleflight import upstream_flight
+from telegram_file_cache import get_file
+
+logger = logging.getLogger(__name__)
+
+# Longest image side each vision task needs
+DESCRIBE_MAX_SIDE = 1024
+CAPTION_MAX_SIDE = 768
+
+JPEG_QUALITY = 85
+
+# Recently ingested images, so describe + caption on one photo download it once
+_data_urls = TTLCache(max_entries=64, ttl=600)
+
+
+class IngestedPhoto(NamedTuple):
+    data_url: str  # data:image/jpeg;base64,...
+    phash: int  # dHash for the perceptual index
+
+
+def pick_photo_size(sizes: Sequence, min_side: int):
+    """
+    Choose the smallest PhotoSize whose longest side is at least ``min_side``.
+
+    Falls back to the largest size when none is big enough.
+    """
+    ordered = sorted(sizes, key=lambda size: size.width * size.height)
+    for size in ordered:
+        if max(size.width, size.height) >= min_side:
+            return size
+    return ordered[-1]
+
+
+def resize_image(image: Union[str, bytes, BinaryIO], max_size=(800, 800), quality: int = JPEG_QUALITY) -> Optional[bytes]:
+    """Resize image to reduce file size while maintaining aspect ratio"""
+    try:
+        source = io.BytesIO(image) if isinstance(image, (bytes, bytearray)) else image
+        with Image.open(source) as img:
+            # Convert to RGB if necessary
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+
+            # Calculate new size maintaining aspect ratio
+            img.thumbnail(max_size, Image.Resampling.LANCZOS)
+
+            # Save to bytes
+            img_byte_arr = io.BytesIO()
+            img.save(img_byte_arr, format='JPEG', quality=quality, optimize=True)
+            return img_byte_arr.getvalue()
+    except Exception as e:
+        logging.error(f"Error resizing image: {str(e)}")
+        return None
+
+
+def _prepare(raw: BinaryIO, max_side: int) -> Optional[Tuple[bytes, int]]:
+    jpeg = resize_image(raw, (max_side, max_side))
+    if jpeg is None:
+        return None
+    return jpeg, dhash(jpeg)
+
+
+async def _ingest(bot, photo, max_side: int) -> IngestedPhoto:
+    telegram_file = await deadline.bounded(get_file(bot, photo.file_id))
+    with await deadline.bounded(download_media(telegram_file, photo.file_size)) as buffer:
+        with buffer.open() as raw:
+            prepared = await asyncio.to_thread(_prepare, raw, max_side)
+    if prepared is None:
+        raise ValueError("Could not read the image")
+    jpeg, phash = prepared
+    logger.info(f"Ingested {photo.width}x{photo.height} photo: {buffer.size} -> {len(jpeg)} bytes")
+    return IngestedPhoto("data:image/jpeg;base64," + base64.b64encode(jpeg).decode('ascii'), phash)
+
+
+async def ingest_photo(bot, sizes: Sequence, max_side: int) -> IngestedPhoto:
+    """
+    Download a Telegram photo at an adequate size and prepare it for a vision call.
+
+    Args:
+        bot: Telegram bot used to download the file
+        sizes: The message's PhotoSize list
+        max_side (int): Longest side the vision task needs
+
+    Returns:
+        IngestedPhoto: JPEG data URL and perceptual hash
+
+    Raises:
+        MediaRejected: If the chosen size is too large to download
+    """
+    photo = pick_photo_size(sizes, max_side)
+    check_photo(photo)
+    key = (photo.file_unique_id, max_side)
+    ingested = _data_urls.get(key)
+    if ingested is None:
+        ingested = await upstream_flight.do(("ingest",) + key, _ingest, bot, photo, max_side)
+        _data_urls.set(key, ingested)
+    return ingested
+
+
+async def image_data_url(bot, sizes: Sequence, max_side: int) -> str:
+    """Download a Telegram photo at an adequate size and return it as a JPEG data URL."""
+    return (await ingest_photo(bot, sizes, max_side)).data_url
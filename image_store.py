@@ -0,0 +1,125 @@
+"""On-disk, content-addressed store for generated images.
+
+Images are keyed by a hash of everything that determines them (enhanced
+prompt, model, size and steps) and stored as ``<root>/<k[:2]>/<k>.png``.
+The store keeps an LRU index of file sizes in memory and evicts the least
+recently used files once the total exceeds a byte quota. The index is
+rebuilt from the directory (ordered by mtime) on start-up, and reads touch
+the file so recency survives restarts.
+"""
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from constants import MEDIA_FOLDER
+
+logger = logging.getLogger(__name__)
+
+# Image store settings (overridable from .env)
+IMAGE_CACHE_DIR = os.getenv('IMAGE_CACHE_DIR', os.path.join(MEDIA_FOLDER, 'image_cache'))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv('IMAGE_CACHE_MAX_MB', '500')) * 1024 * 1024
+
+IMAGE_SUFFIX = '.png'
+
+
+def image_key(prompt: str, model: str, width: int, height: int, steps: int) -> str:
+    """Content address of a generated image."""
+    raw = "\x1f".join([prompt, model, str(width), str(height), str(steps)])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ImageStore:
+    """Byte-quota LRU of image files addressed by key."""
+
+    def __init__(self, root: str = IMAGE_CACHE_DIR, max_bytes: int = IMAGE_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._index: "OrderedDict[str, int]" = OrderedDict()  # key -> size, oldest first
+        self._bytes = 0
+        # Reads and writes happen in worker threads
+        self._lock = threading.Lock()
+        self._load_index()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + IMAGE_SUFFIX)
+
+    def _load_index(self):
+        """Rebuild the LRU index from files already on disk."""
+        entries = []
+        if os.path.isdir(self.root):
+            for dirpath, _, filenames in os.walk(self.root):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    if not name.endswith(IMAGE_SUFFIX):
+                        continue
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, name[:-len(IMAGE_SUFFIX)], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._bytes += size
+        if entries:
+            logger.info(f"Image store: {len(entries)} images, {self._bytes / 1024 / 1024:.1f} MB")
+        self._evict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the stored image bytes, or None."""
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # persist recency for the next start-up
+        except OSError:
+            with self._lock:
+                self._bytes -= self._index.pop(key, 0)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes):
+        """Store image bytes under a key, evicting old images past the quota."""
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)  # atomic, so readers never see half an image
+
+        with self._lock:
+            self._bytes -= self._index.pop(key, 0)
+            self._index[key] = len(data)
+            self._bytes += len(data)
+            self._evict()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self._bytes -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        """Return hit/miss counters, image count and bytes used."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._index), "bytes": self._bytes}
+
+
+# Shared store for /imagine results
+image_store = ImageStore()
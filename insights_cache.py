@@ -0,0 +1,137 @@
+"""Persistent cache of video analysis results.
+
+Popular clips get sent for analysis again and again. Results are stored in
+a local SQLite database under the SHA-256 of the video content, together
+with the analysis variant (prompt version, mode and question) and the model
+that produced them. Telegram ``file_unique_id``s are recorded as aliases of
+the content hash, so a repeat of a video the bot has seen is answered
+before it is even downloaded. A re-upload of the same bytes gets a new
+file_unique_id but still hits once its hash is known.
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+from typing import Optional
+
+from constants import MEDIA_FOLDER
+from singleflight import prompt_hash
+
+logger = logging.getLogger(__name__)
+
+# Insights cache settings (overridable from .env)
+INSIGHTS_CACHE_PATH = os.getenv('INSIGHTS_CACHE_PATH', os.path.join(MEDIA_FOLDER, 'insights_cache.sqlite3'))
+INSIGHTS_CACHE_TTL = float(os.getenv('INSIGHTS_CACHE_DAYS', '30')) * 86400
+
+# Bump when the video prompts change so older analyses are no longer served
+INSIGHTS_PROMPT_VERSION = "1"
+
+PURGE_INTERVAL = 3600  # seconds between sweeps for expired rows
+ALIAS_GRACE = 3600  # seconds an alias may wait for its analysis; well beyond the video job deadline
+
+
+def insights_variant(mode: str, question: Optional[str] = None) -> str:
+    """Identify what was asked about a video, so different questions are cached separately."""
+    return f"v{INSIGHTS_PROMPT_VERSION}:{mode}:{prompt_hash(question)}"
+
+
+class InsightsCache:
+    """SQLite table of (content hash, variant) -> analysis, with file_unique_id aliases."""
+
+    def __init__(self, path: str = INSIGHTS_CACHE_PATH, ttl: float = INSIGHTS_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._last_purge = 0.0
+        # One connection shared by worker threads, serialized by a lock
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS insights ("
+                " content_hash TEXT NOT NULL,"
+                " variant TEXT NOT NULL,"
+                " model TEXT,"
+                " result TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " PRIMARY KEY (content_hash, variant))"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS aliases ("
+                " file_unique_id TEXT PRIMARY KEY,"
+                " content_hash TEXT NOT NULL,"
+                " created_at REAL NOT NULL DEFAULT 0)"
+            )
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(aliases)")]
+            if 'created_at' not in columns:
+                # Databases from before aliases were timestamped
+                self._db.execute("ALTER TABLE aliases ADD COLUMN created_at REAL NOT NULL DEFAULT 0")
+
+    def resolve(self, file_unique_id: str) -> Optional[str]:
+        """Content hash of a Telegram file seen before, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT content_hash FROM aliases WHERE file_unique_id = ?", (file_unique_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def get(self, content_hash: str, variant: str) -> Optional[str]:
+        """Return the cached analysis of a video, or None if missing or expired."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT result FROM insights WHERE content_hash = ? AND variant = ? AND expires_at > ?",
+                (content_hash, variant, time.time())
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return row[0]
+
+    def lookup(self, file_unique_id: str, variant: str) -> Optional[str]:
+        """Return the cached analysis of a Telegram file without downloading it."""
+        content_hash = self.resolve(file_unique_id)
+        return self.get(content_hash, variant) if content_hash else None
+
+    def alias(self, file_unique_id: str, content_hash: str):
+        """Record that a Telegram file has the given content hash."""
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO aliases (file_unique_id, content_hash, created_at) VALUES (?, ?, ?)",
+                (file_unique_id, content_hash, time.time())
+            )
+
+    def put(self, content_hash: str, variant: str, model: Optional[str], result: str):
+        """Store an analysis for the video content."""
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO insights (content_hash, variant, model, result, created_at, expires_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (content_hash, variant, model, result, now, now + self.ttl)
+            )
+            if now - self._last_purge > PURGE_INTERVAL:
+                self._last_purge = now
+                # Drop aliases without a live analysis, unless they are recent: a job still
+                # running has recorded its alias but not stored its result yet
+                self._db.execute(
+                    "DELETE FROM aliases WHERE created_at <= ?"
+                    " AND content_hash NOT IN (SELECT content_hash FROM insights WHERE expires_at > ?)",
+                    (now - ALIAS_GRACE, now)
+                )
+                self._db.execute("DELETE FROM insights WHERE expires_at <= ?", (now,))
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the number of stored analyses."""
+        with self._lock:
+            size = self._db.execute("SELECT COUNT(*) FROM insights").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "size": size}
+
+
+# Shared cache for /analyze_video
+insights_cache = InsightsCache()
@@ -0,0 +1,223 @@
+"""Keyframe extraction for cheap video analysis.
+
+Instead of uploading a whole video, ffmpeg decodes a low-rate, downscaled
+sample of its frames straight into a pipe. Frames are read into NumPy in
+batches, a colour histogram is computed for every frame in one vectorized
+pass, and the distance between consecutive histograms scores how much the
+scene changed. The highest-scoring frames (plus the opening frame) are
+kept in a fixed-size heap while decoding, so memory stays bounded no
+matter how long the video is, and are returned as JPEGs in time order.
+"""
+import io
+import os
+import json
+import heapq
+import time
+import logging
+import subprocess
+from typing import Iterator, NamedTuple, Optional
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Keyframe settings (overridable from .env)
+KEYFRAME_COUNT = int(os.getenv('KEYFRAME_COUNT', '24'))
+KEYFRAME_WIDTH = int(os.getenv('KEYFRAME_WIDTH', '640'))  # longest side of extracted frames
+SAMPLE_FPS = float(os.getenv('KEYFRAME_SAMPLE_FPS', '2'))
+MAX_SAMPLED_FRAMES = 1200  # lower the sample rate for long videos
+FFMPEG_TIMEOUT = float(os.getenv('FFMPEG_TIMEOUT', '300'))
+
+HISTOGRAM_BINS = 16  # per colour channel
+ANALYSIS_SIDE = 64  # frames are histogrammed at this size
+BATCH_FRAMES = 32
+JPEG_QUALITY = 80
+
+
+class VideoInfo(NamedTuple):
+    width: int
+    height: int
+    duration: float
+    has_audio: bool
+    fps: float = 0.0
+
+
+class Keyframe(NamedTuple):
+    timestamp: float  # seconds from the start
+    jpeg: bytes
+    score: float  # scene-change strength, 0..1
+
+
+def _rotation(stream: dict) -> int:
+    """Rotation of a video stream in degrees, 0..359."""
+    # FFmpeg 5+ reports it as display matrix side data, older versions as a tag
+    for side_data in stream.get('side_data_list', []):
+        if 'rotation' in side_data:
+            return int(float(side_data['rotation'])) % 360
+    return int(float(stream.get('tags', {}).get('rotate', 0) or 0)) % 360
+
+
+def probe(video_path: str) -> VideoInfo:
+    """Read the frame size, duration and audio presence of a video with ffprobe."""
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_streams', '-show_format', '-of', 'json', str(video_path)],
+        capture_output=True, text=True, timeout=30, check=True
+    )
+    data = json.loads(result.stdout)
+    streams = data.get('streams', [])
+    video = next((s for s in streams if s.get('codec_type') == 'video'), None)
+    if video is None:
+        raise ValueError("The file has no video stream")
+
+    width, height = int(video['width']), int(video['height'])
+    # Phone videos are often stored sideways; ffmpeg rotates them upright when decoding
+    if _rotation(video) % 180 == 90:
+        width, height = height, width
+    duration = float(data.get('format', {}).get('duration') or video.get('duration') or 0.0)
+    has_audio = any(s.get('codec_type') == 'audio' for s in streams)
+    try:
+        numerator, _, denominator = video.get('avg_frame_rate', '0/1').partition('/')
+        fps = float(numerator) / float(denominator or 1)
+    except (ValueError, ZeroDivisionError):
+        fps = 0.0
+    return VideoInfo(width, height, duration, has_audio, fps)
+
+
+def _output_size(info: VideoInfo, max_side: int) -> tuple:
+    """Scaled frame size keeping the aspect ratio; even dimensions for the scaler."""
+    scale = min(1.0, max_side / max(info.width, info.height))
+    return max(2, int(info.width * scale) // 2 * 2), max(2, int(info.height * scale) // 2 * 2)
+
+
+def _sample_fps(duration: float) -> float:
+    if duration <= 0:
+        return SAMPLE_FPS
+    return min(SAMPLE_FPS, MAX_SAMPLED_FRAMES / duration)
+
+
+def iter_frame_batches(video_path: str, width: int, height: int, fps: float) -> Iterator[np.ndarray]:
+    """
+    Decode sampled frames through an ffmpeg pipe.
+
+    Yields:
+        np.ndarray: uint8 arrays of shape (n, height, width, 3), n <= BATCH_FRAMES
+    """
+    process = subprocess.Popen(
+        ['ffmpeg', '-v', 'error', '-i', str(video_path),
+         '-vf', f'fps={fps:.4f},scale={width}:{height}',
+         '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-'],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    frame_bytes = width * height * 3
+    started = time.monotonic()
+    try:
+        while True:
+            if time.monotonic() - started > FFMPEG_TIMEOUT:
+                raise TimeoutError("Decoding the video took too long")
+            chunk = process.stdout.read(frame_bytes * BATCH_FRAMES)
+            count = len(chunk) // frame_bytes
+            if count:
+                yield np.frombuffer(chunk, dtype=np.uint8, count=count * frame_bytes).reshape(count, height, width, 3)
+            if len(chunk) < frame_bytes * BATCH_FRAMES:
+                break
+    finally:
+        process.kill()
+        process.wait()
+
+
+def histograms(frames: np.ndarray) -> np.ndarray:
+    """
+    Normalized per-channel colour histograms for a batch of frames.
+
+    Returns:
+        np.ndarray: float32 array of shape (n, 3 * HISTOGRAM_BINS); each row sums to 1
+    """
+    n, height, width, _ = frames.shape
+    # Subsample large frames; histograms don't need every pixel
+    step = max(1, max(height, width) // ANALYSIS_SIDE)
+    pixels = frames[:, ::step, ::step, :].reshape(n, -1, 3)
+
+    bins = (pixels // (256 // HISTOGRAM_BINS)).astype(np.int64)  # 0..HISTOGRAM_BINS-1
+    bins += np.arange(3, dtype=np.int64) * HISTOGRAM_BINS  # separate channel ranges
+    bins += (np.arange(n, dtype=np.int64) * 3 * HISTOGRAM_BINS)[:, None, None]  # separate frames
+    counts = np.bincount(bins.ravel(), minlength=n * 3 * HISTOGRAM_BINS).reshape(n, 3 * HISTOGRAM_BINS)
+    return (counts / (3.0 * pixels.shape[1])).astype(np.float32)
+
+
+def scene_scores(hists: np.ndarray, previous: Optional[np.ndarray]) -> np.ndarray:
+    """Half the L1 distance between each histogram and the one before it (0 = same, 1 = disjoint)."""
+    before = np.vstack([previous[None, :] if previous is not None else hists[:1], hists[:-1]])
+    scores = 0.5 * np.abs(hists - before).sum(axis=1)
+    if previous is None:
+        scores[0] = 1.0  # always consider the opening frame
+    return scores
+
+
+def _encode(frame: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    Image.fromarray(frame).save(buffer, format='JPEG', quality=JPEG_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def extract_keyframes(video_path: str, count: int = KEYFRAME_COUNT,
+                      max_side: int = KEYFRAME_WIDTH) -> tuple:
+    """
+    Pick the ``count`` frames where the scene changes most.
+
+    Args:
+        video_path (str): Path of the video file
+        count (int): Number of keyframes to return
+        max_side (int): Longest side of the returned frames
+
+    Returns:
+        tuple[list[Keyframe], VideoInfo]: Keyframes in time order and the probed video info
+    """
+    info = probe(video_path)
+    width, height = _output_size(info, max_side)
+    fps = _sample_fps(info.duration)
+
+    heap: list = []  # (score, frame index, frame) min-heap of the best frames so far
+    previous = None
+    index = 0
+    for batch in iter_frame_batches(video_path, width, height, fps):
+        hists = histograms(batch)
+        scores = scene_scores(hists, previous)
+        previous = hists[-1]
+
+        # Only frames that beat the current weakest keyframe need copying out of the batch
+        threshold = heap[0][0] if len(heap) >= count else -1.0
+        for offset in np.flatnonzero(scores > threshold):
+            item = (float(scores[offset]), index + int(offset), batch[offset].copy())
+            if len(heap) < count:
+                heapq.heappush(heap, item)
+            elif item[0] > heap[0][0]:
+                heapq.heapreplace(heap, item)
+        index += len(batch)
+
+    if not heap:
+        raise ValueError("Could not decode any frames from the video")
+
+    keyframes = [
+        Keyframe(timestamp=frame_index / fps, jpeg=_encode(frame), score=score)
+        for score, frame_index, frame in sorted(heap, key=lambda item: item[1])
+    ]
+    logger.info(
+        f"Extracted {len(keyframes)} keyframes from {index} sampled frames "
+        f"({sum(len(k.jpeg) for k in keyframes) / 1024:.0f} KB)"
+    )
+    return keyframes, info
+
+
+def extract_audio(video_path: str, bitrate: str = '32k') -> Optional[bytes]:
+    """Extract the soundtrack as small mono MP3 for transcription, or None if that fails."""
+    try:
+        result = subprocess.run(
+            ['ffmpeg', '-v', 'error', '-i', str(video_path), '-vn', '-ac', '1', '-ar', '16000',
+             '-b:a', bitrate, '-f', 'mp3', '-'],
+            capture_output=True, timeout=FFMPEG_TIMEOUT, check=True
+        )
+        return result.stdout or None
+    except (subprocess.SubprocessError, OSError) as e:
+        logger.warning(f"Could not extract audio: {str(e)}")
+        return None
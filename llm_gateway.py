@@ -0,0 +1,253 @@
+"""Shared async gateway for all Groq LLM calls.
+
+Handlers used to build a fresh synchronous ``Groq`` client per request, which
+blocked the whole event loop while a completion was running. Every caller now
+goes through this module, which keeps one ``AsyncGroq`` client per API key on
+top of a single keep-alive HTTP connection pool. Calls pass through the
+per-model rate limiter and circuit breaker before reaching Groq.
+"""
+import os
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+import httpx
+from groq import AsyncGroq, RateLimitError
+from dotenv import load_dotenv
+
+import deadline
+from rate_limiter import rate_limiter, RateLimitExceeded
+from circuit_breaker import circuit_breakers
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Connection pool settings (overridable from .env)
+GROQ_MAX_CONNECTIONS = int(os.getenv('GROQ_MAX_CONNECTIONS', '32'))
+GROQ_MAX_KEEPALIVE = int(os.getenv('GROQ_MAX_KEEPALIVE', '16'))
+GROQ_TIMEOUT = float(os.getenv('GROQ_TIMEOUT', '60'))
+GROQ_MAX_RETRIES = int(os.getenv('GROQ_MAX_RETRIES', '2'))
+
+# Users can bring their own key via /setgroqapi, so bound the number of clients
+MAX_CLIENTS = 256
+
+# Rough token cost of one image in a vision request, for rate-limit reservations
+IMAGE_TOKEN_ESTIMATE = 1000
+
+_http_client: Optional[httpx.AsyncClient] = None
+_clients: "OrderedDict[str, AsyncGroq]" = OrderedDict()
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    """Return the shared keep-alive HTTP client, creating it on first use."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=GROQ_MAX_CONNECTIONS,
+                max_keepalive_connections=GROQ_MAX_KEEPALIVE,
+                keepalive_expiry=30.0
+            ),
+            timeout=httpx.Timeout(GROQ_TIMEOUT, connect=10.0)
+        )
+        # Clients bound to a closed pool are useless
+        _clients.clear()
+    return _http_client
+
+
+def get_groq_client(api_key: Optional[str] = None) -> AsyncGroq:
+    """
+    Get a pooled AsyncGroq client for the given API key.
+
+    Args:
+        api_key (str, optional): Groq API key. Defaults to GROQ_API_KEY from the environment.
+
+    Returns:
+        AsyncGroq: A client sharing the gateway's connection pool
+    """
+    api_key = api_key or os.getenv('GROQ_API_KEY')
+    if not api_key:
+        raise ValueError("GROQ_API_KEY not found in environment variables")
+
+    http_client = _get_http_client()
+    client = _clients.get(api_key)
+    if client is None:
+        client = AsyncGroq(
+            api_key=api_key,
+            http_client=http_client,
+            max_retries=GROQ_MAX_RETRIES
+        )
+        _clients[api_key] = client
+        if len(_clients) > MAX_CLIENTS:
+            _clients.popitem(last=False)
+    else:
+        _clients.move_to_end(api_key)
+    return client
+
+
+def estimate_request_tokens(messages: list, max_tokens: int) -> int:
+    """Estimate the tokens a chat request will be billed for (prompt plus reply budget)."""
+    total = max_tokens
+    for message in messages:
+        content = message.get('content', '')
+        if isinstance(content, list):
+            for part in content:
+                if part.get('type') == 'image_url':
+                    total += IMAGE_TOKEN_ESTIMATE
+                else:
+                    total += len(part.get('text', '')) // 4
+        else:
+            total += len(content or '') // 4
+        total += 4
+    return total
+
+
+def _retry_after(error: RateLimitError) -> float:
+    """Read the provider's retry-after hint from a 429 response."""
+    try:
+        return float(error.response.headers.get('retry-after', '10'))
+    except (AttributeError, TypeError, ValueError):
+        return 10.0
+
+
+async def chat_completion(messages: list, model: str, api_key: Optional[str] = None,
+                          temperature: float = 0.7, max_tokens: int = 1024,
+                          max_wait: Optional[float] = None, **kwargs) -> str:
+    """
+    Run a non-streaming chat completion and return the message text.
+
+    Args:
+        messages (list): Chat messages in OpenAI format
+        model (str): Groq model name
+        api_key (str, optional): Groq API key to use
+        temperature (float): Sampling temperature
+        max_tokens (int): Maximum number of tokens in the response
+        max_wait (float, optional): Cap on the wait for rate-limit capacity; defaults to the request deadline
+
+    Returns:
+        str: The assistant's reply
+    """
+    client = get_groq_client(api_key)
+    breaker = circuit_breakers.get("groq", model)
+    breaker.check()
+    reservation = await rate_limiter.acquire(
+        "groq", model, client.api_key, estimate_request_tokens(messages, max_tokens), max_wait
+    )
+    timeout = deadline.budget(GROQ_TIMEOUT)
+    try:
+        with breaker.guard():
+            completion = await client.chat.completions.create(
+                messages=messages,
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=timeout,
+                **kwargs
+            )
+    except RateLimitError as e:
+        rate_limiter.penalize("groq", model, client.api_key, _retry_after(e))
+        raise RateLimitExceeded("groq", model, _retry_after(e)) from e
+
+    usage = getattr(completion, 'usage', None)
+    rate_limiter.settle(reservation, getattr(usage, 'total_tokens', None))
+    return completion.choices[0].message.content
+
+
+async def stream_chat_completion(messages: list, model: str, api_key: Optional[str] = None,
+                                 temperature: float = 0.7, max_tokens: int = 1024,
+                                 max_wait: Optional[float] = None, **kwargs):
+    """
+    Run a streaming chat completion, yielding text deltas as they arrive.
+
+    Args:
+        messages (list): Chat messages in OpenAI format
+        model (str): Groq model name
+        api_key (str, optional): Groq API key to use
+        temperature (float): Sampling temperature
+        max_tokens (int): Maximum number of tokens in the response
+        max_wait (float, optional): Cap on the wait for rate-limit capacity; defaults to the request deadline
+
+    Yields:
+        str: The next piece of the assistant's reply
+    """
+    client = get_groq_client(api_key)
+    breaker = circuit_breakers.get("groq", model)
+    breaker.check()
+    reservation = await rate_limiter.acquire(
+        "groq", model, client.api_key, estimate_request_tokens(messages, max_tokens), max_wait
+    )
+    usage = None
+    timeout = deadline.budget(GROQ_TIMEOUT)
+    # A stream that breaks halfway counts against the breaker too
+    with breaker.guard():
+        try:
+            stream = await client.chat.completions.create(
+                messages=messages,
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                timeout=timeout,
+                **kwargs
+            )
+        except RateLimitError as e:
+            rate_limiter.penalize("groq", model, client.api_key, _retry_after(e))
+            raise RateLimitExceeded("groq", model, _retry_after(e)) from e
+
+        async for chunk in stream:
+            # Groq reports usage on the final chunk
+            x_groq = getattr(chunk, 'x_groq', None)
+            if x_groq is not None and getattr(x_groq, 'usage', None) is not None:
+                usage = x_groq.usage
+            if chunk.choices and chunk.choices[0].delta.content is not None:
+                yield chunk.choices[0].delta.content
+    rate_limiter.settle(reservation, getattr(usage, 'total_tokens', None))
+
+
+async def translate_audio(file: tuple, model: str = "whisper-large-v3", api_key: Optional[str] = None,
+                          prompt: Optional[str] = None, temperature: float = 0.0,
+                          max_wait: Optional[float] = None) -> str:
+    """
+    Translate an audio file to English text with Whisper.
+
+    Args:
+        file (tuple): (filename, bytes or binary file) pair for the upload
+        model (str): Whisper model name
+        api_key (str, optional): Groq API key to use
+        prompt (str, optional): Context or spelling hints
+        temperature (float): Sampling temperature
+        max_wait (float, optional): Cap on the wait for rate-limit capacity; defaults to the request deadline
+
+    Returns:
+        str: The transcribed text
+    """
+    client = get_groq_client(api_key)
+    breaker = circuit_breakers.get("groq", model)
+    breaker.check()
+    await rate_limiter.acquire("groq", model, client.api_key, max_wait=max_wait)
+    timeout = deadline.budget(GROQ_TIMEOUT)
+    try:
+        with breaker.guard():
+            translation = await client.audio.translations.create(
+                file=file,
+                model=model,
+                prompt=prompt or "Specify context or spelling",
+                response_format="json",
+                temperature=temperature,
+                timeout=timeout
+            )
+    except RateLimitError as e:
+        rate_limiter.penalize("groq", model, client.api_key, _retry_after(e))
+        raise RateLimitExceeded("groq", model, _retry_after(e)) from e
+    return translation.text
+
+
+async def close():
+    """Close the shared connection pool (called on application shutdown)."""
+    global _http_client
+    _clients.clear()
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
@@ -10,7 +10,10 @@ from fpdf import FPDF
 from typing import Optional
 import together
 import base64
+import asyncio
 from image_generator import AIImageGenerator
+from model_router import model_router, CHAT
+import llm_gateway
 
 # Set up logging
 logging.basicConfig(
@@ -21,6 +24,13 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+async def _enhance_prompt(generator: AIImageGenerator, prompt: str) -> Optional[str]:
+    """Enhance a prompt, then close the gateway's connection pool, which is bound to this event loop."""
+    try:
+        return await generator.enhance_prompt(prompt)
+    finally:
+        await llm_gateway.close()
+
 def generate_image(prompt: str, user_id: str = None) -> tuple[bool, bytes, str, str]:
     """
     Generate an image using Together AI's service with prompt enhancement.
@@ -34,7 +44,7 @@ def generate_image(prompt: str, user_id: str = None) -> tuple[bool, bytes, str,
     """
     try:
         generator = AIImageGenerator()
-        enhanced_prompt = generator.enhance_prompt(prompt)
+        enhanced_prompt = asyncio.run(_enhance_prompt(generator, prompt))
         if not enhanced_prompt:
             logger.error("Failed to enhance prompt")
             return False, None, "Failed to enhance prompt", None
@@ -78,27 +88,36 @@ def interactive_chat(text: str, temperature: float = 0.7, max_tokens: int = 1024
             
         client = Groq(api_key=api_key)
         
-        # Create the chat completion
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": "You are a helpful AI assistant."},
-                {"role": "user", "content": text}
-            ],
-            model="mixtral-8x7b-32768",  # Using Mixtral model for better performance
-            temperature=temperature,
-            max_tokens=max_tokens,
-            stream=stream
-        )
-        
-        # Get the response
-        if stream:
-            full_response = ""
-            for chunk in chat_completion:
-                if chunk.choices[0].delta.content is not None:
-                    full_response += chunk.choices[0].delta.content
-            return full_response
-        else:
-            return chat_completion.choices[0].message.content
+        # Use the fastest healthy chat model and report back how it did
+        model = model_router.route(CHAT)[0]
+        started = time.monotonic()
+        try:
+            # Create the chat completion
+            chat_completion = client.chat.completions.create(
+                messages=[
+                    {"role": "system", "content": "You are a helpful AI assistant."},
+                    {"role": "user", "content": text}
+                ],
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=stream
+            )
+            
+            # Get the response
+            if stream:
+                full_response = ""
+                for chunk in chat_completion:
+                    if chunk.choices[0].delta.content is not None:
+                        full_response += chunk.choices[0].delta.content
+                response = full_response
+            else:
+                response = chat_completion.choices[0].message.content
+        except Exception:
+            model_router.record(model, time.monotonic() - started, ok=False)
+            raise
+        model_router.record(model, time.monotonic() - started, ok=True)
+        return response
             
     except Exception as e:
         logger.error(f"Error in chat: {str(e)}")
@@ -0,0 +1,142 @@
+"""Pre-download admission checks for media messages.
+
+Telegram tells us a file's size, MIME type, duration and dimensions before
+we fetch a single byte of it. Checking those against per-command policies
+up front means oversized or unsupported media is turned away immediately,
+instead of after a download (and possibly an upload to a provider) that
+was bound to fail. Long videos are routed to the cheaper keyframes mode
+unless the user picked a mode explicitly.
+
+Every check raises ``MediaRejected`` with a message ready to show the user.
+Metadata Telegram leaves out (documents have no duration, for instance) is
+not held against the file.
+"""
+import os
+import logging
+from typing import NamedTuple, Optional
+
+from constants import (
+    ERROR_MESSAGES, MAX_VIDEO_SIZE, MAX_VIDEO_DURATION,
+    MAX_AUDIO_SIZE, MAX_AUDIO_DURATION, MAX_PHOTO_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# The Bot API refuses to serve larger files; raise this when running a local Bot API server
+TELEGRAM_MAX_DOWNLOAD = int(float(os.getenv('TELEGRAM_MAX_DOWNLOAD_MB', '20')) * MB)
+
+# Admission settings (overridable from .env)
+KEYFRAMES_ROUTE_SECONDS = float(os.getenv('KEYFRAMES_ROUTE_SECONDS', '300'))  # longer videos skip full mode
+MAX_VIDEO_SIDE = int(os.getenv('MAX_VIDEO_SIDE', '4096'))
+
+VIDEO_MIME_TYPES = {
+    'video/mp4', 'video/quicktime', 'video/x-msvideo', 'video/webm',
+    'video/x-matroska', 'video/mpeg', 'video/3gpp',
+}
+AUDIO_MIME_PREFIXES = ('audio/', 'video/mp4', 'video/webm', 'video/mpeg')
+
+
+class MediaRejected(Exception):
+    """Raised when a file fails admission; the message is meant for the user."""
+
+
+class MediaPolicy(NamedTuple):
+    max_bytes: int
+    max_duration: Optional[float] = None  # seconds
+    max_side: Optional[int] = None  # pixels
+
+
+VIDEO_POLICY = MediaPolicy(min(MAX_VIDEO_SIZE, TELEGRAM_MAX_DOWNLOAD), MAX_VIDEO_DURATION, MAX_VIDEO_SIDE)
+AUDIO_POLICY = MediaPolicy(min(MAX_AUDIO_SIZE, TELEGRAM_MAX_DOWNLOAD), MAX_AUDIO_DURATION)
+PHOTO_POLICY = MediaPolicy(min(MAX_PHOTO_SIZE, TELEGRAM_MAX_DOWNLOAD))
+
+
+def _megabytes(size: int) -> int:
+    return size // MB
+
+
+def _too_big(media, policy: MediaPolicy) -> bool:
+    size = getattr(media, 'file_size', None)
+    return bool(size) and size > policy.max_bytes
+
+
+def _too_long(media, policy: MediaPolicy) -> bool:
+    duration = getattr(media, 'duration', None)
+    return bool(duration) and policy.max_duration is not None and duration > policy.max_duration
+
+
+def check_video(media, mode: str, explicit_mode: bool = False, keyframes_mode: Optional[str] = None,
+                policy: MediaPolicy = VIDEO_POLICY) -> str:
+    """
+    Admit a video or video document for analysis.
+
+    Args:
+        media: Telegram Video or Document
+        mode (str): Analysis mode the request would use
+        explicit_mode (bool): Whether the user chose the mode with a flag
+        keyframes_mode (str): Cheaper mode to route long videos to, if any
+        policy (MediaPolicy): Limits to enforce
+
+    Returns:
+        str: The analysis mode to use
+
+    Raises:
+        MediaRejected: If the video can't or shouldn't be downloaded
+    """
+    mime_type = getattr(media, 'mime_type', None)
+    if mime_type and mime_type not in VIDEO_MIME_TYPES:
+        raise MediaRejected(ERROR_MESSAGES["invalid_video"].format(max_mb=_megabytes(policy.max_bytes)))
+    if _too_big(media, policy):
+        raise MediaRejected(ERROR_MESSAGES["video_too_large"].format(max_mb=_megabytes(policy.max_bytes)))
+    if _too_long(media, policy):
+        raise MediaRejected(ERROR_MESSAGES["video_too_long"].format(max_minutes=int(policy.max_duration // 60)))
+    width, height = getattr(media, 'width', None) or 0, getattr(media, 'height', None) or 0
+    if policy.max_side and max(width, height) > policy.max_side:
+        raise MediaRejected(ERROR_MESSAGES["video_resolution_too_high"].format(max_side=policy.max_side))
+
+    duration = getattr(media, 'duration', None) or 0
+    if keyframes_mode and not explicit_mode and mode != keyframes_mode and duration > KEYFRAMES_ROUTE_SECONDS:
+        logger.info(f"Routing {duration}s video from {mode} to {keyframes_mode} mode")
+        return keyframes_mode
+    return mode
+
+
+def check_audio(media, file_name: Optional[str] = None, supported_formats=None,
+                policy: MediaPolicy = AUDIO_POLICY):
+    """
+    Admit a voice message or audio file for transcription.
+
+    Args:
+        media: Telegram Voice or Audio
+        file_name (str): Name of the file, checked against ``supported_formats``
+        supported_formats (set): Allowed file extensions
+        policy (MediaPolicy): Limits to enforce
+
+    Raises:
+        MediaRejected: If the audio can't or shouldn't be downloaded
+    """
+    if file_name and supported_formats is not None:
+        extension = os.path.splitext(file_name)[1].lower()
+        if extension not in supported_formats:
+            raise MediaRejected(ERROR_MESSAGES["unsupported_audio"].format(format=extension or file_name))
+    elif supported_formats is not None:
+        mime_type = getattr(media, 'mime_type', None)
+        if mime_type and not mime_type.startswith(AUDIO_MIME_PREFIXES):
+            raise MediaRejected(ERROR_MESSAGES["unsupported_audio"].format(format=mime_type))
+    if _too_big(media, policy) or _too_long(media, policy):
+        raise MediaRejected(ERROR_MESSAGES["audio_too_large"].format(
+            max_mb=_megabytes(policy.max_bytes), max_minutes=int(policy.max_duration // 60)
+        ))
+
+
+def check_photo(photo, policy: MediaPolicy = PHOTO_POLICY):
+    """
+    Admit the PhotoSize picked for a vision call.
+
+    Raises:
+        MediaRejected: If the image is too large to download
+    """
+    if _too_big(photo, policy):
+        raise MediaRejected(ERROR_MESSAGES["photo_too_large"].format(max_mb=_megabytes(policy.max_bytes)))
@@ -0,0 +1,273 @@
+"""Media buffers that stay in memory and spill to disk only when large.
+
+Incoming media used to go through a fixed file name on disk, so two voice
+notes from one user could overwrite each other, and every photo and voice
+note paid for a write and a read it didn't need. A ``MediaBuffer`` keeps
+small downloads in a ``bytearray`` borrowed from a shared pool and moves
+large ones to a uniquely named spill file. Consumers read it without
+copying: ``view()`` returns a memoryview of the bytes (memory-mapped when
+spilled) and ``open()`` a file object over them. Tools that need a path,
+such as ffmpeg or an upload API, call ``path()``.
+
+Views and file objects are only valid until the buffer is closed, after
+which its bytearray may be handed to another download.
+"""
+import io
+import os
+import mmap
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import defaultdict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Buffer settings (overridable from .env)
+SPILL_THRESHOLD = int(float(os.getenv('MEDIA_SPILL_MB', '8')) * MB)  # larger media goes to a spill file
+BUFFER_POOL_MAX = int(float(os.getenv('MEDIA_POOL_MB', '32')) * MB)  # idle pooled memory kept for reuse
+SPILL_DIR = os.getenv('MEDIA_SPILL_DIR', tempfile.gettempdir())  # point at a tmpfs such as /dev/shm if available
+
+MIN_BUFFER = 64 * 1024  # smallest pooled bytearray
+
+
+def _size_class(size: int) -> int:
+    """Round a size up to a power of two, so freed buffers fit later requests."""
+    return max(MIN_BUFFER, 1 << (max(size, 1) - 1).bit_length())
+
+
+class BufferPool:
+    """Free lists of bytearrays by power-of-two size, bounded in total bytes."""
+
+    def __init__(self, max_bytes: int = BUFFER_POOL_MAX):
+        self.max_bytes = max_bytes
+        self.idle_bytes = 0
+        self.reused = 0
+        self.allocated = 0
+        self._free = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def acquire(self, size: int) -> bytearray:
+        """Borrow a bytearray of at least ``size`` bytes."""
+        capacity = _size_class(size)
+        with self._lock:
+            free = self._free[capacity]
+            if free:
+                self.idle_bytes -= capacity
+                self.reused += 1
+                return free.pop()
+            self.allocated += 1
+        return bytearray(capacity)
+
+    def release(self, buffer: bytearray):
+        """Return a bytearray for reuse, or drop it if the pool is full."""
+        capacity = len(buffer)
+        with self._lock:
+            if capacity == _size_class(capacity) and self.idle_bytes + capacity <= self.max_bytes:
+                self._free[capacity].append(buffer)
+                self.idle_bytes += capacity
+
+    def stats(self) -> dict:
+        """Reuse counters and idle memory held by the pool."""
+        return {"reused": self.reused, "allocated": self.allocated, "idle_mb": round(self.idle_bytes / MB, 1)}
+
+
+# Shared pool for all media downloads
+buffer_pool = BufferPool()
+
+
+class _ViewReader(io.RawIOBase):
+    """Seekable read-only file over a memoryview, without copying it."""
+
+    def __init__(self, view: memoryview):
+        self._view = view
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        chunk = self._view[self._pos:self._pos + len(b)]
+        n = len(chunk)
+        b[:n] = chunk
+        self._pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+
+class MediaBuffer:
+    """Downloaded media held in a pooled bytearray, or in a spill file once it is large."""
+
+    def __init__(self, size_hint: Optional[int] = None, suffix: str = '',
+                 spill_threshold: int = SPILL_THRESHOLD, hashed: bool = False, pool: BufferPool = buffer_pool):
+        """
+        Args:
+            size_hint (int, optional): Expected size, e.g. Telegram's file_size
+            suffix (str): Extension for the spill file, for tools that go by it
+            spill_threshold (int): Size above which the content lives on disk; 0 always spills
+            hashed (bool): Compute the SHA-256 of the content as it is written
+            pool (BufferPool): Where in-memory buffers are borrowed from
+        """
+        self.size = 0
+        self.suffix = suffix
+        self.spill_threshold = spill_threshold
+        self._pool = pool
+        self._sha256 = hashlib.sha256() if hashed else None
+        self._memory: Optional[bytearray] = None
+        self._file = None
+        self._path: Optional[str] = None
+        self._mmap = None
+        self._views: list = []
+        self.closed = False
+        if size_hint is not None and size_hint > spill_threshold:
+            self._spill()
+
+    @property
+    def spilled(self) -> bool:
+        return self._path is not None
+
+    @property
+    def sha256(self) -> Optional[str]:
+        """Hex SHA-256 of the content, if the buffer was created with ``hashed=True``."""
+        return self._sha256.hexdigest() if self._sha256 else None
+
+    def _spill(self):
+        fd, self._path = tempfile.mkstemp(prefix='media-', suffix=self.suffix, dir=SPILL_DIR)
+        self._file = os.fdopen(fd, 'wb')
+        if self._memory is not None:
+            self._file.write(memoryview(self._memory)[:self.size])
+            # Views already handed out keep the memory until close
+            if not self._views:
+                self._pool.release(self._memory)
+                self._memory = None
+
+    def write(self, data) -> int:
+        """Append downloaded bytes, moving to a spill file past the threshold."""
+        if self.closed:
+            raise ValueError("write to closed MediaBuffer")
+        n = len(data)
+        if self._sha256 is not None:
+            self._sha256.update(data)
+        end = self.size + n
+        if self._file is None and end > self.spill_threshold:
+            self._spill()
+        if self._file is not None:
+            self._file.write(data)
+        else:
+            if self._memory is None or end > len(self._memory):
+                grown = self._pool.acquire(end)
+                if self._memory is not None:
+                    grown[:self.size] = memoryview(self._memory)[:self.size]
+                    self._pool.release(self._memory)
+                self._memory = grown
+            self._memory[self.size:end] = data
+        self.size = end
+        return n
+
+    def _finish_writing(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def view(self) -> memoryview:
+        """Read-only view of the content, valid until the buffer is closed."""
+        self._finish_writing()
+        if self._memory is not None:
+            view = memoryview(self._memory)[:self.size].toreadonly()
+        elif self.spilled and self.size:
+            if self._mmap is None:
+                with open(self._path, 'rb') as f:
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(self._mmap)
+        else:
+            view = memoryview(b'')
+        self._views.append(view)
+        return view
+
+    def open(self):
+        """Binary file object over the content, for APIs that read files."""
+        self._finish_writing()
+        if self.spilled:
+            return open(self._path, 'rb')
+        return io.BufferedReader(_ViewReader(self.view()))
+
+    def path(self) -> str:
+        """Path of a file holding the content, writing a spill file first if needed."""
+        if not self.spilled:
+            self._spill()
+        self._finish_writing()
+        return self._path
+
+    def close(self):
+        """Release views, return memory to the pool and delete any spill file."""
+        if self.closed:
+            return
+        self.closed = True
+        for view in self._views:
+            view.release()
+        self._views = []
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # A consumer still holds a slice; the mapping goes away with it
+                pass
+            self._mmap = None
+        if self._memory is not None:
+            self._pool.release(self._memory)
+            self._memory = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._path is not None:
+            try:
+                os.remove(self._path)
+            except OSError as e:
+                logger.warning(f"Could not remove spill file {self._path}: {str(e)}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        if not getattr(self, 'closed', True):
+            self.close()
+
+
+async def download_media(telegram_file, size_hint: Optional[int] = None, suffix: str = '',
+                         spill_threshold: int = SPILL_THRESHOLD, hashed: bool = False) -> MediaBuffer:
+    """
+    Download a Telegram file into a MediaBuffer.
+
+    Args:
+        telegram_file: ``telegram.File`` to download
+        size_hint (int, optional): Expected size; large files go straight to a spill file
+        suffix (str): Extension for a spill file
+        spill_threshold (int): Size above which the content lives on disk; 0 always spills
+        hashed (bool): Compute the SHA-256 of the content on the way in
+
+    Returns:
+        MediaBuffer: The content; the caller closes it
+    """
+    buffer = MediaBuffer(size_hint or getattr(telegram_file, 'file_size', None), suffix, spill_threshold, hashed)
+    try:
+        await telegram_file.download_to_memory(out=buffer)
+    except BaseException:
+        buffer.close()
+        raise
+    return buffer
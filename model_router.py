@@ -0,0 +1,340 @@
+"""Latency-aware model routing with fallback chains.
+
+Every model the bot uses is registered here with its provider, a quality
+tier and the request classes it can serve. The router keeps an EWMA of
+each model's latency and error rate, sends each request to the fastest
+healthy model that meets the class's quality tier, and walks the class's
+fallback chain when a model fails or times out. During a provider brownout
+traffic moves to the next model on its own.
+
+Attempts are bounded by the request deadline (see ``deadline``), and callers
+may opt into hedging: when an attempt outlives its model's p95 latency, the
+next model in the chain is started too and the first answer wins.
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+
+import deadline
+from deadline import DeadlineExceeded
+from rate_limiter import RateLimitExceeded
+from circuit_breaker import circuit_breakers, CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+# Request classes
+CHAT = "chat"
+TEXT_EDIT = "text_edit"
+PROMPT_ENHANCE = "prompt_enhance"
+CONVERSATION_SUMMARY = "conversation_summary"
+VISION = "vision"
+VIDEO = "video"
+TEXT_SUMMARY = "text_summary"
+
+# model -> provider and quality tier (higher is better)
+MODEL_REGISTRY = {
+    "llama3-70b-8192": {"provider": "groq", "tier": 3},
+    "mixtral-8x7b-32768": {"provider": "groq", "tier": 2},
+    "llama3-8b-8192": {"provider": "groq", "tier": 1},
+    "llama-3.2-90b-vision-preview": {"provider": "groq", "tier": 3},
+    "llama-3.2-11b-vision-preview": {"provider": "groq", "tier": 2},
+    "gemini-1.5-pro": {"provider": "gemini", "tier": 3},
+    "gemini-1.5-flash": {"provider": "gemini", "tier": 2},
+    "gemini-pro": {"provider": "gemini", "tier": 2},
+}
+
+# Fallback chain per request class, in order of preference
+FALLBACK_CHAINS = {
+    CHAT: ["llama3-70b-8192", "mixtral-8x7b-32768", "llama3-8b-8192"],
+    TEXT_EDIT: ["llama3-8b-8192", "mixtral-8x7b-32768", "llama3-70b-8192"],
+    PROMPT_ENHANCE: ["llama3-8b-8192", "mixtral-8x7b-32768", "llama3-70b-8192"],
+    CONVERSATION_SUMMARY: ["llama3-8b-8192", "mixtral-8x7b-32768"],
+    VISION: ["llama-3.2-11b-vision-preview", "llama-3.2-90b-vision-preview"],
+    VIDEO: ["gemini-1.5-flash", "gemini-1.5-pro"],
+    TEXT_SUMMARY: ["gemini-pro", "gemini-1.5-flash"],
+}
+
+# Minimum quality tier per request class
+MIN_TIERS = {
+    CHAT: 2,
+    TEXT_EDIT: 1,
+    PROMPT_ENHANCE: 1,
+    CONVERSATION_SUMMARY: 1,
+    VISION: 2,
+    VIDEO: 2,
+    TEXT_SUMMARY: 2,
+}
+
+# Per-attempt timeout per request class (time to first token for streams)
+CLASS_TIMEOUTS = {
+    CHAT: 30.0,
+    TEXT_EDIT: 30.0,
+    PROMPT_ENHANCE: 20.0,
+    CONVERSATION_SUMMARY: 30.0,
+    VISION: 45.0,
+    VIDEO: 300.0,
+    TEXT_SUMMARY: 60.0,
+}
+
+EWMA_ALPHA = 0.2
+UNHEALTHY_ERROR_RATE = 0.5
+COOLDOWN_AFTER_FAILURES = 2  # consecutive failures before a model is benched
+COOLDOWN_SECONDS = 30.0
+ERROR_RATE_HALF_LIFE = 60.0  # seconds; a demoted model recovers even if nothing calls it
+
+# Hedging: race a second model once the first exceeds its p95 latency
+HEDGING_ENABLED = os.getenv('HEDGE_REQUESTS', 'true').lower() in ('1', 'true', 'yes')
+LATENCY_SAMPLES = 100
+HEDGE_MIN_SAMPLES = 20
+
+_EMPTY = object()  # first-chunk marker for a stream that produced nothing
+
+
+class ModelStats:
+    """EWMA latency and error rate of one model."""
+
+    __slots__ = ('latency', '_error_rate', '_error_updated', 'consecutive_failures', 'cooldown_until',
+                 'calls', 'samples')
+
+    def __init__(self):
+        self.latency: Optional[float] = None
+        self.samples = deque(maxlen=LATENCY_SAMPLES)
+        self._error_rate = 0.0
+        self._error_updated = time.monotonic()
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.calls = 0
+
+    def record(self, latency: float, ok: bool):
+        self.calls += 1
+        if ok:
+            self.latency = latency if self.latency is None else (
+                EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.latency
+            )
+            self.samples.append(latency)
+            self.consecutive_failures = 0
+        else:
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= COOLDOWN_AFTER_FAILURES:
+                self.cooldown_until = time.monotonic() + COOLDOWN_SECONDS
+        error_rate = EWMA_ALPHA * (0.0 if ok else 1.0) + (1 - EWMA_ALPHA) * self.error_rate
+        self._error_rate, self._error_updated = error_rate, time.monotonic()
+
+    @property
+    def error_rate(self) -> float:
+        """EWMA error rate, decaying with time since the last call."""
+        elapsed = time.monotonic() - self._error_updated
+        return self._error_rate * 0.5 ** (elapsed / ERROR_RATE_HALF_LIFE)
+
+    def p95(self) -> Optional[float]:
+        """95th percentile of recent successful latencies, once there are enough samples."""
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def healthy(self) -> bool:
+        return self.error_rate < UNHEALTHY_ERROR_RATE and time.monotonic() >= self.cooldown_until
+
+
+class ModelRouter:
+    """Chooses models per request class and records how they perform."""
+
+    def __init__(self):
+        self._stats = {model: ModelStats() for model in MODEL_REGISTRY}
+
+    def stats_for(self, model: str) -> ModelStats:
+        stats = self._stats.get(model)
+        if stats is None:
+            stats = self._stats[model] = ModelStats()
+        return stats
+
+    def record(self, model: str, latency: float, ok: bool):
+        """Record the outcome of one call to a model."""
+        self.stats_for(model).record(latency, ok)
+
+    def route(self, request_class: str, preferred: Optional[str] = None, min_tier: Optional[int] = None) -> list:
+        """
+        Order the candidate models for a request.
+
+        Healthy models meeting the tier whose circuit breaker lets calls
+        through come first, fastest first (a user's preferred model leads if
+        it is healthy); then the rest of the fallback chain in its configured
+        order as a last resort.
+
+        Returns:
+            list: Model names to try in order
+        """
+        chain = list(FALLBACK_CHAINS.get(request_class, []))
+        if preferred and preferred not in chain:
+            chain.insert(0, preferred)
+        if min_tier is None:
+            min_tier = MIN_TIERS.get(request_class, 1)
+
+        def tier(model):
+            return MODEL_REGISTRY.get(model, {}).get("tier", min_tier)
+
+        def latency(model):
+            # Unmeasured models sort after measured ones, in chain order
+            value = self.stats_for(model).latency
+            return value if value is not None else float('inf')
+
+        def available(model):
+            provider = MODEL_REGISTRY.get(model, {}).get("provider")
+            return provider is None or circuit_breakers.get(provider, model).allows()
+
+        healthy = [m for m in chain if self.stats_for(m).healthy() and tier(m) >= min_tier and available(m)]
+        healthy.sort(key=lambda m: (m != preferred, latency(m), chain.index(m)))
+
+        rest = [m for m in chain if m not in healthy]
+        return healthy + rest
+
+    def _launch(self, model: str, start: Callable[[str], Awaitable[Any]], timeout: float) -> asyncio.Task:
+        # Each attempt gets the class timeout, cut short by the request deadline
+        timeout = deadline.budget(timeout)
+        return asyncio.ensure_future(asyncio.wait_for(start(model), timeout))
+
+    async def _first_success(self, request_class: str, models: list,
+                             start: Callable[[str], Awaitable[Any]], timeout: float, hedge: bool) -> tuple:
+        """
+        Run ``start(model)`` on the candidates in order until one succeeds.
+
+        With hedging, once the running attempt has taken longer than its
+        model's p95 latency the next candidate is started alongside it; the
+        first success wins and the other attempt is cancelled.
+
+        Returns:
+            tuple: (model, result, start time)
+        """
+        queue = list(models)
+        running: dict = {}  # task -> (model, start time)
+        last_error: Optional[BaseException] = None
+        try:
+            while queue or running:
+                if not running:
+                    model = queue.pop(0)
+                    running[self._launch(model, start, timeout)] = (model, time.monotonic())
+
+                hedge_after = None
+                if hedge and HEDGING_ENABLED and queue and len(running) == 1:
+                    (model, started), = running.values()
+                    p95 = self.stats_for(model).p95()
+                    if p95 is not None:
+                        hedge_after = max(0.0, started + p95 - time.monotonic())
+
+                done, _ = await asyncio.wait(running, timeout=hedge_after, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    model = queue.pop(0)
+                    logger.info(f"Hedging slow {request_class} request with {model}")
+                    running[self._launch(model, start, timeout)] = (model, time.monotonic())
+                    continue
+
+                for task in done:
+                    model, started = running.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        self.record(model, time.monotonic() - started, ok=True)
+                        return model, task.result(), started
+                    last_error = error
+                    if isinstance(error, (RateLimitExceeded, DeadlineExceeded, CircuitOpenError)):
+                        # Our own limiter, deadline or breaker said no; already accounted for
+                        continue
+                    self.record(model, time.monotonic() - started, ok=False)
+                    if isinstance(error, asyncio.TimeoutError):
+                        # The call only saw a cancellation, so its breaker didn't count the hang
+                        provider = MODEL_REGISTRY.get(model, {}).get("provider")
+                        if provider:
+                            circuit_breakers.get(provider, model).record_failure()
+                    logger.warning(f"Model {model} failed for {request_class}: {type(error).__name__}: {str(error)}")
+        finally:
+            for task in running:
+                task.cancel()
+
+        left = deadline.remaining()
+        if isinstance(last_error, asyncio.TimeoutError) and left is not None and left <= 0:
+            raise DeadlineExceeded()
+        raise last_error or RuntimeError(f"No model available for {request_class}")
+
+    async def call(self, request_class: str, fn: Callable[[str], Awaitable[Any]],
+                   preferred: Optional[str] = None, min_tier: Optional[int] = None,
+                   timeout: Optional[float] = None, hedge: bool = False) -> Any:
+        """
+        Call ``fn(model)`` on the best model, falling back along the chain on failure.
+
+        Args:
+            request_class (str): One of the request classes above
+            fn (callable): Coroutine function taking the model name
+            preferred (str, optional): Model to try first if it is healthy
+            min_tier (int, optional): Override of the class's minimum quality tier
+            timeout (float, optional): Per-attempt timeout, bounded by the request deadline
+            hedge (bool): Race a second model once the first is slower than its p95
+
+        Raises:
+            The last error if every candidate failed.
+        """
+        timeout = timeout or CLASS_TIMEOUTS.get(request_class, 60.0)
+        _, result, _ = await self._first_success(
+            request_class, self.route(request_class, preferred, min_tier), fn, timeout, hedge
+        )
+        return result
+
+    async def stream(self, request_class: str, fn: Callable[[str], Any],
+                     preferred: Optional[str] = None, min_tier: Optional[int] = None,
+                     timeout: Optional[float] = None, hedge: bool = False):
+        """
+        Stream from ``fn(model)`` (an async iterator), falling back only until the first chunk.
+
+        Hedging races the first chunk; once a model has produced output,
+        later errors are raised to the caller.
+        """
+        timeout = timeout or CLASS_TIMEOUTS.get(request_class, 60.0)
+        iterators: dict = {}
+
+        async def first_chunk(model):
+            iterators[model] = fn(model).__aiter__()
+            try:
+                return await iterators[model].__anext__()
+            except StopAsyncIteration:
+                return _EMPTY
+
+        model, first, started = await self._first_success(
+            request_class, self.route(request_class, preferred, min_tier), first_chunk, timeout, hedge
+        )
+
+        # Release streams that lost a hedged race
+        for other, iterator in iterators.items():
+            if other != model and hasattr(iterator, 'aclose'):
+                try:
+                    await iterator.aclose()
+                except Exception:
+                    pass
+
+        # Latency is measured to the first token, which is what users feel
+        if first is _EMPTY:
+            return
+        iterator = iterators[model]
+        yield first
+        try:
+            async for chunk in iterator:
+                yield chunk
+        except Exception:
+            self.record(model, time.monotonic() - started, ok=False)
+            raise
+
+    def stats(self) -> dict:
+        """Snapshot of per-model statistics."""
+        return {
+            model: {
+                "latency": round(s.latency, 3) if s.latency is not None else None,
+                "error_rate": round(s.error_rate, 3),
+                "healthy": s.healthy(),
+            }
+            for model, s in self._stats.items()
+        }
+
+
+# Shared router for all upstream calls
+model_router = ModelRouter()
@@ -0,0 +1,175 @@
+"""Perceptual-hash index for reusing vision results across near-duplicate photos.
+
+A resized or re-compressed copy of an image gets a new Telegram
+``file_unique_id``, so the exact vision cache misses it. Every analyzed
+photo is therefore also fingerprinted with a 64-bit difference hash (dHash)
+and kept in this index with the results computed for it.
+
+Hashes live in one packed ``uint64`` array. Lookups use multi-index
+hashing: the hash is split into four 16-bit chunks, and by the pigeonhole
+principle any hash within Hamming distance ``r`` of the query matches it in
+at least one chunk to within ``r // 4`` bits. Probing those few chunk values
+in four bucket tables yields a small candidate set, whose exact distances
+are computed in one vectorized pass, so a lookup touches a few hundred
+entries even with a million images indexed.
+"""
+import io
+import os
+import logging
+from array import array
+from itertools import combinations
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from singleflight import prompt_hash
+
+logger = logging.getLogger(__name__)
+
+# Perceptual index settings (overridable from .env)
+PHASH_MAX_DISTANCE = int(os.getenv('PHASH_MAX_DISTANCE', '6'))  # differing bits still counted as the same image
+PHASH_INDEX_SIZE = int(os.getenv('PHASH_INDEX_SIZE', '1000000'))
+INITIAL_CAPACITY = 1024
+
+CHUNKS = 4
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+# Bits set in every byte value, for popcounts without np.bitwise_count
+_POPCOUNT8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def dhash(image: bytes) -> int:
+    """
+    Compute the 64-bit difference hash of an image.
+
+    The image is reduced to a 9x8 grayscale thumbnail and each bit records
+    whether a pixel is brighter than its right-hand neighbour, which survives
+    rescaling and re-compression.
+    """
+    with Image.open(io.BytesIO(image)) as img:
+        pixels = np.asarray(img.convert('L').resize((9, 8), Image.Resampling.LANCZOS), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming(hashes: np.ndarray, query: int) -> np.ndarray:
+    """Hamming distance from ``query`` to every hash in a uint64 array."""
+    diff = np.bitwise_xor(hashes, np.uint64(query))
+    return _POPCOUNT8[diff.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def _chunks(value: int) -> list:
+    return [(value >> (i * CHUNK_BITS)) & CHUNK_MASK for i in range(CHUNKS)]
+
+
+class PerceptualIndex:
+    """Multi-index-hashing table of image dHashes -> vision results."""
+
+    def __init__(self, max_distance: int = PHASH_MAX_DISTANCE, max_entries: int = PHASH_INDEX_SIZE):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        capacity = min(INITIAL_CAPACITY, max_entries)
+        self._hashes = np.zeros(capacity, dtype=np.uint64)
+        self._results: list = [None] * capacity  # slot -> {(action, prompt hash): result}
+        self._tables = [dict() for _ in range(CHUNKS)]  # chunk value -> array of slots
+        self._slot_of: dict = {}  # exact hash -> slot
+        self._size = 0
+        self._next = 0  # oldest slot, overwritten once the index is full
+
+        # Chunk values within r // CHUNKS bits of a chunk, as XOR masks
+        radius = min(max_distance // CHUNKS, CHUNK_BITS)
+        self._probe_masks = [
+            sum(1 << bit for bit in flipped)
+            for r in range(radius + 1)
+            for flipped in combinations(range(CHUNK_BITS), r)
+        ]
+
+    def _candidates(self, query: int) -> np.ndarray:
+        """Slots sharing a near-identical chunk with the query."""
+        buckets = []
+        for table, chunk in zip(self._tables, _chunks(query)):
+            for mask in self._probe_masks:
+                bucket = table.get(chunk ^ mask)
+                if bucket:
+                    buckets.append(np.frombuffer(bucket, dtype=np.uint32))
+        if not buckets:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(buckets)).astype(np.int64)
+
+    def lookup(self, query: int, action: str, prompt: str) -> Optional[str]:
+        """
+        Find a result computed for a near-duplicate image.
+
+        Args:
+            query (int): dHash of the image
+            action (str): Kind of result, e.g. "describe" or "caption"
+            prompt (str): Prompt the result was generated with
+
+        Returns:
+            str or None: The result for the closest image within ``max_distance``
+        """
+        key = (action, prompt_hash(prompt))
+        slots = self._candidates(query)
+        if len(slots):
+            distances = hamming(self._hashes[slots], query)
+            for i in np.argsort(distances, kind='stable'):
+                if distances[i] > self.max_distance:
+                    break
+                result = self._results[slots[i]].get(key)
+                if result is not None:
+                    self.hits += 1
+                    logger.info(f"Perceptual index hit for {action} at distance {int(distances[i])}")
+                    return result
+        self.misses += 1
+        return None
+
+    def add(self, image_hash: int, action: str, prompt: str, result: str):
+        """Record a vision result for an image, evicting the oldest image when full."""
+        slot = self._slot_of.get(image_hash)
+        if slot is None:
+            slot = self._free_slot()
+            self._hashes[slot] = np.uint64(image_hash)
+            self._results[slot] = {}
+            self._slot_of[image_hash] = slot
+            for table, chunk in zip(self._tables, _chunks(image_hash)):
+                table.setdefault(chunk, array('I')).append(slot)
+        self._results[slot][(action, prompt_hash(prompt))] = result
+
+    def _free_slot(self) -> int:
+        if self._size < self.max_entries:
+            if self._size == len(self._hashes):
+                self._grow()
+            self._size += 1
+            return self._size - 1
+
+        # Full: reuse the oldest slot
+        slot = self._next
+        self._next = (self._next + 1) % self.max_entries
+        old_hash = int(self._hashes[slot])
+        del self._slot_of[old_hash]
+        for table, chunk in zip(self._tables, _chunks(old_hash)):
+            bucket = table[chunk]
+            bucket.remove(slot)
+            if not bucket:
+                del table[chunk]
+        return slot
+
+    def _grow(self):
+        capacity = min(len(self._hashes) * 2, self.max_entries)
+        hashes = np.zeros(capacity, dtype=np.uint64)
+        hashes[:self._size] = self._hashes[:self._size]
+        self._hashes = hashes
+        self._results.extend([None] * (capacity - len(self._results)))
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the number of indexed images."""
+        return {"hits": self.hits, "misses": self.misses, "size": self._size}
+
+
+# Shared index over every photo the bot analyzes
+perceptual_index = PerceptualIndex()
@@ -0,0 +1,73 @@
+"""Speculative prefetching of the likely next request.
+
+When a photo arrives the user almost always asks for a description next, so
+the bot can start that work before the button is clicked. A prefetch runs
+through the single-flight table, so the real request simply joins it (or
+finds its result in the cache). Prefetches only start while the job class
+has spare capacity, and are cancelled once they go stale, i.e. when they
+are superseded by a newer one or nobody asked for them in time.
+"""
+import os
+import asyncio
+import logging
+from typing import Awaitable, Callable, Hashable, Optional
+
+from deadline import deadline_scope
+from scheduler import scheduler, JOB_CLASS_DEADLINES
+from singleflight import upstream_flight
+
+logger = logging.getLogger(__name__)
+
+# Prefetch settings (overridable from .env)
+SPECULATIVE_PREFETCH = os.getenv('SPECULATIVE_PREFETCH', 'false').lower() in ('1', 'true', 'yes')
+PREFETCH_TTL = float(os.getenv('PREFETCH_TTL', '120'))  # seconds before an unused prefetch is dropped
+
+
+class Prefetch:
+    """One speculative job, cancelled if it is still running after ``ttl`` seconds."""
+
+    def __init__(self, flight_key: Hashable, task: asyncio.Task, ttl: float = PREFETCH_TTL):
+        self.flight_key = flight_key
+        self.task = task
+        self._timer = asyncio.get_running_loop().call_later(ttl, self.cancel)
+
+    def cancel(self):
+        """Drop the prefetch unless a real request has joined its upstream work."""
+        self._timer.cancel()
+        if self.task.done():
+            return
+        self.task.cancel()
+        # Once the task has unwound, stop the upstream work too if nobody else is waiting on it
+        self.task.add_done_callback(lambda _: upstream_flight.abandon(self.flight_key))
+
+
+def start_prefetch(user_id: int, job_class: str, flight_key: Hashable,
+                   fn: Callable[..., Awaitable], *args) -> Optional[Prefetch]:
+    """
+    Run ``fn(*args)`` speculatively under ``flight_key`` if the job class has a free slot.
+
+    Args:
+        user_id (int): Telegram user the work is for
+        job_class (str): Scheduler job class whose capacity the prefetch uses
+        flight_key: Single-flight key the real request will use for the same work
+        fn (callable): Coroutine function doing the work
+
+    Returns:
+        Prefetch or None: The running prefetch, or None if it was not started
+    """
+    if not SPECULATIVE_PREFETCH or not scheduler.has_capacity(job_class):
+        return None
+
+    async def run():
+        try:
+            return await scheduler.run(user_id, job_class, lambda: upstream_flight.do(flight_key, fn, *args))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Nobody asked for this yet; the real request will retry and report errors
+            logger.info(f"Prefetch {flight_key!r} failed: {str(e)}")
+            return None
+
+    with deadline_scope(JOB_CLASS_DEADLINES[job_class]):
+        task = asyncio.create_task(run())
+    return Prefetch(flight_key, task)
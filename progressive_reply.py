@@ -0,0 +1,169 @@
+"""Progressive Telegram replies for streamed model output.
+
+Instead of waiting for a full completion, a placeholder message is sent
+right away and then edited with the accumulated text on a debounced
+schedule that stays within Telegram's edit limits.
+"""
+import os
+import time
+import asyncio
+import logging
+
+from telegram.error import BadRequest, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Edit schedule (overridable from .env)
+STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', '0.7'))  # seconds between edits
+STREAM_EDIT_MIN_CHARS = int(os.getenv('STREAM_EDIT_MIN_CHARS', '120'))  # edit early after this many new chars
+STREAM_MIN_EDIT_GAP = 0.3  # never edit the same message faster than this
+STREAM_CHAT_REPLIES = os.getenv('STREAM_CHAT_REPLIES', 'true').lower() == 'true'
+
+# Telegram rejects messages longer than 4096 characters
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+DEFAULT_PLACEHOLDER = "💭 Thinking..."
+CURSOR = " ▌"  # shown at the end of a reply while it is still streaming
+
+
+def split_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> list:
+    """Split a text into message-sized chunks, preferring to break at line ends."""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind('\n', limit // 2, limit)
+        if cut == -1:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip('\n')
+    if text or not chunks:
+        chunks.append(text)
+    return chunks
+
+
+async def reply_in_chunks(message, text: str, **kwargs):
+    """Reply to a message with a text of any length, split across messages at Telegram's limit."""
+    for chunk in split_message(text):
+        await message.reply_text(chunk, **kwargs)
+
+
+class ProgressiveReply:
+    """Accumulates streamed text and mirrors it into a Telegram message."""
+
+    def __init__(self, message, sent_message=None, interval: float = STREAM_EDIT_INTERVAL,
+                 min_chars: int = STREAM_EDIT_MIN_CHARS):
+        self.message = message  # Message being replied to
+        self.sent_message = sent_message  # Message that receives the edits
+        self.interval = interval
+        self.min_chars = min_chars
+        self.text = ""  # Full accumulated reply
+        self._offset = 0  # Start of the part shown in the current message
+        self._shown = ""  # What the current message displays right now
+        self._last_edit = 0.0
+        self._blocked_until = 0.0
+
+    async def start(self, placeholder: str = DEFAULT_PLACEHOLDER):
+        """Send the placeholder message unless one was attached already."""
+        if self.sent_message is None:
+            self.sent_message = await self.message.reply_text(placeholder)
+        self._last_edit = time.monotonic()
+        return self.sent_message
+
+    async def append(self, delta: str):
+        """Add a streamed chunk and edit the message if the schedule allows."""
+        if not delta:
+            return
+        self.text += delta
+
+        now = time.monotonic()
+        if now < self._blocked_until:
+            return
+
+        pending = len(self.text) - self._offset - len(self._shown)
+        elapsed = now - self._last_edit
+        if elapsed >= self.interval or (pending >= self.min_chars and elapsed >= STREAM_MIN_EDIT_GAP):
+            await self._flush(final=False)
+
+    async def finish(self, final_text: str = None, **kwargs) -> str:
+        """
+        Write the complete reply into the message(s).
+
+        Args:
+            final_text (str, optional): Replace the text of the live message with this
+            **kwargs: Extra arguments for the final edit (e.g. parse_mode)
+
+        Returns:
+            str: The full reply text
+        """
+        if final_text is not None:
+            # Earlier, already frozen messages stay as they are
+            self.text = self.text[:self._offset] + final_text
+        if not self.text:
+            self.text = "..."
+        await self._flush(final=True, **kwargs)
+        return self.text
+
+    async def _flush(self, final: bool, **kwargs):
+        """Edit the current message, rolling over to a new one past the length limit."""
+        while len(self.text) - self._offset > TELEGRAM_MESSAGE_LIMIT:
+            # Freeze the current message at the limit and continue in a new one
+            chunk = self.text[self._offset:self._offset + TELEGRAM_MESSAGE_LIMIT]
+            await self._edit(chunk, force=True)
+            self._offset += TELEGRAM_MESSAGE_LIMIT
+            self.sent_message = await self.message.reply_text(
+                self.text[self._offset:self._offset + TELEGRAM_MESSAGE_LIMIT]
+            )
+            self._shown = self.text[self._offset:self._offset + TELEGRAM_MESSAGE_LIMIT]
+            self._last_edit = time.monotonic()
+
+        visible = self.text[self._offset:]
+        if final:
+            await self._edit(visible, force=True, **kwargs)
+            return
+        # Leave the cursor off when it would push a full message past the limit
+        if len(visible) + len(CURSOR) <= TELEGRAM_MESSAGE_LIMIT:
+            visible += CURSOR
+        if visible != self._shown:
+            await self._edit(visible, force=False)
+
+    async def _edit(self, text: str, force: bool, **kwargs):
+        """Edit the current message, honouring flood-control waits."""
+        for _ in range(3):
+            try:
+                await self.sent_message.edit_text(text, **kwargs)
+                self._shown = text
+                break
+            except RetryAfter as e:
+                wait = float(e.retry_after)
+                self._blocked_until = time.monotonic() + wait
+                if not force:
+                    break
+                logger.warning(f"Telegram flood control, retrying edit in {wait}s")
+                await asyncio.sleep(wait)
+            except BadRequest as e:
+                if "not modified" in str(e).lower():
+                    break
+                if kwargs.get('parse_mode'):
+                    # Fall back to plain text if the final markup is rejected
+                    kwargs.pop('parse_mode')
+                    continue
+                raise
+        self._last_edit = time.monotonic()
+
+
+async def stream_reply(message, chunks, placeholder: str = DEFAULT_PLACEHOLDER) -> str:
+    """
+    Reply to a message with text streamed from an async iterator of chunks.
+
+    Args:
+        message: Telegram message to reply to
+        chunks: Async iterator yielding text deltas
+        placeholder (str): Text shown until the first tokens arrive
+
+    Returns:
+        str: The full reply text
+    """
+    reply = ProgressiveReply(message)
+    await reply.start(placeholder)
+    async for delta in chunks:
+        await reply.append(delta)
+    return await reply.finish()
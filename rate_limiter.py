@@ -0,0 +1,180 @@
+"""Client-side token-bucket rate limiting for upstream AI providers.
+
+Each (provider, model, API key) gets two buckets: requests per minute and
+tokens per minute. Requests reserve capacity before calling the provider
+and either wait briefly for it or fail fast when the wait would exceed the
+caller's budget, instead of calling anyway and surfacing a 429 to the user.
+Token reservations use an estimate and are corrected with the actual usage
+once the response arrives.
+"""
+import time
+import asyncio
+import hashlib
+import logging
+from typing import Optional
+
+import deadline
+
+logger = logging.getLogger(__name__)
+
+# (requests per minute, tokens per minute) per provider and model; None = unlimited
+PROVIDER_LIMITS = {
+    "groq": {
+        "llama3-70b-8192": (30, 6000),
+        "llama3-8b-8192": (30, 30000),
+        "mixtral-8x7b-32768": (30, 5000),
+        "llama-3.2-11b-vision-preview": (30, 7000),
+        "llama-3.2-90b-vision-preview": (15, 7000),
+        "whisper-large-v3": (20, None),
+        "default": (30, 6000),
+    },
+    "together": {
+        "black-forest-labs/FLUX.1-schnell-Free": (6, None),
+        "default": (60, None),
+    },
+    "gemini": {
+        "gemini-1.5-flash": (15, 1000000),
+        "gemini-1.5-pro": (2, 32000),
+        "gemini-pro": (15, 32000),
+        "default": (15, 32000),
+    },
+}
+
+# How long a caller may wait for capacity outside any request deadline
+DEFAULT_MAX_WAIT = 5.0
+
+
+class RateLimitExceeded(Exception):
+    """Raised when capacity won't be available within the caller's wait budget."""
+
+    def __init__(self, provider: str, model: str, retry_after: float):
+        self.provider = provider
+        self.model = model
+        self.retry_after = retry_after
+        super().__init__(
+            f"⏳ Too many requests to the AI service right now. "
+            f"Please try again in {max(1, int(retry_after + 0.999))}s."
+        )
+
+
+class TokenBucket:
+    """Continuously refilling bucket that may go negative for reservations."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0  # units per second
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay_for(self, amount: float) -> float:
+        """Seconds until ``amount`` units can be taken."""
+        self._refill()
+        amount = min(amount, self.capacity)  # oversize requests only need a full bucket
+        deficit = amount - self.tokens
+        return deficit / self.rate if deficit > 0 else 0.0
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= amount
+
+    def drain(self, seconds: float):
+        """Empty the bucket so nothing is allowed for ``seconds``."""
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class Reservation:
+    """Capacity taken for one upstream call."""
+
+    __slots__ = ('key', 'tokens')
+
+    def __init__(self, key: tuple, tokens: int):
+        self.key = key
+        self.tokens = tokens
+
+
+class RateLimiter:
+    """Token buckets per provider, model and API key."""
+
+    def __init__(self, limits: dict = None):
+        self.limits = limits or PROVIDER_LIMITS
+        self._buckets: dict = {}
+
+    def _key(self, provider: str, model: str, api_key: Optional[str]) -> tuple:
+        # Never keep raw API keys around as dictionary keys
+        fingerprint = hashlib.sha256((api_key or "").encode('utf-8')).hexdigest()[:12]
+        return provider, model, fingerprint
+
+    def _buckets_for(self, key: tuple) -> tuple:
+        buckets = self._buckets.get(key)
+        if buckets is None:
+            provider, model, _ = key
+            provider_limits = self.limits.get(provider, {})
+            rpm, tpm = provider_limits.get(model, provider_limits.get("default", (None, None)))
+            buckets = (TokenBucket(rpm) if rpm else None, TokenBucket(tpm) if tpm else None)
+            self._buckets[key] = buckets
+        return buckets
+
+    async def acquire(self, provider: str, model: str, api_key: Optional[str] = None,
+                      estimated_tokens: int = 0, max_wait: Optional[float] = None) -> Reservation:
+        """
+        Reserve one request and ``estimated_tokens`` tokens, waiting up to ``max_wait`` seconds.
+
+        The wait is also bounded by the current request deadline; without
+        ``max_wait`` it may use whatever time the deadline leaves.
+
+        Raises:
+            RateLimitExceeded: If the reservation can't be honoured in time
+        """
+        left = deadline.remaining()
+        if left is None:
+            max_wait = DEFAULT_MAX_WAIT if max_wait is None else max_wait
+        else:
+            # Leave the call itself some of the remaining time
+            max_wait = max(0.0, left / 2 if max_wait is None else min(max_wait, left / 2))
+
+        key = self._key(provider, model, api_key)
+        requests, tokens = self._buckets_for(key)
+
+        delay = max(
+            requests.delay_for(1) if requests else 0.0,
+            tokens.delay_for(estimated_tokens) if tokens and estimated_tokens else 0.0
+        )
+        if delay > max_wait:
+            logger.warning(f"Rate limit for {provider}/{model}: need {delay:.1f}s, budget {max_wait:.1f}s")
+            raise RateLimitExceeded(provider, model, delay)
+
+        # Reserve now so concurrent callers queue up behind us
+        if requests:
+            requests.take(1)
+        if tokens and estimated_tokens:
+            tokens.take(estimated_tokens)
+
+        if delay > 0:
+            logger.info(f"Waiting {delay:.2f}s for {provider}/{model} capacity")
+            await asyncio.sleep(delay)
+        return Reservation(key, estimated_tokens)
+
+    def settle(self, reservation: Reservation, actual_tokens: Optional[int]):
+        """Correct a reservation with the tokens the provider actually billed."""
+        if reservation is None or actual_tokens is None:
+            return
+        _, tokens = self._buckets_for(reservation.key)
+        if tokens:
+            tokens.take(actual_tokens - reservation.tokens)
+
+    def penalize(self, provider: str, model: str, api_key: Optional[str], retry_after: float):
+        """Block a bucket after the provider answered 429 anyway."""
+        requests, tokens = self._buckets_for(self._key(provider, model, api_key))
+        for bucket in (requests, tokens):
+            if bucket:
+                bucket.drain(retry_after)
+
+
+# Shared limiter for all upstream calls
+rate_limiter = RateLimiter()
@@ -0,0 +1,113 @@
+"""In-memory LRU cache with TTL for model responses.
+
+Used in front of the chat gateway so identical, context-free prompts
+("hi", "what can you do", FAQ questions) are answered without a model
+round trip, and in front of the vision models so a forwarded photo is
+described or captioned only once.
+"""
+import os
+import re
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Chat cache settings (overridable from .env)
+CHAT_CACHE_SIZE = int(os.getenv('CHAT_CACHE_SIZE', '2048'))
+CHAT_CACHE_TTL = int(os.getenv('CHAT_CACHE_TTL', '3600'))  # seconds
+CHAT_CACHE_MAX_PROMPT_CHARS = 500  # longer prompts are unlikely to repeat exactly
+
+# Vision cache settings (overridable from .env)
+VISION_CACHE_SIZE = int(os.getenv('VISION_CACHE_SIZE', '4096'))
+VISION_CACHE_TTL = int(os.getenv('VISION_CACHE_TTL', '86400'))  # seconds
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+class TTLCache:
+    """Size-bounded LRU cache whose entries expire after a fixed TTL."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for key, or None if missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store a value, evicting the least recently used entries past the size bound."""
+        self._entries[key] = (time.monotonic() + (ttl if ttl is not None else self.ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove a key and return its value."""
+        entry = self._entries.pop(key, None)
+        return entry[1] if entry else default
+
+    def clear(self):
+        """Remove all entries."""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the current size."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+
+def normalize_prompt(text: str) -> str:
+    """Normalize a prompt so trivial variations share a cache entry."""
+    text = _WHITESPACE_RE.sub(" ", text.strip().lower())
+    return text.rstrip("!?.。 ")
+
+
+def chat_cache_key(model: str, prompt: str, temperature: float, system_prompt: str) -> str:
+    """Build the cache key for a chat completion."""
+    raw = "\x1f".join([model, normalize_prompt(prompt), f"{temperature:.2f}", system_prompt or ""])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def vision_cache_key(file_unique_id: str, action: str, prompt: str) -> tuple:
+    """Build the cache key for a vision result on a Telegram photo."""
+    return file_unique_id, action, hashlib.sha256((prompt or "").encode('utf-8')).hexdigest()[:16]
+
+
+def is_cacheable_prompt(prompt: str) -> bool:
+    """Only short prompts are worth caching exactly."""
+    return bool(prompt) and len(prompt) <= CHAT_CACHE_MAX_PROMPT_CHARS
+
+
+# Shared cache for context-free chat turns
+chat_response_cache = TTLCache(max_entries=CHAT_CACHE_SIZE, ttl=CHAT_CACHE_TTL)
+
+# Shared cache for describe/caption results, keyed by vision_cache_key
+vision_result_cache = TTLCache(max_entries=VISION_CACHE_SIZE, ttl=VISION_CACHE_TTL)
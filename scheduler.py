@@ -0,0 +1,212 @@
+"""Per-user fair scheduling for update handlers.
+
+``concurrent_updates(True)`` lets any number of handlers run at once, so one
+user spamming /analyze_video or /imagine could take every connection and all
+upstream quota. Handlers are instead run through a scheduler that
+
+* splits work into job classes (light chat/status, media analysis, heavy
+  video/image generation), each with its own concurrency limit so heavy work
+  can never starve light commands,
+* caps the number of in-flight jobs per user in every class, and
+* orders waiting jobs with start-time fair queuing across users, so a user
+  with ten queued jobs doesn't delay someone else's first one.
+"""
+import os
+import asyncio
+import logging
+import itertools
+from collections import defaultdict
+from functools import wraps
+from typing import Awaitable, Callable, Optional
+
+from deadline import deadline_scope, DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+# Job classes
+LIGHT = "light"
+MEDIA = "media"
+HEAVY = "heavy"
+
+# (max concurrent jobs, max in-flight jobs per user) per job class
+JOB_CLASS_LIMITS = {
+    LIGHT: (int(os.getenv('SCHEDULER_LIGHT_CONCURRENCY', '32')), 2),
+    MEDIA: (int(os.getenv('SCHEDULER_MEDIA_CONCURRENCY', '8')), 2),
+    HEAVY: (int(os.getenv('SCHEDULER_HEAVY_CONCURRENCY', '3')), 1),
+}
+
+# Seconds from update arrival until a job's upstream calls give up, per job class
+JOB_CLASS_DEADLINES = {
+    LIGHT: float(os.getenv('DEADLINE_LIGHT', '60')),
+    MEDIA: float(os.getenv('DEADLINE_MEDIA', '90')),
+    HEAVY: float(os.getenv('DEADLINE_HEAVY', '600')),
+}
+
+# Jobs a single user may have waiting in one class before new ones are rejected
+MAX_QUEUED_PER_USER = 5
+
+
+class QueueFullError(Exception):
+    """Raised when a user already has too many jobs waiting."""
+
+
+class _Job:
+    __slots__ = ('user_id', 'start_tag', 'finish_tag', 'seq', 'future')
+
+    def __init__(self, user_id, start_tag, finish_tag, seq, future):
+        self.user_id = user_id
+        self.start_tag = start_tag
+        self.finish_tag = finish_tag
+        self.seq = seq
+        self.future = future
+
+
+class _JobClass:
+    """Scheduling state of one job class."""
+
+    def __init__(self, capacity: int, per_user: int):
+        self.capacity = capacity
+        self.per_user = per_user
+        self.running = 0
+        self.user_running = defaultdict(int)
+        self.user_finish = defaultdict(float)  # last finish tag handed out per user
+        self.virtual_time = 0.0
+        self.waiting: list = []
+
+
+class FairScheduler:
+    """Weighted fair queuing of jobs across users with per-class concurrency caps."""
+
+    def __init__(self, limits: dict = None):
+        limits = limits or JOB_CLASS_LIMITS
+        self._classes = {name: _JobClass(capacity, per_user) for name, (capacity, per_user) in limits.items()}
+        self._seq = itertools.count()
+
+    async def run(self, user_id: int, job_class: str, fn: Callable[[], Awaitable],
+                  weight: float = 1.0, on_queued: Optional[Callable[[int], Awaitable]] = None):
+        """
+        Run ``fn()`` once the user's turn in the job class comes up.
+
+        Args:
+            user_id (int): Telegram user the job belongs to
+            job_class (str): One of LIGHT, MEDIA or HEAVY
+            fn (callable): Coroutine function doing the work
+            weight (float): Share of the class this user gets relative to others
+            on_queued (callable, optional): Awaited with the queue position if the job has to wait
+
+        Returns:
+            Whatever ``fn()`` returns.
+        """
+        state = self._classes[job_class]
+        if sum(1 for job in state.waiting if job.user_id == user_id) >= MAX_QUEUED_PER_USER:
+            raise QueueFullError(f"Too many {job_class} requests waiting for user {user_id}")
+
+        start_tag = max(state.virtual_time, state.user_finish[user_id])
+        finish_tag = start_tag + 1.0 / weight
+        state.user_finish[user_id] = finish_tag
+        job = _Job(user_id, start_tag, finish_tag, next(self._seq), asyncio.get_running_loop().create_future())
+
+        state.waiting.append(job)
+        self._dispatch(state)
+
+        if not job.future.done():
+            if on_queued:
+                try:
+                    await on_queued(self._position(state, job))
+                except Exception as e:
+                    logger.warning(f"Failed to send queue position: {str(e)}")
+            try:
+                await job.future
+            except asyncio.CancelledError:
+                if job in state.waiting:
+                    state.waiting.remove(job)
+                elif job.future.done() and not job.future.cancelled():
+                    self._release(state, job)
+                raise
+
+        try:
+            return await fn()
+        finally:
+            self._release(state, job)
+
+    def _dispatch(self, state: _JobClass):
+        """Start waiting jobs in fair order while the class has free slots."""
+        while state.running < state.capacity and state.waiting:
+            eligible = [job for job in state.waiting if state.user_running[job.user_id] < state.per_user]
+            if not eligible:
+                break
+            job = min(eligible, key=lambda j: (j.finish_tag, j.seq))
+            state.waiting.remove(job)
+            state.virtual_time = max(state.virtual_time, job.start_tag)
+            state.running += 1
+            state.user_running[job.user_id] += 1
+            job.future.set_result(None)
+
+    def _release(self, state: _JobClass, job: _Job):
+        state.running -= 1
+        state.user_running[job.user_id] -= 1
+        if state.user_running[job.user_id] <= 0:
+            del state.user_running[job.user_id]
+        if not state.waiting and state.running == 0:
+            # Idle: forget per-user history so tags don't grow forever
+            state.user_finish.clear()
+            state.virtual_time = 0.0
+        self._dispatch(state)
+
+    def _position(self, state: _JobClass, job: _Job) -> int:
+        """1-based position of a waiting job in dispatch order."""
+        return 1 + sum(1 for other in state.waiting if (other.finish_tag, other.seq) < (job.finish_tag, job.seq))
+
+    def has_capacity(self, job_class: str) -> bool:
+        """Check whether a job of this class would start immediately."""
+        state = self._classes[job_class]
+        return state.running < state.capacity and not state.waiting
+
+    def stats(self) -> dict:
+        """Running and waiting job counts per class."""
+        return {
+            name: {"running": state.running, "waiting": len(state.waiting), "capacity": state.capacity}
+            for name, state in self._classes.items()
+        }
+
+
+# Shared scheduler for all handlers
+scheduler = FairScheduler()
+
+
+def scheduled(job_class: str):
+    """
+    Decorator that runs a Telegram handler through the fair scheduler.
+
+    Users whose job has to wait are told their queue position. The job's
+    deadline starts when the update arrives, so queueing time counts against it.
+    """
+    def decorator(callback):
+        @wraps(callback)
+        async def wrapper(update, context):
+            user = getattr(update, 'effective_user', None)
+            if user is None:
+                return await callback(update, context)
+
+            message = getattr(update, 'effective_message', None)
+
+            async def notify(position: int):
+                if message:
+                    await message.reply_text(
+                        f"⏳ The bot is busy right now. You're #{position} in the queue, "
+                        "your request will start automatically."
+                    )
+
+            try:
+                with deadline_scope(JOB_CLASS_DEADLINES[job_class]):
+                    return await scheduler.run(user.id, job_class, lambda: callback(update, context), on_queued=notify)
+            except QueueFullError:
+                if message:
+                    await message.reply_text(
+                        "🚦 You already have several requests waiting. Please wait for them to finish."
+                    )
+            except DeadlineExceeded as e:
+                if message:
+                    await message.reply_text(str(e))
+        return wrapper
+    return decorator
@@ -0,0 +1,245 @@
+"""Local semantic cache for near-duplicate chat prompts.
+
+Prompts are reduced to their content words (everything but stopwords) and
+embedded with a hashing vectorizer (signed feature hashing of those words
+and their bigrams into a 2**20-bucket space, sublinear TF and a running
+IDF) written in NumPy. Embeddings are stored sparsely, one (indices, values)
+pair per cached prompt, so the large hashed space costs nothing per entry.
+
+Hashing alone can't tell "capital of Taiwan" from "capital of France" once
+their distinctive words share a bucket, so a cached answer is only a
+candidate if its prompt has exactly the same set of content words as the
+query; the bigrams then tell different word orders apart. Cached prompts
+are grouped by their word set and a lookup scores only the query's group,
+which keeps it well under a millisecond however many prompts are cached.
+"""
+import os
+import re
+import time
+import zlib
+import logging
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Semantic cache settings (overridable from .env)
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.92'))
+SEMANTIC_CACHE_SIZE = int(os.getenv('SEMANTIC_CACHE_SIZE', '100000'))
+SEMANTIC_CACHE_TTL = int(os.getenv('SEMANTIC_CACHE_TTL', '3600'))  # seconds
+SEMANTIC_CACHE_DIM = 1 << 20
+INITIAL_CAPACITY = 1024
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Words that may differ between paraphrases of the same question
+STOPWORDS = frozenset("""
+a an the and or but if then so of to in on at by for with about from into as is are was were be been being
+am do does did done can could would should will shall may might must have has had i me my we our you your
+it its this that these those there here what which who whom whose how why when where please tell explain
+give show let us just some any kind way much many very really s t re ll ve d
+""".split())
+
+
+def _content_words(text: str) -> list:
+    """Non-stopword words of a text, in order."""
+    return [w for w in _TOKEN_RE.findall(text.lower()) if w not in STOPWORDS]
+
+
+def content_words(text: str) -> frozenset:
+    """The set of content words of a text; paraphrases must agree on it exactly."""
+    return frozenset(_content_words(text))
+
+
+class HashingVectorizer:
+    """Feature-hashing TF-IDF embedder with no fitted vocabulary."""
+
+    def __init__(self, dim: int = SEMANTIC_CACHE_DIM):
+        self.dim = dim
+        self.doc_freq: dict = {}  # bucket -> number of cached prompts using it
+        self.num_docs = 0
+
+    def features(self, text: str) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Hash a text's content words and their bigrams into sparse signed term frequencies.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: (sorted feature indices, signed sublinear TF values)
+        """
+        words = _content_words(text)
+        terms = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        if not terms:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        hashes = np.fromiter((zlib.crc32(t.encode('utf-8')) for t in terms), dtype=np.uint32, count=len(terms))
+        indices = (hashes % self.dim).astype(np.int64)
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+
+        # Accumulate signed counts per bucket, then apply sublinear TF
+        unique, inverse = np.unique(indices, return_inverse=True)
+        counts = np.zeros(len(unique), dtype=np.float32)
+        np.add.at(counts, inverse, signs)
+        keep = counts != 0
+        unique, counts = unique[keep], counts[keep]
+        values = np.sign(counts) * (1.0 + np.log(np.abs(counts)))
+        return unique, values.astype(np.float32)
+
+    def idf(self, indices: np.ndarray) -> np.ndarray:
+        """Smoothed inverse document frequency for the given buckets."""
+        doc_freq = np.fromiter((self.doc_freq.get(int(i), 0) for i in indices), dtype=np.float32, count=len(indices))
+        return np.log((1.0 + self.num_docs) / (1.0 + doc_freq)) + 1.0
+
+    def weight(self, indices: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """L2-normalized TF-IDF values for sparse term frequencies, using the current IDF."""
+        if len(indices) == 0:
+            return values
+        values = values * self.idf(indices)
+        norm = np.linalg.norm(values)
+        return (values / norm if norm else values).astype(np.float32)
+
+    def embed(self, text: str) -> tuple[np.ndarray, np.ndarray]:
+        """Return the L2-normalized sparse TF-IDF embedding of a text."""
+        indices, values = self.features(text)
+        return indices, self.weight(indices, values)
+
+    def add_document(self, indices: np.ndarray):
+        for i in indices.tolist():
+            self.doc_freq[i] = self.doc_freq.get(i, 0) + 1
+        self.num_docs += 1
+
+    def remove_document(self, indices: np.ndarray):
+        for i in indices.tolist():
+            count = self.doc_freq.get(i, 0) - 1
+            if count > 0:
+                self.doc_freq[i] = count
+            else:
+                self.doc_freq.pop(i, None)
+        self.num_docs = max(self.num_docs - 1, 0)
+
+
+def _dot(a_indices: np.ndarray, a_values: np.ndarray, b_indices: np.ndarray, b_values: np.ndarray) -> float:
+    """Dot product of two sparse vectors with sorted, unique indices."""
+    _, a, b = np.intersect1d(a_indices, b_indices, assume_unique=True, return_indices=True)
+    return float(np.dot(a_values[a], b_values[b]))
+
+
+class SemanticCache:
+    """Cosine-similarity cache of prompt -> answer over sparse embeddings, grouped by content words."""
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, max_entries: int = SEMANTIC_CACHE_SIZE,
+                 ttl: float = SEMANTIC_CACHE_TTL, dim: int = SEMANTIC_CACHE_DIM):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.vectorizer = HashingVectorizer(dim)
+        self.hits = 0
+        self.misses = 0
+
+        capacity = min(INITIAL_CAPACITY, max_entries)
+        self._expires = np.zeros(capacity, dtype=np.float64)
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        self._answers: list = [None] * capacity
+        self._vectors: list = [None] * capacity  # slot -> sparse term frequencies (indices, values)
+        self._words: list = [None] * capacity  # slot -> content words
+        self._groups: dict = {}  # content words -> set of slots
+        self._size = 0
+
+    def lookup(self, prompt: str) -> Optional[tuple[str, float]]:
+        """
+        Find the cached answer for the most similar prompt with the same content words.
+
+        Returns:
+            tuple[str, float] or None: (answer, cosine similarity) if above the threshold
+        """
+        slots = self._groups.get(content_words(prompt))
+        indices, values = self.vectorizer.embed(prompt)
+        if not slots or len(indices) == 0:
+            self.misses += 1
+            return None
+
+        now = time.monotonic()
+        best, score = None, -1.0
+        for slot in slots:
+            if self._expires[slot] < now:
+                continue
+            # Weight both sides with today's IDF, so entries don't drift as the cache fills up
+            cached_indices, cached_tf = self._vectors[slot]
+            similarity = _dot(indices, values, cached_indices, self.vectorizer.weight(cached_indices, cached_tf))
+            if similarity > score:
+                best, score = slot, similarity
+
+        if best is None or score < self.threshold:
+            self.misses += 1
+            return None
+
+        self._last_used[best] = now
+        self.hits += 1
+        return self._answers[best], score
+
+    def add(self, prompt: str, answer: str):
+        """Cache an answer for a prompt, evicting the least recently used entry when full."""
+        indices, tf = self.vectorizer.features(prompt)
+        if len(indices) == 0:
+            return
+        slot = self._free_slot()
+
+        if self._vectors[slot] is not None:
+            self.vectorizer.remove_document(self._vectors[slot][0])
+            group = self._groups[self._words[slot]]
+            group.discard(slot)
+            if not group:
+                del self._groups[self._words[slot]]
+        self.vectorizer.add_document(indices)
+
+        now = time.monotonic()
+        words = content_words(prompt)
+        self._vectors[slot] = (indices, tf)
+        self._words[slot] = words
+        self._groups.setdefault(words, set()).add(slot)
+        self._expires[slot] = now + self.ttl
+        self._last_used[slot] = now
+        self._answers[slot] = answer
+
+    def _free_slot(self) -> int:
+        """Pick a slot for a new entry: append, reuse an expired one, or evict LRU."""
+        n = self._size
+        expired = np.flatnonzero(self._expires[:n] < time.monotonic())
+        if len(expired):
+            return int(expired[0])
+
+        if n < len(self._expires):
+            self._size += 1
+            return n
+        if n < self.max_entries:
+            self._grow(min(n * 2, self.max_entries))
+            self._size += 1
+            return n
+        return int(np.argmin(self._last_used[:n]))
+
+    def _grow(self, capacity: int):
+        """Enlarge the backing arrays to a new capacity."""
+        self._expires = np.concatenate([self._expires, np.zeros(capacity - len(self._expires))])
+        self._last_used = np.concatenate([self._last_used, np.zeros(capacity - len(self._last_used))])
+        self._answers.extend([None] * (capacity - len(self._answers)))
+        self._vectors.extend([None] * (capacity - len(self._vectors)))
+        self._words.extend([None] * (capacity - len(self._words)))
+
+    def __len__(self) -> int:
+        return self._size
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the current size."""
+        return {"hits": self.hits, "misses": self.misses, "size": self._size}
+
+
+# One cache per model so answers from different models never mix
+_caches: dict = {}
+
+
+def get_semantic_cache(model: str) -> SemanticCache:
+    """Return the semantic cache for a model, creating it on first use."""
+    cache = _caches.get(model)
+    if cache is None:
+        cache = _caches[model] = SemanticCache()
+    return cache
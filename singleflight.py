@@ -0,0 +1,82 @@
+"""Single-flight coalescing of identical in-flight upstream requests.
+
+When many users trigger the same expensive work at once (a viral YouTube
+link, a forwarded meme), only the first caller runs it; everyone else with
+the same key awaits that one in-flight future.
+"""
+import asyncio
+import hashlib
+import logging
+from typing import Any, Awaitable, Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls that share a key."""
+
+    def __init__(self):
+        self._inflight: dict = {}
+        self._waiters: dict = {}  # key -> callers currently awaiting the work
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """
+        Run ``fn(*args, **kwargs)`` once per key among concurrent callers.
+
+        Args:
+            key: Canonical identity of the request (e.g. ("youtube", video_id))
+            fn: Coroutine function doing the actual work
+
+        Returns:
+            The shared result; exceptions are propagated to every waiter.
+        """
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn(*args, **kwargs))
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._finished(key, f))
+        else:
+            logger.info(f"Coalescing duplicate request for {key!r}")
+
+        # A cancelled waiter must not cancel the work other users are waiting on
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(future)
+        finally:
+            self._waiters[key] -= 1
+            if self._waiters[key] <= 0:
+                del self._waiters[key]
+
+    def _finished(self, key: Hashable, future: asyncio.Future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        # Mark the exception as retrieved even if every waiter went away
+        if not future.cancelled():
+            future.exception()
+
+    def abandon(self, key: Hashable) -> bool:
+        """
+        Cancel in-flight work for a key if nobody is waiting on it any more.
+
+        Returns:
+            bool: Whether the work was cancelled
+        """
+        future = self._inflight.get(key)
+        if future is None or future.done() or self._waiters.get(key):
+            return False
+        logger.info(f"Cancelling abandoned request for {key!r}")
+        future.cancel()
+        return True
+
+    def in_flight(self, key: Hashable) -> bool:
+        """Check whether work for a key is currently running."""
+        return key in self._inflight
+
+
+def prompt_hash(prompt: str) -> str:
+    """Short stable hash of a prompt for use in request keys."""
+    return hashlib.sha256((prompt or "").encode('utf-8')).hexdigest()[:16]
+
+
+# Shared instance; callers namespace their keys, e.g. ("caption", file_unique_id, prompt_hash)
+upstream_flight = SingleFlight()
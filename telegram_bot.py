@@ -15,18 +15,33 @@ import logging
 import tempfile
 from pathlib import Path
 import base64
-from groq import Groq
 import asyncio
 import html
-from PIL import Image
-import io
 import google.generativeai as genai
 from dotenv import load_dotenv
 import video_insights
-from constants import HELP_MESSAGE, SUMMARY_PROMPT, MEDIA_FOLDER
+from constants import HELP_MESSAGE, SUMMARY_PROMPT
 from image_generator import AIImageGenerator
 from image_caption import ImageCaptioner
-from video_insights import get_insights
+import llm_gateway
+import deadline
+from conversation_context import ConversationContext
+from singleflight import upstream_flight, prompt_hash
+from scheduler import scheduled, scheduler, QueueFullError, LIGHT, MEDIA, HEAVY
+from rate_limiter import RateLimitExceeded
+from circuit_breaker import circuit_breakers, CircuitOpenError, OPEN, CLOSED, PROVIDER_NAMES
+from progressive_reply import ProgressiveReply, stream_reply, reply_in_chunks, STREAM_CHAT_REPLIES
+from response_cache import chat_response_cache, chat_cache_key, is_cacheable_prompt, vision_result_cache, vision_cache_key
+from semantic_cache import get_semantic_cache
+from model_router import model_router, CHAT, VISION
+from telegram_file_cache import telegram_file_cache, get_file, PHOTO
+from media_buffer import download_media
+from image_ingest import ingest_photo, DESCRIBE_MAX_SIDE, CAPTION_MAX_SIDE
+from perceptual_index import perceptual_index
+from prefetch import start_prefetch
+from video_jobs import video_jobs, VideoJob, TooManyVideoJobs, no_progress, DOWNLOAD, MAX_VIDEO_JOBS_PER_USER
+from insights_cache import insights_cache, insights_variant
+from media_admission import MediaRejected, check_video, VIDEO_POLICY, MB
 
 
 # Initialize image generator and captioner
@@ -61,6 +76,9 @@ TEMP_DIR.mkdir(parents=True, exist_ok=True)
 # Global variable for user sessions
 user_sessions = {}
 
+# Sampling temperature for chat replies
+CHAT_TEMPERATURE = 0.7
+
 # Dictionary of available commands and their descriptions
 COMMANDS = {
     "/start": "Start the bot",
@@ -97,12 +115,14 @@ class UserSession:
         self.last_response = None
         self.last_image_prompt = None
         self.last_image_url = None
-        self.last_photo = None  # Store last photo for inline keyboard actions
+        self.last_photo_sizes = []  # Sizes of the last photo, for inline keyboard actions
+        self.photo_prefetch = None  # Speculative description of the last photo
         self.selected_model = "llama3-70b-8192"  # Default Groq model
         self.groq_api_key = os.getenv('GROQ_API_KEY')
         self.together_api_key = os.getenv('TOGETHER_API_KEY')
         self.last_enhanced_prompt = None
         self.subscribed_to_status = False  # New field for status subscription
+        self.context = ConversationContext()  # Token-budgeted prompt window over the history
 
 BOT_STATUS = {
     "is_maintenance": False,
@@ -212,32 +232,122 @@ async def setreplicateapi_command(update: Update, context: ContextTypes.DEFAULT_
         "Please set your Together API key in the .env file."
     )
 
-async def interactive_chat(text: str, model_type: str, api_key: str) -> str:
-    """Handle chat interaction with Groq API."""
+async def interactive_chat(text: str, model_type: str, api_key: str, messages: list = None) -> str:
+    """Handle chat interaction with Groq API, optionally with a prepared context window."""
     try:
-        # Initialize Groq client
-        client = Groq(api_key=api_key)
-        
-        # Create chat completion (not async)
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": text
-                }
-            ],
-            model=model_type,
-            temperature=0.7,
-            max_tokens=1000,
+        # Create chat completion through the shared async gateway, falling back
+        # along the chat chain if the preferred model is degraded
+        return await model_router.call(
+            CHAT,
+            lambda model: llm_gateway.chat_completion(
+                messages=messages or [
+                    {
+                        "role": "user",
+                        "content": text
+                    }
+                ],
+                model=model,
+                api_key=api_key,
+                temperature=CHAT_TEMPERATURE,
+                max_tokens=1000,
+            ),
+            preferred=model_type,
+            hedge=True
         )
         
-        # Return the response text
-        return chat_completion.choices[0].message.content
-        
+    except (RateLimitExceeded, CircuitOpenError, deadline.DeadlineExceeded):
+        raise
     except Exception as e:
         logger.error(f"Error in interactive_chat: {e}")
         raise Exception(f"Failed to get response from Groq API: {str(e)}")
 
+async def interactive_chat_stream(text: str, model_type: str, api_key: str, messages: list = None):
+    """Stream a chat reply from the Groq API chunk by chunk."""
+    try:
+        async for delta in model_router.stream(
+            CHAT,
+            lambda model: llm_gateway.stream_chat_completion(
+                messages=messages or [
+                    {
+                        "role": "user",
+                        "content": text
+                    }
+                ],
+                model=model,
+                api_key=api_key,
+                temperature=CHAT_TEMPERATURE,
+                max_tokens=1000,
+            ),
+            preferred=model_type,
+            hedge=True
+        ):
+            yield delta
+
+    except (RateLimitExceeded, CircuitOpenError, deadline.DeadlineExceeded):
+        raise
+    except Exception as e:
+        logger.error(f"Error in interactive_chat_stream: {e}")
+        raise Exception(f"Failed to get response from Groq API: {str(e)}")
+
+async def respond_to_chat(message, session, text: str, model_type: str) -> str:
+    """
+    Answer a chat message with the session's context window.
+
+    Context-free turns are served from the response cache when possible;
+    everything else goes to the model, streamed if enabled.
+    """
+    # Add user message to conversation history and build the prompt window
+    session.conversation_history.append({
+        'role': 'user',
+        'content': text
+    })
+    messages = session.context.build_messages(session.conversation_history, model_type)
+
+    # Only turns that don't depend on earlier history are safe to cache
+    cache_key = None
+    if (len(session.conversation_history) == 1 and not session.context.summary
+            and is_cacheable_prompt(text)):
+        cache_key = chat_cache_key(model_type, text, CHAT_TEMPERATURE, messages[0]['content'])
+
+    response = chat_response_cache.get(cache_key) if cache_key else None
+    from_cache = response is not None
+    if response is None and cache_key:
+        # Fall back to a paraphrase of a question we've already answered
+        match = get_semantic_cache(model_type).lookup(text)
+        if match:
+            response = match[0]
+            from_cache = True
+            cache_key = None
+
+    if response is not None:
+        await message.reply_text(response)
+    elif STREAM_CHAT_REPLIES:
+        # Stream the reply into a progressively edited message
+        response = await stream_reply(
+            message,
+            interactive_chat_stream(text, model_type, session.groq_api_key, messages)
+        )
+    else:
+        response = await interactive_chat(text, model_type, session.groq_api_key, messages)
+        await message.reply_text(response)
+
+    # Only fresh replies are stored: re-storing a cached answer would restart its TTL
+    # and add a duplicate row to the semantic index
+    if cache_key and not from_cache:
+        chat_response_cache.set(cache_key, response)
+        get_semantic_cache(model_type).add(text, response)
+
+    # Add AI response to conversation history
+    session.conversation_history.append({
+        'role': 'assistant',
+        'content': response
+    })
+    session.last_response = response
+
+    # Fold older turns into the summary in the background
+    session.context.maybe_summarize(session, session.groq_api_key)
+    return response
+
 async def chat_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the /chat command."""
     try:
@@ -264,33 +374,11 @@ async def chat_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Get the message from arguments
         message = ' '.join(context.args)
         
-        # Add user message to conversation history
-        session.conversation_history.append({
-            'role': 'user',
-            'content': message
-        })
-        
         # Show typing indicator
         await context.bot.send_chat_action(chat_id=update.message.chat_id, action="typing")
         
         # Get AI response with proper API key
-        response = await interactive_chat(
-            text=message,
-            model_type="llama3-70b-8192",
-            api_key=session.groq_api_key
-        )
-        
-        # Send text response
-        await update.message.reply_text(response)
-        
-        # Add AI response to conversation history
-        session.conversation_history.append({
-            'role': 'assistant',
-            'content': response
-        })
-        
-        # Store the last response
-        session.last_response = response
+        await respond_to_chat(update.message, session, message, model_router.route(CHAT)[0])
 
     except Exception as e:
         logger.error(f"Error in chat: {str(e)}")
@@ -299,21 +387,30 @@ async def chat_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "Please try again later or contact support if the issue persists."
         )
 
+FRESH_FLAG = "--fresh"
+
 async def imagine_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the /imagine command for image generation with prompt enhancement."""
     if not update.message:
         return
 
+    # "--fresh" skips the image cache and always generates a new image
+    args = list(context.args or [])
+    fresh = bool(args) and args[0] == FRESH_FLAG
+    if fresh:
+        args = args[1:]
+
     # Check if there's a prompt
-    if not context.args:
+    if not args:
         await update.message.reply_text(
             "Please provide a prompt for the image generation.\n"
-            "Example: `/imagine a beautiful sunset over mountains`",
+            "Example: `/imagine a beautiful sunset over mountains`\n"
+            f"Add `{FRESH_FLAG}` before the prompt to skip cached images.",
             parse_mode='Markdown'
         )
         return
 
-    prompt = ' '.join(context.args)
+    prompt = ' '.join(args)
     user_id = update.effective_user.id
 
     # Send initial status
@@ -323,7 +420,7 @@ async def imagine_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         # Enhance the prompt
-        enhanced_prompt = image_generator.enhance_prompt(prompt)
+        enhanced_prompt = await image_generator.enhance_prompt(prompt)
         if not enhanced_prompt:
             await status_message.edit_text("❌ Failed to enhance the prompt. Please try again.")
             return
@@ -331,24 +428,25 @@ async def imagine_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Update status message
         await status_message.edit_text("🎨 Step 2/2: Generating image from enhanced prompt...")
 
-        # Generate the image
+        # Reuse an image generated earlier for the same enhanced prompt
         start_time = time.time()
-        success, image_data, error_message = image_generator.generate_image(enhanced_prompt)
+        image_data = None if fresh else await image_generator.get_cached_image(enhanced_prompt)
+        cached = bool(image_data)
+        if cached:
+            success, error_message = True, ""
+        else:
+            success, image_data, error_message = await image_generator.generate_image_async(enhanced_prompt)
         total_time = time.time() - start_time
 
         if success and image_data:
             # Convert base64 to bytes
             image_bytes = base64.b64decode(image_data)
-            
-            # Create BytesIO object
-            image_io = io.BytesIO(image_bytes)
-            image_io.name = 'generated_image.png'
-
-            # Send the image first
-            await update.message.reply_photo(
-                photo=image_io,
-                caption=f"⏱️ Generated in {total_time:.1f}s",
-                parse_mode='Markdown'
+
+            # Send the image first, by file_id if Telegram already has it
+            caption = f"⚡ Served from cache in {total_time:.1f}s" if cached else f"⏱️ Generated in {total_time:.1f}s"
+            await telegram_file_cache.send(
+                PHOTO, image_bytes, 'generated_image.png',
+                lambda photo: update.message.reply_photo(photo=photo, caption=caption, parse_mode='Markdown')
             )
 
             # Send prompts as a separate message
@@ -408,8 +506,12 @@ async def enhance_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Set the API key from session
         enhancer.together_api_key = session.together_api_key
         
+        # Stream the enhanced text into the progress message as it arrives
+        live_reply = ProgressiveReply(update.message, sent_message=progress_message)
+        await live_reply.start()
+
         start_time = time.time()
-        success, enhanced_text, error = await enhancer.enhance_text(text)
+        success, enhanced_text, error = await enhancer.enhance_text(text, on_delta=live_reply.append)
         total_time = time.time() - start_time
         
         if success and enhanced_text:
@@ -493,12 +595,65 @@ async def temperature_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     except ValueError as e:
         await update.message.reply_text(str(e))
 
+DESCRIBE_PROMPT = "Please describe this image in detail. Focus on the main elements, colors, composition, and any notable features."
+
+async def _describe_photo(bot, sizes, api_key):
+    """Download a photo and describe it with the vision model, caching the result."""
+    cache_key = vision_cache_key(sizes[-1].file_unique_id, "describe", DESCRIBE_PROMPT)
+
+    # Download an adequate size once and inline it, so the provider never sees our bot token
+    image = await ingest_photo(bot, sizes, DESCRIBE_MAX_SIDE)
+
+    # A resized or re-compressed copy of a photo we already described
+    description = perceptual_index.lookup(image.phash, "describe", DESCRIBE_PROMPT)
+    if description is not None:
+        vision_result_cache.set(cache_key, description)
+        return description
+
+    # Prepare the message for image analysis
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": DESCRIBE_PROMPT
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": image.data_url
+                    }
+                }
+            ]
+        }
+    ]
+
+    logging.info("Making API request to Groq...")
+    description = await model_router.call(
+        VISION,
+        lambda model: llm_gateway.chat_completion(
+            messages=messages,
+            model=model,
+            api_key=api_key,
+            temperature=0.7,
+            max_tokens=1024,
+            top_p=1
+        ),
+        hedge=True
+    )
+    logging.info("Received description from Groq")
+
+    vision_result_cache.set(cache_key, description)
+    perceptual_index.add(image.phash, "describe", DESCRIBE_PROMPT, description)
+    return description
+
 async def describe_image(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the /describe command and direct photo messages for image analysis"""
     try:
         # Get the photo file
         if update.message.photo:
-            photo = update.message.photo[-1]  # Get the largest size
+            photo = update.message.photo[-1]  # Identifies the photo for de-duplication
         else:
             await update.message.reply_text("Please send a photo to describe or use this command as a reply to a photo.")
             return
@@ -516,57 +671,28 @@ async def describe_image(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
 
-        await update.message.reply_text("Analyzing the image... 🔍")
-
-        # Get the file URL
-        photo_file = await context.bot.get_file(photo.file_id)
-        file_url = photo_file.file_path
-
-        # Create Groq client
-        client = Groq(api_key=session.groq_api_key)
-        logging.info("Groq client created successfully")
+        # A forwarded or re-sent photo keeps its file_unique_id, so answer it from cache
+        cache_key = vision_cache_key(photo.file_unique_id, "describe", DESCRIBE_PROMPT)
+        description = vision_result_cache.get(cache_key)
+        if description is not None:
+            logging.info("Image description served from cache")
+            await update.message.reply_text(description)
+            return
 
-        # Prepare the message for image analysis
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": "Please describe this image in detail. Focus on the main elements, colors, composition, and any notable features."
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": file_url
-                        }
-                    }
-                ]
-            }
-        ]
+        await update.message.reply_text("Analyzing the image... 🔍")
 
-        logging.info("Making API request to Groq...")
-        
-        # Make the API request
-        response = client.chat.completions.create(
-            model="llama-3.2-11b-vision-preview",
-            messages=messages,
-            temperature=0.7,
-            max_tokens=1024,
-            top_p=1,
-            stream=False
+        # Concurrent requests for the same photo, including a speculative prefetch, share one call
+        description = await upstream_flight.do(
+            ("describe", photo.file_unique_id),
+            _describe_photo, context.bot, update.message.photo, session.groq_api_key
         )
 
-        logging.info("Received response from Groq")
-
-        # Extract the description
-        description = response.choices[0].message.content
-        logging.info("Description extracted from response")
-
         # Send the text description
         await update.message.reply_text(description)
         logging.info("Text description sent to user")
 
+    except (MediaRejected, RateLimitExceeded, CircuitOpenError, deadline.DeadlineExceeded) as e:
+        await update.message.reply_text(str(e))
     except Exception as e:
         logging.error(f"Error in image description: {str(e)}")
         await update.message.reply_text(
@@ -597,7 +723,19 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_sessions[user_id] = UserSession()
     
     session = user_sessions[user_id]
-    session.last_photo = update.message.photo[-1]  # Store the largest photo
+    session.last_photo_sizes = list(update.message.photo)
+
+    # Start describing the photo while the user picks an option; the older photo's prefetch is stale now
+    if session.photo_prefetch:
+        session.photo_prefetch.cancel()
+        session.photo_prefetch = None
+    photo = update.message.photo[-1]
+    if session.groq_api_key and vision_result_cache.get(
+            vision_cache_key(photo.file_unique_id, "describe", DESCRIBE_PROMPT)) is None:
+        session.photo_prefetch = start_prefetch(
+            user_id, MEDIA, ("describe", photo.file_unique_id),
+            _describe_photo, context.bot, session.last_photo_sizes, session.groq_api_key
+        )
 
     await update.message.reply_text(
         "What would you like to do with this image?",
@@ -620,18 +758,15 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     session = user_sessions[user_id]
-    if not hasattr(session, 'last_photo'):
+    if not session.last_photo_sizes:
         await query.edit_message_text("Image not found. Please send the image again.")
         return
 
     try:
-        photo_file = await context.bot.get_file(session.last_photo.file_id)
-        photo_url = photo_file.file_path
-        
         if action == "describe":
             # Create a mock update object to reuse describe_image
             mock_message = type('MockMessage', (), {
-                'photo': [session.last_photo],
+                'photo': session.last_photo_sizes,
                 'reply_text': query.edit_message_text,
                 'effective_chat': query.message.chat
             })
@@ -645,17 +780,27 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await describe_image(mock_update, context)
 
         elif action == "caption":
-            await query.edit_message_text("🤔 Generating creative caption...")
-            success, caption = await image_captioner.generate_caption(
-                photo_url, 
-                "Generate a creative and engaging caption for this image."
-            )
+            caption_prompt = "Generate a creative and engaging caption for this image."
+            image_key = session.last_photo_sizes[-1].file_unique_id
+            caption = image_captioner.cached_caption(image_key, caption_prompt)
+            success = caption is not None
+            if not success:
+                await query.edit_message_text("🤔 Generating creative caption...")
+                image = await ingest_photo(context.bot, session.last_photo_sizes, CAPTION_MAX_SIDE)
+                success, caption = await image_captioner.generate_caption(
+                    image.data_url, 
+                    caption_prompt,
+                    image_key=image_key,
+                    phash=image.phash
+                )
             
             if success:
                 await query.edit_message_text(f"🎨 Creative Caption:\n\n{caption}")
             else:
                 await query.edit_message_text(f"❌ Error: {caption}")
 
+    except (MediaRejected, RateLimitExceeded, CircuitOpenError, deadline.DeadlineExceeded) as e:
+        await query.edit_message_text(str(e))
     except Exception as e:
         logger.error(f"Error in button callback: {str(e)}")
         await query.edit_message_text("❌ Sorry, something went wrong. Please try again later.")
@@ -677,10 +822,7 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     try:
         # Generate response using chat function
-        response = await interactive_chat(message_text, session.selected_model, session.groq_api_key)
-        
-        # Send the text response
-        await update.message.reply_text(response)
+        await respond_to_chat(update.message, session, message_text, session.selected_model)
         
     except Exception as e:
         error_message = f"Error processing message: {str(e)}"
@@ -763,13 +905,18 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         hours = int(uptime // 3600)
         minutes = int((uptime % 3600) // 60)
+        cache_stats = chat_response_cache.stats()
         
         status_message = (
             " Bot Status: Online\n"
             f"Bot Name: {bot_info.first_name}\n"
             f"Username: @{bot_info.username}\n"
             f"Uptime: {hours}h {minutes}m\n"
-            f"Maintenance Mode: {' Yes' if BOT_STATUS['is_maintenance'] else ' No'}"
+            f"Maintenance Mode: {' Yes' if BOT_STATUS['is_maintenance'] else ' No'}\n"
+            f"Response Cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses\n"
+            f"Queued Jobs: {sum(s['waiting'] for s in scheduler.stats().values())}\n"
+            f"Video Jobs: {video_jobs.stats()['running']} running, {video_jobs.stats()['waiting']} queued\n"
+            f"Open Circuits: {', '.join(name for name, state in circuit_breakers.stats().items() if state != CLOSED) or 'None'}"
         )
         await update.message.reply_text(status_message)
     except Exception as e:
@@ -805,10 +952,27 @@ async def notify_subscribers(application: Application, message: str):
         except Exception as e:
             logger.error(f"Failed to send notification to {chat_id}: {str(e)}")
 
+# Errors users already get a friendly message for; outages are announced by the circuit breakers
+EXPECTED_ERRORS = (RateLimitExceeded, CircuitOpenError, deadline.DeadlineExceeded)
+
+# Minimum seconds between two error alerts to subscribers
+ERROR_ALERT_COOLDOWN = 600
+_last_error_alert = 0.0
+
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
-    """Handle errors and notify subscribers."""
+    """Handle errors and notify subscribers, at most once per cooldown."""
+    global _last_error_alert
+    if isinstance(context.error, EXPECTED_ERRORS):
+        logger.warning(f"Upstream unavailable while handling an update: {str(context.error)}")
+        return
+
     logger.error("Exception while handling an update:", exc_info=context.error)
-    
+
+    now = time.time()
+    if now - _last_error_alert < ERROR_ALERT_COOLDOWN:
+        return
+    _last_error_alert = now
+
     error_message = (
         " *Bot Status Alert*\n\n"
         "The bot is currently experiencing technical difficulties.\n"
@@ -816,7 +980,27 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
         f"Error: `{str(context.error)}`"
     )
     
-    await notify_subscribers(context.application, error_message)
+    await notify_subscribers(context.bot, error_message)
+
+def circuit_alert_listener(application: Application):
+    """Build a circuit breaker listener that tells subscribers when a provider goes down or recovers."""
+    def listener(breaker, old_state, new_state):
+        provider = PROVIDER_NAMES.get(breaker.provider, breaker.provider)
+        if old_state == CLOSED and new_state == OPEN:
+            message = (
+                " *Bot Status Alert*\n\n"
+                f"{provider} (`{breaker.model}`) is currently unavailable.\n"
+                "Features using it will answer right away with an error until it recovers."
+            )
+        elif new_state == CLOSED:
+            message = (
+                " *Bot Status Alert*\n\n"
+                f"{provider} (`{breaker.model}`) has recovered. All features are available again."
+            )
+        else:
+            return  # half-open probing isn't worth a notification
+        application.create_task(notify_subscribers(application.bot, message))
+    return listener
 
 async def on_startup(application: Application):
     """Notify subscribers when bot starts up."""
@@ -827,12 +1011,17 @@ async def on_startup(application: Application):
     )
     await notify_subscribers(application, startup_message)
 
+async def on_shutdown(application: Application):
+    """Release shared upstream connections when the bot stops."""
+    await llm_gateway.close()
+
 async def clear_chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Clear the chat history for the current user."""
     try:
         user_id = update.effective_user.id
         if user_id in user_sessions:
             user_sessions[user_id].conversation_history = []
+            user_sessions[user_id].context.reset()
             await update.message.reply_text(
                 " Chat history cleared successfully!",
                 parse_mode='Markdown'
@@ -954,21 +1143,15 @@ async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             parse_mode='Markdown'
         )
         
-        # Send Markdown file
-        await context.bot.send_document(
-            chat_id=chat_id,
-            document=md_file.open('rb'),
-            filename=md_file.name,
-            caption=" Markdown Export"
-        )
-        
-        # Send HTML file
-        await context.bot.send_document(
-            chat_id=chat_id,
-            document=html_file.open('rb'),
-            filename=html_file.name,
-            caption=" HTML Export"
-        )
+        # Send Markdown and HTML files; exports are timestamped, so they never repeat
+        # and are kept out of the file_id cache
+        for export_file, caption in ((md_file, " Markdown Export"), (html_file, " HTML Export")):
+            with export_file.open('rb') as document:
+                await context.bot.send_document(
+                    chat_id=chat_id,
+                    document=document,
+                    caption=caption
+                )
         
     except Exception as e:
         logging.error(f"Error in export command: {str(e)}")
@@ -976,72 +1159,21 @@ async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             " Sorry, an error occurred while exporting your chat history."
         )
 
-async def resize_image(image_path, max_size=(800, 800)):
-    """Resize image to reduce file size while maintaining aspect ratio"""
-    try:
-        with Image.open(image_path) as img:
-            # Convert to RGB if necessary
-            if img.mode in ('RGBA', 'P'):
-                img = img.convert('RGB')
-            
-            # Calculate new size maintaining aspect ratio
-            img.thumbnail(max_size, Image.Resampling.LANCZOS)
-            
-            # Save to bytes
-            img_byte_arr = io.BytesIO()
-            img.save(img_byte_arr, format='JPEG', quality=85, optimize=True)
-            img_byte_arr.seek(0)
-            
-            return img_byte_arr.getvalue()
-    except Exception as e:
-        logging.error(f"Error resizing image: {str(e)}")
-        return None
-
 def initialize_genai():
     api_key = os.getenv("API_KEY")
     if not api_key:
         raise ValueError("API_KEY not found in .env file")
     genai.configure(api_key=api_key)
 
-def get_video_insights(video_path):
-    """Get insights from a video using Gemini Vision."""
-    try:
-        logging.info(f"🎥 Processing video: {video_path}")
-        
-        # Initialize Gemini model
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
-        # Read video file
-        with open(video_path, 'rb') as f:
-            video_data = f.read()
-            
-        # Create video part for Gemini
-        video_part = {
-            'mime_type': 'video/mp4',
-            'data': video_data
-        }
-        
-        # Generate prompt for video analysis
-        prompt = """
-        Analyze this video and provide insights on:
-        1. What's happening in the video
-        2. Key events or actions
-        3. Notable objects or people
-        4. Overall context and setting
-        
-        Please be detailed but concise in your analysis.
-        """
-        
-        # Generate response
-        response = model.generate_content([prompt, video_part])
-        
-        return response.text
-        
-    except Exception as e:
-        logging.error(f"Error in video analysis: {str(e)}")
-        raise
+KEYFRAMES_FLAG = "--keyframes"
+SEGMENTS_FLAG = "--segments"
+FULL_VIDEO_FLAG = "--full"
 
-MAX_VIDEO_SIZE = 50 * 1024 * 1024  # 50MB
+VIDEO_MODE_FLAGS = {
+    KEYFRAMES_FLAG: video_insights.KEYFRAMES_MODE,
+    SEGMENTS_FLAG: video_insights.SEGMENTS_MODE,
+    FULL_VIDEO_FLAG: video_insights.FULL_MODE,
+}
 
 async def analyze_video_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the /analyze_video command and direct video messages."""
@@ -1049,50 +1181,145 @@ async def analyze_video_command(update: Update, context: ContextTypes.DEFAULT_TY
         if not update.message:
             return
             
-        # Get video file from either command or direct message
-        video = update.message.video
-        document = update.message.document
+        # Get video file from either command or direct message, or the video the command replies to
+        source = update.message
+        if not (source.video or source.document) and source.reply_to_message:
+            source = source.reply_to_message
+        video = source.video
+        document = source.document
 
         # If neither video nor document is present, send instructions
         if not video and not document:
             await update.message.reply_text(
                 "Please send me a video to analyze! You can either:\n"
                 "1. Send the video directly\n"
-                "2. Use /analyze_video and attach a video\n\n"
+                "2. Use /analyze_video and attach a video\n"
+                "3. Reply to a video with /analyze_video your question\n\n"
+                f"Add `{KEYFRAMES_FLAG}` to analyze only scene-change keyframes (much faster for long videos), "
+                f"`{SEGMENTS_FLAG}` to analyze long videos in parallel parts, "
+                f"or `{FULL_VIDEO_FLAG}` to send the whole video.\n\n"
                 "📝 Requirements:\n"
-                "• Maximum file size: 50MB\n"
+                f"• Maximum file size: {VIDEO_POLICY.max_bytes // MB}MB\n"
                 "• Supported formats: MP4, MOV, AVI\n"
                 "• Recommended length: 1-3 minutes"
             )
             return
 
         # Get file ID
-        file_id = video.file_id if video else document.file_id if document else None
+        media = video or document
+        file_id = media.file_id if media else None
         if not file_id:
             await update.message.reply_text("Please send a valid video file.")
             return
 
-        # Send initial status
-        await update.message.reply_text("Starting video analysis...")
+        # "--keyframes" / "--segments" / "--full" override the default analysis mode
+        args = list(context.args or [])
+        mode = video_insights.VIDEO_ANALYSIS_MODE
+        explicit_mode = bool(args) and args[0] in VIDEO_MODE_FLAGS
+        if explicit_mode:
+            mode = VIDEO_MODE_FLAGS[args[0]]
+            args = args[1:]
+
+        # Turn away what can't be downloaded and send long videos to keyframes mode, from metadata alone
+        try:
+            mode = check_video(media, mode, explicit_mode, keyframes_mode=video_insights.KEYFRAMES_MODE)
+        except MediaRejected as e:
+            await update.message.reply_text(str(e))
+            return
 
-        # Download video
-        file = await context.bot.get_file(file_id)
-        file_path = os.path.join(MEDIA_FOLDER, f"video_{update.message.from_user.id}_{int(time.time())}.mp4")
-        await file.download_to_drive(file_path)
+        # Optional follow-up question about the video
+        question = ' '.join(args) if args else None
 
-        # Analyze video
-        insights = get_insights(file_path)
+        # A video we've analyzed before is answered without downloading it
+        cached = await asyncio.to_thread(
+            insights_cache.lookup, media.file_unique_id, insights_variant(mode, question)
+        )
+        if cached is not None:
+            await reply_in_chunks(update.message, f"Analysis Results:\n\n{cached}")
+            return
+
+        # Send initial status; the job edits it as it progresses
+        status_message = await update.message.reply_text("Starting video analysis...")
+        message = update.message
+
+        async def run(progress):
+            # Identical videos sent at the same time share one download and analysis
+            return await upstream_flight.do(
+                ("video_insights", media.file_unique_id, mode, prompt_hash(question)),
+                download_and_analyze_video, context.bot, file_id, message.from_user.id,
+                media.file_unique_id, question, mode, progress
+            )
 
-        # Send results
-        await update.message.reply_text(f"Analysis Results:\n\n{insights}")
+        async def send_result(insights):
+            # Long analyses run past Telegram's message limit
+            await reply_in_chunks(message, f"Analysis Results:\n\n{insights}")
+
+        # The analysis runs on the video job executor; this handler returns right away
+        try:
+            position = video_jobs.submit(VideoJob(message.from_user.id, run, status_message, send_result))
+        except TooManyVideoJobs:
+            await status_message.edit_text(
+                f"⏳ You already have {MAX_VIDEO_JOBS_PER_USER} videos in progress. "
+                "Please wait for one of them to finish."
+            )
+            return
+        except QueueFullError:
+            await status_message.edit_text(
+                "🚦 Too many videos are being analyzed right now. Please try again in a few minutes."
+            )
+            return
+        if position:
+            await status_message.edit_text(f"⏳ Your video is #{position} in the queue.")
 
     except Exception as e:
         await update.message.reply_text(f"Error processing video: {str(e)}")
-        
-    finally:
-        # Cleanup
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
+
+async def download_and_analyze_video(bot: Bot, file_id: str, user_id: int,
+                                     video_key: str = None, question: str = None,
+                                     mode: str = video_insights.FULL_MODE, progress=no_progress) -> str:
+    """Download a Telegram video and run Gemini analysis on it off the event loop, caching the result."""
+    variant = insights_variant(mode, question)
+
+    # Follow-up questions reuse the earlier Gemini upload; its content hash is already known
+    if mode == video_insights.FULL_MODE and video_key and video_insights.has_uploaded_video(video_key):
+        content_hash = await asyncio.to_thread(insights_cache.resolve, video_key)
+        insights, model_name = await video_insights.get_insights_async(
+            None, video_key=video_key, prompt=question, progress=progress, with_model=True
+        )
+        if content_hash:
+            await asyncio.to_thread(insights_cache.put, content_hash, variant, model_name, insights)
+        return insights
+
+    # Download video straight to a uniquely named spill file, hashing it on the way
+    await progress(DOWNLOAD)
+    file = await deadline.bounded(get_file(bot, file_id))
+    buffer = await deadline.bounded(download_media(file, suffix='.mp4', spill_threshold=0, hashed=True))
+    with buffer:
+        file_path = buffer.path()
+        content_hash = buffer.sha256
+        if video_key:
+            await asyncio.to_thread(insights_cache.alias, video_key, content_hash)
+
+        # Same bytes sent before under another file_unique_id
+        cached = await asyncio.to_thread(insights_cache.get, content_hash, variant)
+        if cached is not None:
+            return cached
+
+        # Analyze video
+        if mode == video_insights.KEYFRAMES_MODE:
+            insights, model_name = await video_insights.get_keyframe_insights_async(
+                file_path, prompt=question, progress=progress, with_model=True
+            )
+        elif mode == video_insights.SEGMENTS_MODE:
+            insights, model_name = await video_insights.get_segmented_insights_async(
+                file_path, prompt=question, progress=progress, with_model=True
+            )
+        else:
+            insights, model_name = await video_insights.get_insights_async(
+                file_path, video_key=video_key, prompt=question, progress=progress, with_model=True
+            )
+        await asyncio.to_thread(insights_cache.put, content_hash, variant, model_name, insights)
+        return insights
 
 async def handle_video(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle videos sent directly to the bot."""
@@ -1129,19 +1356,25 @@ async def caption_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Get the custom prompt if provided
     custom_prompt = ' '.join(context.args) if context.args else None
 
-    # Get the largest photo (best quality)
-    photo = update.message.reply_to_message.photo[-1]
+    photos = update.message.reply_to_message.photo
+    photo = photos[-1]  # Identifies the photo for de-duplication
     
     # Get photo file and generate caption
     try:
-        photo_file = await context.bot.get_file(photo.file_id)
-        photo_url = photo_file.file_path
+        cached = image_captioner.cached_caption(photo.file_unique_id, custom_prompt)
+        if cached is not None:
+            await update.message.reply_text(f"🖼️ Image Analysis:\n\n{cached}")
+            return
+
+        image = await ingest_photo(context.bot, photos, CAPTION_MAX_SIDE)
 
         # Send a processing message
         processing_message = await update.message.reply_text("🤔 Analyzing the image...")
 
         # Generate caption
-        success, caption = await image_captioner.generate_caption(photo_url, custom_prompt)
+        success, caption = await image_captioner.generate_caption(
+            image.data_url, custom_prompt, image_key=photo.file_unique_id, phash=image.phash
+        )
         
         if success:
             await processing_message.edit_text(f"🖼️ Image Analysis:\n\n{caption}")
@@ -1221,20 +1454,25 @@ def setup_bot():
         .write_timeout(30.0)
         .get_updates_connection_pool_size(8)
         .concurrent_updates(True)
+        .post_shutdown(on_shutdown)
         .build()
     )
 
+    # Report errors and provider outages to subscribers without flooding them
+    application.add_error_handler(error_handler)
+    circuit_breakers.add_listener(circuit_alert_listener(application))
+
     # Add command handlers
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("chat", chat_command))
+    application.add_handler(CommandHandler("chat", scheduled(LIGHT)(chat_command)))
     application.add_handler(CommandHandler("settings", settings_command))
-    application.add_handler(CommandHandler("imagine", imagine_command))
-    application.add_handler(CommandHandler("caption", caption_command))
-    application.add_handler(CommandHandler("enhance", enhance_command))
-    application.add_handler(CommandHandler("describe", describe_image))
+    application.add_handler(CommandHandler("imagine", scheduled(HEAVY)(imagine_command)))
+    application.add_handler(CommandHandler("caption", scheduled(MEDIA)(caption_command)))
+    application.add_handler(CommandHandler("enhance", scheduled(LIGHT)(enhance_command)))
+    application.add_handler(CommandHandler("describe", scheduled(MEDIA)(describe_image)))
     application.add_handler(CommandHandler("clear_chat", clear_chat))
-    application.add_handler(CommandHandler("export", export_command))
+    application.add_handler(CommandHandler("export", scheduled(LIGHT)(export_command)))
     application.add_handler(CommandHandler("analyze_video", analyze_video_command))
     application.add_handler(CommandHandler("status", status_command))
     application.add_handler(CommandHandler("subscribe", subscribe_command))
@@ -1243,12 +1481,12 @@ def setup_bot():
     application.add_handler(CommandHandler("setgroqapi", setgroqapi_command))
 
     # Add message handlers
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, scheduled(LIGHT)(handle_text_message)))
     application.add_handler(MessageHandler(filters.PHOTO, handle_photo))
     application.add_handler(MessageHandler(filters.VIDEO, handle_video))
 
     # Add callback query handler
-    application.add_handler(CallbackQueryHandler(button_callback))
+    application.add_handler(CallbackQueryHandler(scheduled(MEDIA)(button_callback)))
 
     return application
 
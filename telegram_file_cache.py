@@ -0,0 +1,155 @@
+"""Caching around Telegram files.
+
+Telegram returns a ``file_id`` for every file it receives, and sending that
+id again costs no upload. This module remembers the id per content hash,
+persists the mapping to a JSON file so it survives restarts, and drops an
+entry when Telegram rejects the id as stale.
+
+It also caches ``get_file`` results for incoming media, whose download
+links stay valid for about an hour.
+"""
+import io
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Union
+
+from telegram import InputFile, Message
+from telegram.error import BadRequest
+
+from constants import MEDIA_FOLDER
+from response_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# File id cache settings (overridable from .env)
+FILE_ID_CACHE_PATH = os.getenv('FILE_ID_CACHE_PATH', os.path.join(MEDIA_FOLDER, 'file_id_cache.json'))
+FILE_ID_CACHE_SIZE = int(os.getenv('FILE_ID_CACHE_SIZE', '10000'))
+
+# get_file links are valid for at least an hour; stop reusing them a bit early
+GET_FILE_TTL = 3300  # seconds
+
+PHOTO = "photo"
+DOCUMENT = "document"
+
+
+def content_hash(kind: str, data: bytes) -> str:
+    """Key for a piece of media; photos and documents get different file_ids."""
+    return hashlib.sha256(kind.encode('utf-8') + b"\x00" + data).hexdigest()
+
+
+def _sent_file_id(message: Message, kind: str) -> Optional[str]:
+    """Pull the file_id Telegram assigned out of the sent message."""
+    if kind == PHOTO and message.photo:
+        return message.photo[-1].file_id
+    if kind == DOCUMENT and message.document:
+        return message.document.file_id
+    return None
+
+
+class TelegramFileCache:
+    """Persistent LRU map of content hash -> Telegram file_id."""
+
+    def __init__(self, path: str = FILE_ID_CACHE_PATH, max_entries: int = FILE_ID_CACHE_SIZE):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._entries.update(json.load(f))
+            logger.info(f"Loaded {len(self._entries)} cached Telegram file ids")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable file id cache {self.path}: {str(e)}")
+
+    def _write(self, snapshot: dict):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{id(snapshot)}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, self.path)
+
+    async def save(self):
+        """Persist the mapping without blocking the event loop."""
+        try:
+            await asyncio.to_thread(self._write, dict(self._entries))
+        except Exception as e:
+            logger.warning(f"Failed to save file id cache: {str(e)}")
+
+    def get(self, digest: str) -> Optional[str]:
+        file_id = self._entries.get(digest)
+        if file_id is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(digest)
+        self.hits += 1
+        return file_id
+
+    def set(self, digest: str, file_id: str):
+        self._entries[digest] = file_id
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, digest: str):
+        self._entries.pop(digest, None)
+
+    async def send(self, kind: str, data: bytes, filename: str,
+                   send: Callable[[Union[str, InputFile]], Awaitable[Message]]) -> Message:
+        """
+        Send media by cached file_id if possible, otherwise upload it and remember the id.
+
+        Args:
+            kind (str): PHOTO or DOCUMENT
+            data (bytes): The media content
+            filename (str): Name to upload the file under
+            send (callable): Sends the media, e.g. ``lambda media: message.reply_photo(photo=media)``
+
+        Returns:
+            Message: The sent message
+        """
+        digest = content_hash(kind, data)
+        file_id = self.get(digest)
+        if file_id:
+            try:
+                return await send(file_id)
+            except BadRequest as e:
+                # Stale or foreign id (e.g. the bot token changed); upload again
+                logger.info(f"Telegram rejected cached file id: {str(e)}")
+                self.invalidate(digest)
+
+        message = await send(InputFile(io.BytesIO(data), filename=filename))
+        file_id = _sent_file_id(message, kind)
+        if file_id:
+            self.set(digest, file_id)
+        await self.save()
+        return message
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the current size."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+# Shared cache for everything the bot uploads
+telegram_file_cache = TelegramFileCache()
+
+# file_id -> telegram.File for incoming media
+_file_objects = TTLCache(max_entries=1024, ttl=GET_FILE_TTL)
+
+
+async def get_file(bot, file_id: str):
+    """``bot.get_file`` with results reused while their download link is valid."""
+    telegram_file = _file_objects.get(file_id)
+    if telegram_file is None:
+        telegram_file = await bot.get_file(file_id)
+        _file_objects.set(file_id, telegram_file)
+    return telegram_file
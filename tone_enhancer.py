@@ -1,9 +1,10 @@
-from groq import AsyncGroq
 import os
 import asyncio
-from typing import Optional
+from typing import Optional, Callable, Awaitable
 import logging
 from dotenv import load_dotenv
+import llm_gateway
+from model_router import model_router, TEXT_EDIT
 
 # Configure logging
 logging.basicConfig(
@@ -24,13 +25,15 @@ class ToneEnhancer:
         
         self.last_enhanced_text = None
 
-    async def enhance_text(self, text: str, prompt: str = DEFAULT_PROMPT) -> tuple[bool, str, str]:
+    async def enhance_text(self, text: str, prompt: str = DEFAULT_PROMPT,
+                           on_delta: Optional[Callable[[str], Awaitable[None]]] = None) -> tuple[bool, str, str]:
         """
         Enhance the given text using Groq's LLM.
         
         Args:
             text (str): The text to enhance
             prompt (str, optional): Custom prompt for text enhancement
+            on_delta (callable, optional): Awaited with each streamed chunk as it arrives
             
         Returns:
             tuple[bool, str, str]: (success, enhanced_text, error_message)
@@ -44,12 +47,10 @@ class ToneEnhancer:
 
             logger.info(f"Enhancing text: {text[:100]}...")
             
-            # Create Groq client for this request
-            groq_client = AsyncGroq(api_key=self.groq_api_key)
-            
-            # Create the streaming response
-            response = await groq_client.chat.completions.create(
-                model="llama3-8b-8192",
+            # Create the streaming response through the shared gateway on the best editing model
+            response = model_router.stream(TEXT_EDIT, lambda model: llm_gateway.stream_chat_completion(
+                model=model,
+                api_key=self.groq_api_key,
                 messages=[
                     {
                         "role": "system",
@@ -60,16 +61,16 @@ class ToneEnhancer:
                         "content": f"Prompt: {prompt}\nText: {text}"
                     }
                 ],
-                stream=True,
                 max_tokens=1024,
                 temperature=0.7
-            )
+            ))
 
             # Process the streaming response
             result = ""
-            async for chunk in response:
-                if chunk.choices[0].delta.content is not None:
-                    result += chunk.choices[0].delta.content
+            async for delta in response:
+                result += delta
+                if on_delta:
+                    await on_delta(delta)
 
             self.last_enhanced_text = result
             logger.info(f"Enhanced text: {result[:100]}...")
@@ -1,5 +1,6 @@
 import os
 import time
+import asyncio
 import logging
 import subprocess
 from pathlib import Path
@@ -11,7 +12,20 @@ import yt_dlp
 from youtube_transcript_api import YouTubeTranscriptApi
 from pytube import YouTube
 import re
+import tempfile
 import browser_cookie3
+from singleflight import upstream_flight
+import deadline
+import llm_gateway
+from response_cache import TTLCache
+from keyframes import extract_keyframes, extract_audio, KEYFRAME_COUNT
+from video_segments import split_video
+from video_transcode import prepare_for_upload
+from video_jobs import run_in_thread, run_in_process, no_progress, PREPROCESS, ANALYZE
+from rate_limiter import rate_limiter, RateLimitExceeded
+from circuit_breaker import circuit_breakers, CircuitOpenError
+from model_router import model_router, VIDEO, TEXT_SUMMARY
+from scheduler import JOB_CLASS_DEADLINES, HEAVY
 
 # Load environment variables
 load_dotenv()
@@ -75,40 +89,347 @@ def initialize():
         raise ValueError("GEMINI_API_KEY not found in environment variables")
     genai.configure(api_key=api_key)
 
-def get_insights(video_path):
+VIDEO_INSIGHTS_PROMPT = "Analyze this video and describe what's happening, including key events, objects, and people. Be concise but detailed."
+
+# Gemini deletes uploaded files after 48 hours; stop reusing handles before that
+GEMINI_FILE_TTL = 47 * 3600
+FILE_POLL_INTERVAL = 2  # seconds between processing-state checks
+
+# Uploaded Gemini files by video key (e.g. Telegram file_unique_id), for follow-up questions
+_uploaded_videos = TTLCache(max_entries=256, ttl=GEMINI_FILE_TTL)
+
+def upload_video(video_path, mime_type='video/mp4'):
+    """
+    Upload a video to the Gemini File API and wait until it can be used.
+
+    The SDK streams the file from disk in chunks, so the video is never
+    held in memory as a whole.
+
+    Returns:
+        The uploaded ``genai`` File handle
+    """
+    video_file = genai.upload_file(path=str(video_path), mime_type=mime_type)
+    while video_file.state.name == "PROCESSING":
+        time.sleep(FILE_POLL_INTERVAL)
+        video_file = genai.get_file(video_file.name)
+    if video_file.state.name != "ACTIVE":
+        raise ValueError(f"Gemini could not process the video (state: {video_file.state.name})")
+    logger.info(f"Uploaded video to Gemini as {video_file.name}")
+    return video_file
+
+def generate_insights(video_file, model_name='gemini-1.5-flash', prompt=None):
+    """Ask Gemini about an uploaded video file."""
+    # Initialize Gemini model (1.5 Flash unless the router picked another)
+    model = genai.GenerativeModel(model_name)
+
+    # Generate content with specific config
+    return model.generate_content(
+        contents=[prompt or VIDEO_INSIGHTS_PROMPT, video_file],
+        generation_config={
+            "temperature": 0.4,
+            "max_output_tokens": 2048
+        }
+    )
+
+def get_insights(video_path, model_name='gemini-1.5-flash', prompt=None):
     """Get insights from a video using Gemini Vision."""
     try:
-        # Initialize Gemini model with the newer 1.5 Flash version
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
-        # Read video file
-        with open(video_path, 'rb') as f:
-            video_data = f.read()
-            
-        # Create video part
-        video_part = {
-            'mime_type': 'video/mp4',
-            'data': video_data
-        }
-        
-        # Generate content with specific config
-        response = model.generate_content(
-            contents=[
-                "Analyze this video and describe what's happening, including key events, objects, and people. Be concise but detailed.",
-                video_part
-            ],
-            generation_config={
-                "temperature": 0.4,
-                "max_output_tokens": 2048
-            }
-        )
-        
-        return response.text
-        
+        return generate_insights(upload_video(video_path), model_name, prompt).text
     except Exception as e:
         print(f"Error in get_insights: {str(e)}")
         raise
 
+# Rough Gemini token cost of one short video, for rate-limit reservations
+VIDEO_TOKEN_ESTIMATE = 20000
+
+def _usage_tokens(response):
+    """Total tokens billed for a Gemini response, if reported."""
+    usage = getattr(response, 'usage_metadata', None)
+    return getattr(usage, 'total_token_count', None)
+
+async def _upload(video_path):
+    """Shrink a video to the analysis profile if needed, then upload it."""
+    upload_path = await prepare_for_upload(video_path)
+    try:
+        return await run_in_thread(upload_video, upload_path)
+    finally:
+        if upload_path != video_path and os.path.exists(upload_path):
+            os.remove(upload_path)
+
+def has_uploaded_video(video_key):
+    """Check whether a video is already uploaded, so follow-up questions need no download."""
+    return _uploaded_videos.get(video_key) is not None
+
+async def get_video_file(video_path=None, video_key=None):
+    """
+    Get the Gemini File handle for a video, uploading it at most once per key.
+
+    Args:
+        video_path (str, optional): Local copy of the video; not needed if the key was uploaded before
+        video_key (str, optional): Stable video identity, e.g. Telegram file_unique_id
+
+    Returns:
+        The uploaded ``genai`` File handle
+    """
+    if video_key is not None:
+        video_file = _uploaded_videos.get(video_key)
+        if video_file is not None:
+            return video_file
+    if video_path is None:
+        raise ValueError("The video is no longer available. Please send it again.")
+
+    if video_key is None:
+        return await _upload(video_path)
+    video_file = await upstream_flight.do(("gemini_upload", video_key), _upload, video_path)
+    _uploaded_videos.set(video_key, video_file)
+    return video_file
+
+async def get_insights_async(video_path, max_wait=None, video_key=None, prompt=None, progress=no_progress,
+                             with_model=False):
+    """
+    Analyze a video on the best healthy video model, once rate-limit capacity is available.
+
+    The video is uploaded through the Gemini File API and referred to by handle,
+    so questions about the same ``video_key`` reuse the upload. ``progress`` is
+    awaited with the stage (PREPROCESS for the upload, then ANALYZE). With
+    ``with_model`` the result is a (text, model name) pair.
+    """
+    if not has_uploaded_video(video_key):
+        await progress(PREPROCESS)
+    video_file = await get_video_file(video_path, video_key)
+    await progress(ANALYZE)
+
+    text, model_name = await _analyze_video_file(video_file, prompt, max_wait)
+    return (text, model_name) if with_model else text
+
+async def _analyze_video_file(video_file, prompt=None, max_wait=None):
+    """Ask the best healthy video model about an uploaded file; returns (text, model name)."""
+    async def analyze(model_name):
+        breaker = circuit_breakers.get("gemini", model_name)
+        breaker.check()
+        await rate_limiter.acquire(
+            "gemini", model_name, GEMINI_API_KEY, VIDEO_TOKEN_ESTIMATE, max_wait=max_wait
+        )
+        with breaker.guard():
+            response = await run_in_thread(generate_insights, video_file, model_name, prompt)
+        return response.text, model_name
+
+    return await model_router.call(VIDEO, analyze)
+
+def _delete_video_file(video_file):
+    """Remove an uploaded file from Gemini; it would expire on its own anyway."""
+    try:
+        genai.delete_file(video_file.name)
+    except Exception as e:
+        logger.warning(f"Failed to delete Gemini file {video_file.name}: {str(e)}")
+
+# Cleanups left running after their caller moved on; the loop only keeps weak references to tasks
+_cleanup_tasks = set()
+
+def _in_background(coro):
+    """Run a cleanup coroutine without waiting for it, keeping the task alive until it's done."""
+    task = asyncio.ensure_future(coro)
+    _cleanup_tasks.add(task)
+    task.add_done_callback(_cleanup_tasks.discard)
+    return task
+
+async def _discard_upload(upload):
+    """Wait for an abandoned upload to finish, then delete the file it made."""
+    try:
+        video_file = await upload
+    except Exception:
+        return
+    await run_in_thread(_delete_video_file, video_file)
+
+# Analysis modes: upload the whole video, or only scene-change keyframes (plus a transcript)
+FULL_MODE = "full"
+KEYFRAMES_MODE = "keyframes"
+SEGMENTS_MODE = "segments"
+VIDEO_ANALYSIS_MODE = os.getenv('VIDEO_ANALYSIS_MODE', FULL_MODE)
+KEYFRAME_TRANSCRIPT = os.getenv('KEYFRAME_TRANSCRIPT', 'true').lower() in ('1', 'true', 'yes')
+
+# Gemini bills each image at a fixed token cost
+FRAME_TOKEN_ESTIMATE = 258
+
+KEYFRAMES_PROMPT = """
+These are {count} keyframes taken at the scene changes of a {duration} video, in order, each labelled with its timestamp.
+Analyze the video they come from and describe what's happening, including key events, objects, and people. Be concise but detailed.
+"""
+
+def _timestamp(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}:{seconds:02d}"
+
+async def _transcribe_soundtrack(video_path):
+    """Transcribe a video's soundtrack with Whisper, or return None if that isn't possible."""
+    audio = await run_in_thread(extract_audio, video_path)
+    if not audio:
+        return None
+    try:
+        return await llm_gateway.translate_audio(("audio.mp3", audio))
+    except (RateLimitExceeded, CircuitOpenError) as e:
+        # The frames alone still give a useful answer
+        logger.warning(f"Skipping transcript: {str(e)}")
+        return None
+
+async def get_keyframe_insights_async(video_path, prompt=None, count=KEYFRAME_COUNT, max_wait=None,
+                                      progress=no_progress, with_model=False):
+    """
+    Analyze a video from its scene-change keyframes and soundtrack instead of the full file.
+
+    Args:
+        video_path (str): Path of the downloaded video
+        prompt (str, optional): Question about the video; defaults to a general analysis
+        count (int): Number of keyframes to send
+        max_wait (float, optional): Cap on the wait for rate-limit capacity
+        progress (callable, optional): Awaited with the stage (PREPROCESS, then ANALYZE)
+        with_model (bool): Also return the name of the model that answered
+
+    Returns:
+        str: The model's analysis, or a (text, model name) pair with ``with_model``
+    """
+    await progress(PREPROCESS)
+    # Decoding and histogramming are CPU-bound, so they get a process of their own
+    keyframes, info = await run_in_process(extract_keyframes, video_path, count)
+    transcript = await _transcribe_soundtrack(video_path) if KEYFRAME_TRANSCRIPT and info.has_audio else None
+    await progress(ANALYZE)
+
+    contents = [KEYFRAMES_PROMPT.format(count=len(keyframes), duration=_timestamp(info.duration))]
+    if prompt:
+        contents.append(f"Answer this question about the video: {prompt}")
+    if transcript:
+        contents.append(f"Transcript of the soundtrack:\n{transcript}")
+    for keyframe in keyframes:
+        contents.append(f"Frame at {_timestamp(keyframe.timestamp)}:")
+        contents.append({'mime_type': 'image/jpeg', 'data': keyframe.jpeg})
+
+    async def analyze(model_name):
+        breaker = circuit_breakers.get("gemini", model_name)
+        breaker.check()
+        await rate_limiter.acquire(
+            "gemini", model_name, GEMINI_API_KEY,
+            FRAME_TOKEN_ESTIMATE * len(keyframes) + len(transcript or '') // 4 + 2048, max_wait=max_wait
+        )
+        model = genai.GenerativeModel(model_name)
+        with breaker.guard():
+            response = await run_in_thread(
+                model.generate_content,
+                contents,
+                generation_config={"temperature": 0.4, "max_output_tokens": 2048}
+            )
+        return response.text, model_name
+
+    text, model_name = await model_router.call(VIDEO, analyze)
+    return (text, model_name) if with_model else text
+
+# Segmented (map-reduce) analysis of long videos
+SEGMENT_CONCURRENCY = int(os.getenv('VIDEO_SEGMENT_CONCURRENCY', '4'))
+
+SEGMENT_PROMPT = """
+This clip is part {index} of {count} of a longer video and covers {start} to {end} of it.
+Describe what happens in it, including key events, objects, and people, with timestamps relative to the full video. Be concise but detailed.
+"""
+
+REDUCE_PROMPT = """
+Below are analyses of the consecutive parts of one {duration} video, in order.
+Merge them into a single analysis of the whole video: what happens, the key events, objects and people, and how it develops.
+Describe the video as a whole rather than part by part.
+"""
+
+async def _generate_text(prompt, request_class=TEXT_SUMMARY):
+    """Run a text-only Gemini call on the best healthy model; returns (text, model name)."""
+    async def generate(model_name):
+        model = genai.GenerativeModel(model_name)
+        breaker = circuit_breakers.get("gemini", model_name)
+        breaker.check()
+        reservation = await rate_limiter.acquire(
+            "gemini", model_name, GEMINI_API_KEY, len(prompt) // 4 + 2048
+        )
+        with breaker.guard():
+            response = await run_in_thread(model.generate_content, prompt)
+        rate_limiter.settle(reservation, _usage_tokens(response))
+        return response.text.strip(), model_name
+
+    return await model_router.call(request_class, generate)
+
+async def _upload_segment(segment_path):
+    """
+    Upload one segment; if cancelled, let a running upload finish and delete the file it made.
+
+    Upload threads can't be interrupted, so giving up on them straight away would leave
+    them reading a segment that is about to be removed and orphan their Gemini file.
+    """
+    upload = asyncio.ensure_future(get_video_file(segment_path))
+    try:
+        return await asyncio.shield(upload)
+    except asyncio.CancelledError:
+        # Shielded, so a second cancellation doesn't orphan the upload either
+        await asyncio.shield(_in_background(_discard_upload(upload)))
+        raise
+
+async def get_segmented_insights_async(video_path, prompt=None, max_wait=None, progress=no_progress,
+                                       with_model=False):
+    """
+    Analyze a long video map-reduce style: windows in parallel, then one merge call.
+
+    Args:
+        video_path (str): Path of the downloaded video
+        prompt (str, optional): Question about the video; defaults to a general analysis
+        max_wait (float, optional): Cap on the wait for rate-limit capacity
+        progress (callable, optional): Awaited with the stage (PREPROCESS, then ANALYZE)
+        with_model (bool): Also return the name of the model that wrote the merged analysis
+
+    Returns:
+        str: The merged analysis, or a (text, model name) pair with ``with_model``
+    """
+    await progress(PREPROCESS)
+    with tempfile.TemporaryDirectory(dir=MEDIA_FOLDER) as segment_dir:
+        segments = await run_in_thread(split_video, video_path, segment_dir)
+        if len(segments) <= 1:
+            # Too short to be worth splitting
+            return await get_insights_async(
+                video_path, max_wait, prompt=prompt, progress=progress, with_model=with_model
+            )
+        await progress(ANALYZE)
+
+        # The rate limiter paces the calls; the semaphore bounds uploads and worker threads
+        semaphore = asyncio.Semaphore(SEGMENT_CONCURRENCY)
+
+        async def analyze_segment(index, segment):
+            segment_prompt = SEGMENT_PROMPT.format(
+                index=index, count=len(segments), start=_timestamp(segment.start), end=_timestamp(segment.end)
+            )
+            if prompt:
+                segment_prompt += f"\nNote anything relevant to this question: {prompt}"
+            async with semaphore:
+                video_file = await _upload_segment(segment.path)
+                try:
+                    text, _ = await _analyze_video_file(video_file, segment_prompt, max_wait)
+                finally:
+                    _in_background(run_in_thread(_delete_video_file, video_file))
+            return text
+
+        tasks = [asyncio.ensure_future(analyze_segment(i, s)) for i, s in enumerate(segments, start=1)]
+        try:
+            parts = await asyncio.gather(*tasks)
+        except BaseException:
+            # One failed window fails the job; don't keep paying for the others. Wait for them
+            # to wind down so no upload is still reading a segment when the directory goes.
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    reduce_prompt = REDUCE_PROMPT.format(duration=_timestamp(segments[-1].end))
+    if prompt:
+        reduce_prompt += f"\nFocus on answering this question: {prompt}\n"
+    reduce_prompt += "\n\n".join(
+        f"Part {i} ({_timestamp(s.start)} - {_timestamp(s.end)}):\n{text}"
+        for i, (s, text) in enumerate(zip(segments, parts), start=1)
+    )
+    text, model_name = await _generate_text(reduce_prompt)
+    return (text, model_name) if with_model else text
+
 def save_video_file(file_data, filename):
     file_path = MEDIA_FOLDER / filename
     with open(file_path, 'wb') as f:
@@ -137,7 +458,8 @@ def check_audio_dependencies():
         if shutil.which('ffmpeg'):
             result = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True)
             deps['ffmpeg'] = result.returncode == 0
-            logging.info(f"FFmpeg version: {result.stdout.split('\\n')[0] if result.returncode == 0 else 'Not found'}")
+            first_line = result.stdout.split('\n')[0] if result.returncode == 0 else 'Not found'
+            logging.info(f"FFmpeg version: {first_line}")
     except Exception as e:
         logging.error(f"FFmpeg check failed: {str(e)}")
     
@@ -146,7 +468,8 @@ def check_audio_dependencies():
         if shutil.which('sox'):
             result = subprocess.run(['sox', '--version'], capture_output=True, text=True)
             deps['sox'] = result.returncode == 0
-            logging.info(f"SoX version: {result.stdout.split('\\n')[0] if result.returncode == 0 else 'Not found'}")
+            first_line = result.stdout.split('\n')[0] if result.returncode == 0 else 'Not found'
+            logging.info(f"SoX version: {first_line}")
     except Exception as e:
         logging.error(f"SoX check failed: {str(e)}")
     
@@ -485,11 +808,15 @@ def extract_transcript_details(youtube_video_url):
 
 def generate_gemini_content(transcript_text, prompt):
     """Generate content using Gemini Pro model."""
+    model_name = model_router.route(TEXT_SUMMARY)[0]
+    started = time.monotonic()
     try:
-        model = genai.GenerativeModel("gemini-pro")
+        model = genai.GenerativeModel(model_name)
         response = model.generate_content(prompt + transcript_text)
+        model_router.record(model_name, time.monotonic() - started, ok=True)
         return response.text
     except Exception as e:
+        model_router.record(model_name, time.monotonic() - started, ok=False)
         logging.error(f"Error generating content: {str(e)}")
         raise
 
@@ -537,6 +864,100 @@ def process_youtube_video(video_id):
         logging.error(f"Error in process_youtube_video: {str(e)}")
         return None
 
+def _download_youtube_audio_info(url, video_id):
+    """Download the audio track of a YouTube video and return its info dict."""
+    # Configure yt-dlp with advanced options
+    ydl_opts = {
+        'format': 'bestaudio/best',
+        'outtmpl': str(MEDIA_FOLDER / f'{video_id}.%(ext)s'),
+        'postprocessors': [{
+            'key': 'FFmpegExtractAudio',
+            'preferredcodec': 'mp3',
+            'preferredquality': '192',
+        }],
+        # Advanced options to bypass restrictions
+        'quiet': True,
+        'no_warnings': True,
+        'extractor_args': {
+            'youtube': {
+                'player_client': ['android'],  # Use android client
+                'player_skip': ['webpage', 'configs'],  # Skip unnecessary data
+            }
+        },
+        # Use various clients to avoid bot detection
+        'external_downloader_args': ['--add-header', 'User-Agent:Mozilla/5.0 (Android 12; Mobile; rv:68.0) Gecko/68.0 Firefox/96.0'],
+        'http_headers': {
+            'User-Agent': 'Mozilla/5.0 (Android 12; Mobile; rv:68.0) Gecko/68.0 Firefox/96.0',
+            'Accept-Language': 'en-US,en;q=0.5',
+        },
+    }
+
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        try:
+            return ydl.extract_info(url, download=True)
+        except Exception as first_error:
+            logger.warning(f"First attempt failed: {str(first_error)}")
+            # Try alternate format on failure
+            ydl_opts.update({
+                'format': 'worstaudio/worst',  # Try worst quality as fallback
+                'extractor_args': {
+                    'youtube': {
+                        'player_client': ['ios'],  # Try iOS client
+                    }
+                }
+            })
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl2:
+                return ydl2.extract_info(url, download=True)
+
+async def summarize_youtube_video(url, video_id, on_downloaded=None):
+    """
+    Download a YouTube video's audio and summarize it with Gemini.
+
+    Concurrent requests for the same video_id share one run via single-flight.
+
+    Args:
+        url (str): The YouTube URL
+        video_id (str): The canonical video ID
+        on_downloaded (callable, optional): Awaited with (title, duration) once downloaded
+
+    Returns:
+        tuple: (title, duration, summary)
+    """
+    try:
+        info = await deadline.to_thread(_download_youtube_audio_info, url, video_id)
+        title = info.get('title', 'Video')
+        duration = info.get('duration', 0)
+
+        if on_downloaded:
+            await on_downloaded(title, duration)
+
+        prompt = f"Title: {title}\nDuration: {duration//60}:{duration%60:02d}\n\n{SUMMARY_PROMPT}"
+
+        async def summarize(model_name):
+            model = genai.GenerativeModel(model_name)
+            breaker = circuit_breakers.get("gemini", model_name)
+            breaker.check()
+            reservation = await rate_limiter.acquire(
+                "gemini", model_name, GEMINI_API_KEY, len(prompt) // 4 + 1024
+            )
+            with breaker.guard():
+                response = await deadline.to_thread(model.generate_content, prompt)
+            rate_limiter.settle(reservation, _usage_tokens(response))
+            return response.text.strip()
+
+        # Generate summary on the best healthy summary model
+        summary = await model_router.call(TEXT_SUMMARY, summarize)
+
+        return title, duration, summary
+
+    finally:
+        # Cleanup
+        try:
+            for file in MEDIA_FOLDER.glob(f"{video_id}.*"):
+                file.unlink()
+        except Exception as e:
+            logger.error(f"Error cleaning up files: {str(e)}")
+
 async def handle_youtube_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle the youtube_summary command."""
     try:
@@ -561,68 +982,19 @@ async def handle_youtube_command(update: Update, context: ContextTypes.DEFAULT_T
             "Processing your YouTube video... This may take a few minutes."
         )
 
+        async def on_downloaded(title, duration):
+            await processing_msg.edit_text(
+                f"Downloaded: {title}\n"
+                f"Duration: {duration//60}:{duration%60:02d}\n"
+                "Generating summary..."
+            )
+
         try:
-            # Configure yt-dlp with advanced options
-            ydl_opts = {
-                'format': 'bestaudio/best',
-                'outtmpl': str(MEDIA_FOLDER / f'{video_id}.%(ext)s'),
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '192',
-                }],
-                # Advanced options to bypass restrictions
-                'quiet': True,
-                'no_warnings': True,
-                'extractor_args': {
-                    'youtube': {
-                        'player_client': ['android'],  # Use android client
-                        'player_skip': ['webpage', 'configs'],  # Skip unnecessary data
-                    }
-                },
-                # Use various clients to avoid bot detection
-                'external_downloader_args': ['--add-header', 'User-Agent:Mozilla/5.0 (Android 12; Mobile; rv:68.0) Gecko/68.0 Firefox/96.0'],
-                'http_headers': {
-                    'User-Agent': 'Mozilla/5.0 (Android 12; Mobile; rv:68.0) Gecko/68.0 Firefox/96.0',
-                    'Accept-Language': 'en-US,en;q=0.5',
-                },
-            }
-            
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                try:
-                    info = ydl.extract_info(url, download=True)
-                except Exception as first_error:
-                    logger.warning(f"First attempt failed: {str(first_error)}")
-                    # Try alternate format on failure
-                    ydl_opts.update({
-                        'format': 'worstaudio/worst',  # Try worst quality as fallback
-                        'extractor_args': {
-                            'youtube': {
-                                'player_client': ['ios'],  # Try iOS client
-                            }
-                        }
-                    })
-                    with yt_dlp.YoutubeDL(ydl_opts) as ydl2:
-                        info = ydl2.extract_info(url, download=True)
-                
-                title = info.get('title', 'Video')
-                duration = info.get('duration', 0)
-                
-                await processing_msg.edit_text(
-                    f"Downloaded: {title}\n"
-                    f"Duration: {duration//60}:{duration%60:02d}\n"
-                    "Generating summary..."
+            # Users sharing the same video wait on a single download and summary
+            with deadline.deadline_scope(JOB_CLASS_DEADLINES[HEAVY]):
+                title, duration, summary = await upstream_flight.do(
+                    ("youtube", video_id), summarize_youtube_video, url, video_id, on_downloaded
                 )
-
-            # Initialize Gemini
-            model = genai.GenerativeModel('gemini-pro')
-            
-            # Generate summary
-            response = model.generate_content(
-                f"Title: {title}\nDuration: {duration//60}:{duration%60:02d}\n\n{SUMMARY_PROMPT}"
-            )
-            
-            summary = response.text.strip()
             
             # Send summary
             await processing_msg.edit_text(
@@ -637,14 +1009,6 @@ async def handle_youtube_command(update: Update, context: ContextTypes.DEFAULT_T
                 "Please try again or contact support if the issue persists."
             )
 
-        finally:
-            # Cleanup
-            try:
-                for file in MEDIA_FOLDER.glob(f"{video_id}.*"):
-                    file.unlink()
-            except Exception as e:
-                logger.error(f"Error cleaning up files: {str(e)}")
-
     except Exception as e:
         logger.error(f"Error in handle_youtube_command: {str(e)}")
         await update.message.reply_text(
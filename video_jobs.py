@@ -0,0 +1,205 @@
+"""Background executor for video analysis jobs.
+
+Analyzing a video takes minutes, so handlers don't wait for it: they submit
+a job and return. A fixed number of workers take jobs from a bounded queue
+and run them in stages (download, preprocess, analyze). Each stage edits
+the job's status message so the user can follow along. Blocking work goes
+to dedicated pools, leaving the default executor and the event loop for
+everyone else:
+
+* a small thread pool for blocking I/O such as uploads, and
+* a process pool for CPU-heavy preprocessing such as frame decoding.
+"""
+import os
+import asyncio
+import logging
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Awaitable, Callable, Optional
+
+from telegram.error import BadRequest
+
+import deadline
+from deadline import deadline_scope, DeadlineExceeded
+from scheduler import JOB_CLASS_DEADLINES, HEAVY, QueueFullError
+
+logger = logging.getLogger(__name__)
+
+# Stages
+QUEUED = "queued"
+DOWNLOAD = "download"
+PREPROCESS = "preprocess"
+ANALYZE = "analyze"
+DELIVER = "deliver"
+
+STAGE_MESSAGES = {
+    DOWNLOAD: "⏬ Downloading the video...",
+    PREPROCESS: "🎞️ Preparing the video...",
+    ANALYZE: "🧠 Analyzing the video...",
+}
+
+# Executor settings (overridable from .env)
+VIDEO_JOB_CONCURRENCY = int(os.getenv('VIDEO_JOB_CONCURRENCY', '2'))
+VIDEO_JOB_QUEUE = int(os.getenv('VIDEO_JOB_QUEUE', '20'))
+VIDEO_JOB_THREADS = int(os.getenv('VIDEO_JOB_THREADS', '8'))
+VIDEO_JOB_PROCESSES = int(os.getenv('VIDEO_JOB_PROCESSES', '2'))
+MAX_VIDEO_JOBS_PER_USER = 2  # queued or running
+
+Progress = Callable[[str], Awaitable[None]]
+
+_thread_pool = ThreadPoolExecutor(max_workers=VIDEO_JOB_THREADS, thread_name_prefix='video-job')
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+class TooManyVideoJobs(QueueFullError):
+    """Raised when the user already has MAX_VIDEO_JOBS_PER_USER videos queued or running."""
+
+
+async def no_progress(stage: str):
+    """Progress callback for callers that don't report progress."""
+
+
+async def run_in_thread(fn: Callable, *args, **kwargs):
+    """Run blocking I/O for a video job on the job thread pool, bounded by the deadline."""
+    loop = asyncio.get_running_loop()
+    return await deadline.bounded(loop.run_in_executor(_thread_pool, partial(fn, *args, **kwargs)))
+
+
+async def run_in_process(fn: Callable, *args):
+    """Run CPU-heavy work for a video job in the process pool, bounded by the deadline."""
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=VIDEO_JOB_PROCESSES)
+    loop = asyncio.get_running_loop()
+    return await deadline.bounded(loop.run_in_executor(_process_pool, partial(fn, *args)))
+
+
+class VideoJob:
+    """One queued analysis, reporting to a status message."""
+
+    def __init__(self, user_id: int, run: Callable[[Progress], Awaitable[str]], status_message,
+                 on_result: Callable[[str], Awaitable]):
+        """
+        Args:
+            user_id (int): Telegram user the job belongs to
+            run (callable): Does the work given a progress callback and returns the text to send
+            status_message: Telegram message edited with the job's progress
+            on_result (callable): Delivers the result text
+        """
+        self.user_id = user_id
+        self.run = run
+        self.status_message = status_message
+        self.on_result = on_result
+        self.stage = QUEUED
+        self._last_text = None
+
+    async def report(self, text: str):
+        """Edit the status message, ignoring failures; progress is best effort."""
+        if text == self._last_text:
+            return
+        self._last_text = text
+        try:
+            await self.status_message.edit_text(text)
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                logger.warning(f"Failed to update video job status: {str(e)}")
+        except Exception as e:
+            logger.warning(f"Failed to update video job status: {str(e)}")
+
+    async def progress(self, stage: str):
+        self.stage = stage
+        await self.report(STAGE_MESSAGES.get(stage, stage))
+
+
+class VideoJobExecutor:
+    """Bounded queue of video jobs served by a fixed number of workers."""
+
+    def __init__(self, concurrency: int = VIDEO_JOB_CONCURRENCY, max_queue: int = VIDEO_JOB_QUEUE,
+                 per_user: int = MAX_VIDEO_JOBS_PER_USER):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.per_user = per_user
+        self.running = 0
+        self._waiting: deque = deque()
+        self._user_jobs = defaultdict(int)
+        self._wakeup: Optional[asyncio.Condition] = None
+        self._workers: list = []
+
+    def _start_workers(self):
+        self._wakeup = asyncio.Condition()
+        # Workers must not inherit the deadline of the update that happened to start them
+        with deadline_scope(None):
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    def submit(self, job: VideoJob) -> int:
+        """
+        Queue a job.
+
+        Returns:
+            int: The job's position in the queue (0 if it starts right away)
+
+        Raises:
+            TooManyVideoJobs: If the user already has ``per_user`` jobs queued or running
+            QueueFullError: If the queue is full
+        """
+        if self._user_jobs[job.user_id] >= self.per_user:
+            raise TooManyVideoJobs(f"Too many video jobs for user {job.user_id}")
+        if len(self._waiting) >= self.max_queue:
+            raise QueueFullError("The video queue is full")
+        if not self._workers:
+            self._start_workers()
+
+        self._user_jobs[job.user_id] += 1
+        self._waiting.append(job)
+        asyncio.create_task(self._notify())
+        return max(0, len(self._waiting) - (self.concurrency - self.running))
+
+    async def _notify(self):
+        async with self._wakeup:
+            self._wakeup.notify()
+
+    async def _worker(self):
+        while True:
+            async with self._wakeup:
+                await self._wakeup.wait_for(lambda: self._waiting)
+                job = self._waiting.popleft()
+            self.running += 1
+            try:
+                # Everyone still waiting moved up one place
+                for position, waiting in enumerate(list(self._waiting), start=1):
+                    await waiting.report(f"⏳ Your video is #{position} in the queue.")
+                await self._run(job)
+            except Exception as e:
+                logger.error(f"Video job crashed: {str(e)}")
+            finally:
+                self.running -= 1
+                self._user_jobs[job.user_id] -= 1
+                if self._user_jobs[job.user_id] <= 0:
+                    del self._user_jobs[job.user_id]
+
+    async def _run(self, job: VideoJob):
+        with deadline_scope(JOB_CLASS_DEADLINES[HEAVY]):
+            try:
+                result = await job.run(job.progress)
+                job.stage = DELIVER
+                await job.on_result(result)
+            except DeadlineExceeded as e:
+                await job.report(str(e))
+                return
+            except Exception as e:
+                logger.error(f"Video job failed at {job.stage}: {str(e)}")
+                if job.stage == DELIVER:
+                    await job.report(f"❌ The analysis is ready but could not be sent: {str(e)}")
+                else:
+                    await job.report(f"Error processing video: {str(e)}")
+                return
+        await job.report("✅ Video analysis complete.")
+
+    def stats(self) -> dict:
+        """Running and waiting job counts."""
+        return {"running": self.running, "waiting": len(self._waiting), "capacity": self.concurrency}
+
+
+# Shared executor for /analyze_video
+video_jobs = VideoJobExecutor()
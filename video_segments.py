@@ -0,0 +1,55 @@
+"""Splitting long videos into time windows for map-reduce analysis.
+
+ffmpeg's segment muxer cuts the video with stream copy, so splitting costs
+little more than copying the file. Cuts land on the nearest keyframe, so
+windows are only approximately ``segment_seconds`` long; the real start and
+end of every piece is read back from the segment list ffmpeg writes.
+"""
+import os
+import csv
+import logging
+import subprocess
+from typing import List, NamedTuple
+
+from keyframes import FFMPEG_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Segmentation settings (overridable from .env)
+SEGMENT_SECONDS = float(os.getenv('VIDEO_SEGMENT_SECONDS', '120'))
+
+
+class Segment(NamedTuple):
+    path: str
+    start: float  # seconds from the start of the video
+    end: float
+
+
+def split_video(video_path: str, out_dir: str, segment_seconds: float = SEGMENT_SECONDS) -> List[Segment]:
+    """
+    Cut a video into consecutive windows without re-encoding.
+
+    Args:
+        video_path (str): Path of the video file
+        out_dir (str): Existing directory to write the pieces to
+        segment_seconds (float): Target length of each window
+
+    Returns:
+        list[Segment]: The pieces in order
+    """
+    segment_list = os.path.join(out_dir, 'segments.csv')
+    subprocess.run(
+        ['ffmpeg', '-v', 'error', '-i', str(video_path),
+         '-map', '0:v:0', '-map', '0:a?', '-c', 'copy',
+         '-f', 'segment', '-segment_time', f'{segment_seconds:.3f}', '-reset_timestamps', '1',
+         '-segment_list', segment_list, '-segment_list_type', 'csv',
+         os.path.join(out_dir, 'segment%03d.mp4')],
+        capture_output=True, timeout=FFMPEG_TIMEOUT, check=True
+    )
+
+    segments = []
+    with open(segment_list, newline='') as f:
+        for name, start, end in csv.reader(f):
+            segments.append(Segment(os.path.join(out_dir, name), float(start), float(end)))
+    logger.info(f"Split {video_path} into {len(segments)} segments")
+    return segments
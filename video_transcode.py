@@ -0,0 +1,111 @@
+"""Shrinking videos before they are uploaded for analysis.
+
+Phone videos arrive at 1080p or 4K and 30-60 fps, but Gemini samples video
+at about one frame per second and doesn't need that resolution to follow
+what happens. Videos above the target profile are re-encoded with ffmpeg
+to a small resolution and frame rate with mono 16 kHz audio, which cuts
+the upload by one to two orders of magnitude. Encodes run as subprocesses,
+at most TRANSCODE_CONCURRENCY at a time, and are killed if the job is
+cancelled or runs out of time.
+"""
+import os
+import asyncio
+import logging
+from typing import Optional
+
+import deadline
+from keyframes import probe, VideoInfo, FFMPEG_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Transcoding profile (overridable from .env)
+TRANSCODE_ENABLED = os.getenv('TRANSCODE_VIDEOS', 'true').lower() in ('1', 'true', 'yes')
+TRANSCODE_HEIGHT = int(os.getenv('TRANSCODE_HEIGHT', '360'))  # shorter side of the output
+TRANSCODE_FPS = float(os.getenv('TRANSCODE_FPS', '1'))
+TRANSCODE_MIN_BYTES = int(float(os.getenv('TRANSCODE_MIN_MB', '2')) * 1024 * 1024)  # smaller files go as they are
+TRANSCODE_CONCURRENCY = int(os.getenv('TRANSCODE_CONCURRENCY', '2'))
+
+_slots: Optional[asyncio.Semaphore] = None
+
+
+def needs_transcode(info: VideoInfo, size: int) -> bool:
+    """Check whether a video is above the target profile enough to be worth re-encoding."""
+    if size < TRANSCODE_MIN_BYTES:
+        return False
+    return min(info.width, info.height) > TRANSCODE_HEIGHT or info.fps > TRANSCODE_FPS * 2
+
+
+def _scale_filter() -> str:
+    """
+    Scale the shorter side to at most TRANSCODE_HEIGHT, keeping the aspect ratio.
+
+    The size is worked out by ffmpeg after it has rotated the frames upright,
+    so portrait videos aren't squashed into landscape dimensions. ``-2``
+    keeps the other side even for x264.
+    """
+    limit = TRANSCODE_HEIGHT
+    return (f"scale=w='if(lt(iw,ih),trunc(min(iw,{limit})/2)*2,-2)'"
+            f":h='if(lt(iw,ih),-2,trunc(min(ih,{limit})/2)*2)'")
+
+
+async def transcode(video_path: str, output_path: str):
+    """Re-encode a video to the analysis profile, killing ffmpeg if the caller gives up."""
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(TRANSCODE_CONCURRENCY)
+
+    async with _slots:
+        process = await asyncio.create_subprocess_exec(
+            'ffmpeg', '-v', 'error', '-y', '-i', str(video_path),
+            '-vf', f'fps={TRANSCODE_FPS:g},{_scale_filter()}',
+            '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '28', '-pix_fmt', 'yuv420p',
+            '-c:a', 'aac', '-ac', '1', '-ar', '16000', '-b:a', '32k',
+            '-movflags', '+faststart', str(output_path),
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            _, stderr = await deadline.bounded(process.communicate(), FFMPEG_TIMEOUT)
+        except BaseException:
+            process.kill()
+            await process.wait()
+            raise
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {stderr.decode(errors='replace').strip()[-300:]}")
+
+
+async def prepare_for_upload(video_path: str) -> str:
+    """
+    Return the path to upload for a video: a transcoded copy if it is above the profile, else the original.
+
+    The caller removes the copy (any returned path other than ``video_path``) once it is uploaded.
+    Transcoding failures fall back to the original file.
+    """
+    if not TRANSCODE_ENABLED:
+        return video_path
+    try:
+        info = await asyncio.to_thread(probe, video_path)
+        size = os.path.getsize(video_path)
+        if not needs_transcode(info, size):
+            return video_path
+
+        output_path = os.path.splitext(str(video_path))[0] + '.analysis.mp4'
+        try:
+            await transcode(video_path, output_path)
+        except Exception:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            raise
+        logger.info(
+            f"Transcoded {info.width}x{info.height}@{info.fps:.0f}fps video: "
+            f"{size / 1024 / 1024:.1f} MB -> {os.path.getsize(output_path) / 1024 / 1024:.1f} MB"
+        )
+        return output_path
+    except deadline.DeadlineExceeded:
+        remaining = deadline.remaining()
+        if remaining is not None and remaining <= 0:
+            raise
+        logger.warning("Uploading the original video; transcoding took too long")
+        return video_path
+    except Exception as e:
+        logger.warning(f"Uploading the original video; transcoding failed: {str(e)}")
+        return video_path